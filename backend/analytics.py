@@ -0,0 +1,118 @@
+"""
+Read side of the order analytics, answered from ``order_daily_rollup``.
+
+The rollup holds at most one row per (day, customer, currency), so these
+queries touch a number of rows bounded by the date range rather than by the
+number of orders or line items.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, OrderDailyRollup
+
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_RANGE_DAYS = 30
+MAX_TOP_CUSTOMERS = 500
+
+
+def parse_date_range(args):
+    """Read ``date_from`` / ``date_to`` (inclusive ISO dates), defaulting to the last 30 days"""
+    try:
+        date_to = date.fromisoformat(args['date_to']) if args.get('date_to') else date.today()
+        date_from = (date.fromisoformat(args['date_from']) if args.get('date_from')
+                     else date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    except ValueError as e:
+        raise ValueError(f"Invalid date: {e}")
+    if date_from > date_to:
+        raise ValueError("date_from must not be after date_to")
+    return date_from, date_to
+
+
+def bucket_start(day, bucket):
+    """First day of the bucket containing ``day``"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _filtered(query, date_from, date_to, currency=None, customer=None):
+    query = query.where(OrderDailyRollup.day >= date_from, OrderDailyRollup.day <= date_to)
+    if currency:
+        query = query.where(OrderDailyRollup.currency == currency.upper())
+    if customer is not None:
+        query = query.where(OrderDailyRollup.customer == customer)
+    return query
+
+
+def _row(order_count, total_value, **keys):
+    return dict(keys, order_count=int(order_count), total_value=float(total_value or 0))
+
+
+def value_by_period(date_from, date_to, bucket='day', currency=None, customer=None):
+    """Order count and value per time bucket and currency"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+
+    query = _filtered(
+        select(
+            OrderDailyRollup.day,
+            OrderDailyRollup.currency,
+            func.sum(OrderDailyRollup.order_count),
+            func.sum(OrderDailyRollup.total_value)
+        ),
+        date_from, date_to, currency, customer
+    ).group_by(OrderDailyRollup.day, OrderDailyRollup.currency)
+
+    # At most one row per day and currency comes back, so coarser buckets are
+    # folded here instead of with dialect-specific date functions.
+    periods = {}
+    for day, row_currency, order_count, total_value in db.session.execute(query):
+        key = (bucket_start(day, bucket), row_currency)
+        count, value = periods.get(key, (0, 0))
+        periods[key] = (count + order_count, value + (total_value or 0))
+
+    return [
+        _row(count, value, period=period.isoformat(), currency=row_currency)
+        for (period, row_currency), (count, value) in sorted(periods.items())
+    ]
+
+
+def value_by_customer(date_from, date_to, currency=None, limit=20):
+    """Top customers by value (per currency) in the date range"""
+    total = func.sum(OrderDailyRollup.total_value)
+    query = _filtered(
+        select(
+            OrderDailyRollup.customer,
+            OrderDailyRollup.currency,
+            func.sum(OrderDailyRollup.order_count),
+            total
+        ),
+        date_from, date_to, currency
+    ).group_by(OrderDailyRollup.customer, OrderDailyRollup.currency).order_by(
+        total.desc(), OrderDailyRollup.customer
+    ).limit(min(limit, MAX_TOP_CUSTOMERS))
+
+    return [
+        _row(order_count, value, customer=customer or None, currency=row_currency)
+        for customer, row_currency, order_count, value in db.session.execute(query)
+    ]
+
+
+def value_by_currency(date_from, date_to):
+    """Order count and value per currency in the date range"""
+    query = _filtered(
+        select(
+            OrderDailyRollup.currency,
+            func.sum(OrderDailyRollup.order_count),
+            func.sum(OrderDailyRollup.total_value)
+        ),
+        date_from, date_to
+    ).group_by(OrderDailyRollup.currency).order_by(OrderDailyRollup.currency)
+
+    return [
+        _row(order_count, value, currency=row_currency)
+        for row_currency, order_count, value in db.session.execute(query)
+    ]
@@ -1,18 +1,55 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, abort, request, jsonify, current_app, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
+from flask_migrate import Migrate
+import functools
+import json
 import os
+import threading
+import uuid
+import zipfile
 from datetime import datetime
+from urllib.parse import urlencode
 from dotenv import load_dotenv
 from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm.exc import StaleDataError
 
-from models import db, SalesOrderHeader, SalesOrderDetail
+from models import db, SalesOrderHeader, SalesOrderDetail, VendorTemplate
 from schemas import OrderUpdate
-from tasks import make_celery, process_invoice_task
+from queries import apply_order_filters, decode_cursor, newest_first, paginate_orders, parse_bool, parse_limit
+from serializers import dumps, json_response, order_select, parse_fields, serialize_orders
+from response_cache import LISTS, make_etag, order_cache, order_scope
+from order_numbers import order_numbers
+from storage import save_upload, save_stream, iter_zip_members
+from tasks import make_celery, process_invoice_task, start_invoice_pipeline, enqueue_invoice_batch
+from llm_cache import extraction_cache
+from vendor_templates import template_store
+from single_flight import pipeline_flight
+from line_items import EDITABLE_FIELDS, diff_line_items
+from exports import EXPORT_FORMATS, export_chunks
+from search import index_orders, remove_orders, search_order_ids
+from rollups import apply_stats_delta, read_order_stats
+from progress import (STAGE_MESSAGES, TERMINAL_STAGES, batch_channel, latest_progress, listen,
+                      order_channel, subscribe)
+import analytics
 
 load_dotenv()
 
+ALLOWED_EXTENSIONS = ['pdf', 'jpg', 'jpeg', 'png', 'gif']
+
+
+class InvoiceRequest(Request):
+    """Request class allowing a larger body size for bulk uploads"""
+    
+    @property
+    def max_content_length(self):
+        if self.path == '/api/upload/batch':
+            return current_app.config['MAX_BATCH_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+
 app = Flask(__name__)
+app.request_class = InvoiceRequest
 CORS(app)
 
 # Database configuration
@@ -46,14 +83,35 @@ else:
     print(f"Database URL configured: {POSTGRES_USER}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")  # Log without password
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # One pooled connection per request thread (see gunicorn_config.py); Celery
+    # services set DB_POOL_SIZE to their concurrency instead
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', 8))),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_BATCH_CONTENT_LENGTH'] = int(os.getenv('MAX_BATCH_CONTENT_LENGTH', 2 * 1024 * 1024 * 1024))  # 2GB per batch
+app.config['MAX_ARCHIVE_UNCOMPRESSED_SIZE'] = int(os.getenv('MAX_ARCHIVE_UNCOMPRESSED_SIZE', 2 * 1024 * 1024 * 1024))  # Per ZIP
+app.config['BATCH_TASK_CHUNK_SIZE'] = int(os.getenv('BATCH_TASK_CHUNK_SIZE', 0))  # 0 = one task per invoice
+app.config['SSE_HEARTBEAT_SECONDS'] = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+app.config['SSE_RETRY_MS'] = int(os.getenv('SSE_RETRY_MS', 2000))  # Client reconnect delay
+# Streams end after this long (each holds a web worker thread); clients reconnect after SSE_RETRY_MS
+app.config['SSE_MAX_SECONDS'] = float(os.getenv('SSE_MAX_SECONDS', 300))
+# Streamed responses (SSE, exports) one worker serves at once, leaving its other threads for short requests
+app.config['MAX_STREAMS_PER_WORKER'] = int(os.getenv('MAX_STREAMS_PER_WORKER', max(1, int(os.getenv('GUNICORN_THREADS', 8)) // 2)))
+app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))  # Orders per streamed chunk
 # Store Celery config in Flask config for make_celery to use (using new format)
 app.config['broker_url'] = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
 app.config['result_backend'] = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
 
-# Initialize database
+# Initialize database; the schema is managed by migrations (`flask --app app db upgrade`)
 db.init_app(app)
+migrate = Migrate(app, db, render_as_batch=True)
 
 # Initialize Celery
 celery = make_celery(app)
@@ -79,36 +137,50 @@ def upload_document():
     
     # Validate file type
     file_ext = file.filename.lower().split('.')[-1]
-    if file_ext not in ['pdf', 'jpg', 'jpeg', 'png', 'gif']:
+    if file_ext not in ALLOWED_EXTENSIONS:
         return jsonify({'error': 'Unsupported file type. Supported: PDF, JPG, PNG, GIF'}), 400
     
     try:
-        # Save file
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Save file under its content hash (hashed while streaming to disk)
+        file_path, content_hash = save_upload(file, app.config['UPLOAD_FOLDER'], file_ext)
+        
+        # Identical document already extracted: link to it instead of re-processing
+        existing = SalesOrderHeader.query.filter_by(
+            content_hash=content_hash,
+            processing_status='completed'
+        ).order_by(SalesOrderHeader.id).first()
+        if existing:
+            return jsonify({
+                'message': 'Identical invoice already processed',
+                'duplicate': True,
+                'order_id': existing.id,
+                'order_number': existing.order_number,
+                'task_id': None,
+                'processing_status': existing.processing_status,
+                'order': existing.to_dict()
+            }), 200
         
-        # Generate order number
-        order_number = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        order_number = order_numbers.next()
         
         # Create order record with pending status
         order_header = SalesOrderHeader(
             order_number=order_number,
             processing_status='pending',
             status='pending',
-            file_path=file_path
+            file_path=file_path,
+            content_hash=content_hash
         )
         
         db.session.add(order_header)
         db.session.commit()
+        order_cache.invalidate_lists()
         
-        # Queue processing task
-        task = process_invoice_task.delay(order_header.id, file_path)
+        # Queue the parse -> extract -> persist pipeline; its id tracks the last stage
+        task = start_invoice_pipeline(order_header.id, file_path)
         
         return jsonify({
             'message': 'Invoice uploaded and queued for processing',
+            'duplicate': False,
             'order_id': order_header.id,
             'order_number': order_number,
             'task_id': task.id,
@@ -121,26 +193,474 @@ def upload_document():
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
 
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """Upload many documents (multipart files and/or ZIP archives) as one batch"""
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not uploads:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    upload_folder = app.config['UPLOAD_FOLDER']
+    stored = {}  # content_hash -> {'file_path', 'filenames'}
+    rejected = []
+    
+    def store(filename, file_ext, stream):
+        if file_ext not in ALLOWED_EXTENSIONS:
+            rejected.append({'filename': filename, 'error': 'Unsupported file type'})
+            return
+        file_path, content_hash = save_stream(stream, upload_folder, file_ext)
+        entry = stored.setdefault(content_hash, {'file_path': file_path, 'filenames': []})
+        entry['filenames'].append(filename)
+    
+    try:
+        # Stream every document (including ZIP members) to content-addressed storage
+        for upload in uploads:
+            file_ext = upload.filename.lower().split('.')[-1]
+            if file_ext == 'zip':
+                before = {content_hash: len(entry['filenames']) for content_hash, entry in stored.items()}
+                try:
+                    for filename, member_ext, member in iter_zip_members(
+                            upload.stream, max_total_size=app.config['MAX_ARCHIVE_UNCOMPRESSED_SIZE']):
+                        store(filename, member_ext, member)
+                except (zipfile.BadZipFile, ValueError) as e:
+                    # No orders for any member of a rejected archive
+                    for content_hash in list(stored):
+                        if content_hash not in before:
+                            del stored[content_hash]
+                        else:
+                            del stored[content_hash]['filenames'][before[content_hash]:]
+                    rejected.append({'filename': upload.filename, 'error': f'Invalid archive: {e}'})
+            else:
+                store(upload.filename, file_ext, upload.stream)
+        
+        if not stored:
+            return jsonify({'error': 'No supported files in batch', 'rejected': rejected}), 400
+        
+        # Documents that were already extracted are linked, not re-processed
+        duplicates = []
+        completed = SalesOrderHeader.query.with_entities(
+            SalesOrderHeader.content_hash, SalesOrderHeader.id
+        ).filter(
+            SalesOrderHeader.content_hash.in_(list(stored)),
+            SalesOrderHeader.processing_status == 'completed'
+        ).all()
+        for content_hash, order_id in completed:
+            entry = stored.pop(content_hash, None)
+            if entry:
+                duplicates.extend({'filename': name, 'order_id': order_id} for name in entry['filenames'])
+        
+        batch_id = str(uuid.uuid4())
+        orders = []
+        jobs = []
+        if stored:
+            # Insert every order header in one bulk statement
+            now = datetime.utcnow()
+            rows = [
+                {
+                    'order_number': order_number,
+                    'processing_status': 'pending',
+                    'status': 'pending',
+                    'file_path': entry['file_path'],
+                    'content_hash': content_hash,
+                    'batch_id': batch_id,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+                for order_number, (content_hash, entry) in zip(order_numbers.allocate(len(stored)), stored.items())
+            ]
+            order_ids = db.session.scalars(
+                insert(SalesOrderHeader).returning(SalesOrderHeader.id, sort_by_parameter_order=True),
+                rows
+            ).all()
+            # Bulk INSERT bypasses the session listener that maintains /api/stats
+            apply_stats_delta(db.session.connection(), orders=len(order_ids))
+            db.session.commit()
+            order_cache.invalidate_lists()
+            
+            for order_id, row, entry in zip(order_ids, rows, stored.values()):
+                orders.append({
+                    'order_id': order_id,
+                    'order_number': row['order_number'],
+                    'filenames': entry['filenames']
+                })
+                jobs.append((order_id, entry['file_path']))
+        
+        # Dispatch all processing tasks as one Celery group
+        group_id = None
+        if jobs:
+            group_result = enqueue_invoice_batch(jobs, chunk_size=app.config['BATCH_TASK_CHUNK_SIZE'])
+            group_id = group_result.id
+        
+        return jsonify({
+            'message': f'{len(orders)} invoices queued for processing',
+            'batch_id': batch_id if orders else None,
+            'group_id': group_id,
+            'queued': len(orders),
+            'orders': orders,
+            'duplicates': duplicates,
+            'rejected': rejected
+        }), 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Batch upload failed: {str(e)}'}), 500
+
+
+def _batch_status(batch_id):
+    """Aggregate processing progress of a bulk upload, or None if unknown"""
+    counts = dict(
+        db.session.query(SalesOrderHeader.processing_status, db.func.count(SalesOrderHeader.id))
+        .filter(SalesOrderHeader.batch_id == batch_id)
+        .group_by(SalesOrderHeader.processing_status)
+        .all()
+    )
+    total = sum(counts.values())
+    if total == 0:
+        return None
+    
+    finished = counts.get('completed', 0) + counts.get('failed', 0)
+    return {
+        'batch_id': batch_id,
+        'total': total,
+        'pending': counts.get('pending', 0),
+        'processing': counts.get('processing', 0),
+        'completed': counts.get('completed', 0),
+        'failed': counts.get('failed', 0),
+        'progress': round(finished / total, 4),
+        'done': finished == total
+    }
+
+
+@app.route('/api/upload/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Get aggregate processing progress for a bulk upload"""
+    status = _batch_status(batch_id)
+    if status is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(status)
+
+
+def _sse(data, event):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _event_stream(generate):
+    """Response streaming ``generate()`` as text/event-stream"""
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}  # No proxy buffering
+    )
+
+
+_stream_slots = threading.BoundedSemaphore(app.config['MAX_STREAMS_PER_WORKER'])
+
+
+def holds_stream_slot(view):
+    """Count ``view``'s streamed responses against MAX_STREAMS_PER_WORKER.
+    
+    A streamed response holds a worker thread until it ends; when every
+    slot is taken the request gets 503 with ``Retry-After`` instead.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _stream_slots.acquire(blocking=False):
+            response = jsonify({'error': 'Too many open streams, retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(1, app.config['SSE_RETRY_MS'] // 1000))
+            return response
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            _stream_slots.release()
+            raise
+        if not response.is_streamed:
+            _stream_slots.release()
+            return response
+        # Free the slot when the body ends, or on close if it never started
+        released = []
+        
+        def release():
+            if not released:
+                released.append(True)
+                _stream_slots.release()
+        
+        def body(chunks):
+            try:
+                yield from chunks
+            finally:
+                release()
+        
+        response.response = body(response.response)
+        response.call_on_close(release)
+        return response
+    return wrapper
+
+
+def _order_progress(order):
+    """Current progress event of an order, from Redis or its row"""
+    stage = {'pending': 'queued', 'completed': 'completed', 'failed': 'failed'}.get(order.processing_status)
+    latest = latest_progress(order.id)
+    if stage is None and latest:
+        return latest
+    stage = stage or 'parsing'
+    event = {'order_id': order.id, 'batch_id': order.batch_id, 'stage': stage, 'status': STAGE_MESSAGES[stage]}
+    if stage == 'failed':
+        event['error'] = order.error_message
+    return event
+
+
+@app.route('/api/orders/<int:order_id>/events', methods=['GET'])
+@holds_stream_slot
+def stream_order_events(order_id):
+    """Stream an order's processing progress as Server-Sent Events.
+    
+    Sends the current stage first, then every stage change until the order
+    completes or fails, or for at most ``SSE_MAX_SECONDS``. Without Redis
+    the stream ends after the current stage; either way the client
+    reconnects after ``retry`` milliseconds.
+    """
+    # Subscribe before reading the row so no event is missed in between
+    pubsub = subscribe(order_channel(order_id))
+    order = db.session.get(SalesOrderHeader, order_id)
+    if not order:
+        if pubsub is not None:
+            pubsub.close()
+        return jsonify({'error': 'Order not found'}), 404
+    current = _order_progress(order)
+    db.session.close()  # Don't hold a database connection while streaming
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    retry = app.config['SSE_RETRY_MS']
+    max_seconds = app.config['SSE_MAX_SECONDS']
+    
+    def generate():
+        try:
+            yield f"retry: {retry}\n\n"
+            yield _sse(current, 'progress')
+            if current['stage'] in TERMINAL_STAGES or pubsub is None:
+                return
+            for event in listen(pubsub, heartbeat, max_seconds):
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, 'progress')
+                if event['stage'] in TERMINAL_STAGES:
+                    return
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+    
+    return _event_stream(generate)
+
+
+@app.route('/api/upload/batch/<batch_id>/events', methods=['GET'])
+@holds_stream_slot
+def stream_batch_events(batch_id):
+    """Stream a bulk upload's progress as Server-Sent Events.
+    
+    ``batch`` events carry the aggregate counts (sent first and whenever an
+    order finishes), ``progress`` events the stage changes of its orders.
+    Like order streams, it ends after ``SSE_MAX_SECONDS``.
+    """
+    pubsub = subscribe(batch_channel(batch_id))
+    status = _batch_status(batch_id)
+    if status is None:
+        if pubsub is not None:
+            pubsub.close()
+        return jsonify({'error': 'Batch not found'}), 404
+    db.session.close()
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    retry = app.config['SSE_RETRY_MS']
+    max_seconds = app.config['SSE_MAX_SECONDS']
+    
+    def generate():
+        try:
+            yield f"retry: {retry}\n\n"
+            yield _sse(status, 'batch')
+            if status['done'] or pubsub is None:
+                return
+            for event in listen(pubsub, heartbeat, max_seconds):
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, 'progress')
+                if event['stage'] in TERMINAL_STAGES:
+                    counts = _batch_status(batch_id)
+                    db.session.close()
+                    yield _sse(counts, 'batch')
+                    if counts['done']:
+                        return
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+    
+    return _event_stream(generate)
+
+
+def _cached_json(scope, variant, build):
+    """JSON response of ``build()`` served through the response cache.
+    
+    Responses carry their ETag and a matching ``If-None-Match`` gets a 304;
+    when the response is cached, neither needs the database.
+    """
+    payload, etag, generation = order_cache.lookup(scope, variant)
+    cache_status = 'HIT'
+    if payload is None:
+        cache_status = 'MISS'
+        payload = dumps(build())
+        etag = make_etag(payload)
+        order_cache.store(scope, variant, payload, etag, generation)
+    
+    if request.if_none_match.contains(etag):
+        order_cache.record('not_modified')
+        response = Response(status=304)
+    else:
+        order_cache.record('hits' if cache_status == 'HIT' else 'misses')
+        response = Response(payload, mimetype='application/json')
+        response.headers['X-Cache'] = cache_status
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate with If-None-Match
+    return response
+
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
-    """Get all orders"""
-    orders = SalesOrderHeader.query.order_by(SalesOrderHeader.created_at.desc()).all()
-    return jsonify({
-        'orders': [order.to_dict() for order in orders],
-        'count': len(orders)
+    """Get one page of orders, newest first.
+    
+    Query parameters: ``limit``, ``cursor`` (from ``next_cursor``),
+    ``include_line_items`` (default true), ``fields`` (comma-separated
+    sparse fieldset; include ``line_items`` to get them), ``processing_status``,
+    ``status``, ``customer``, ``date_from`` and ``date_to``. Pages are cached
+    (see response_cache.py) and support ``If-None-Match``.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        include_line_items = parse_bool(request.args.get('include_line_items'), True)
+        fields = parse_fields(request.args.get('fields'))
+        query = apply_order_filters(order_select(fields), request.args)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        rows, next_cursor = paginate_orders(query, cursor, limit, session=db.session)
+        # Line items for the whole page come from one extra query (no N+1)
+        orders = serialize_orders(db.session, rows, fields, include_line_items)
+        return {
+            'orders': orders,
+            'count': len(orders),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+    
+    return _cached_json(LISTS, urlencode(sorted(request.args.items(multi=True))), build)
+
+
+@app.route('/api/orders/export', methods=['GET'])
+@holds_stream_slot
+def export_orders():
+    """Stream every matching order as CSV or NDJSON.
+    
+    Query parameters: ``format`` (``csv`` or ``ndjson``, default ``csv``),
+    ``include_line_items`` (default true), ``fields`` and the filters of
+    ``GET /api/orders``. CSV has one row per line item; NDJSON one order
+    per line with its line items nested.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format: {export_format}; use one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        include_line_items = parse_bool(request.args.get('include_line_items'), True)
+        fields = parse_fields(request.args.get('fields'))
+        statement = newest_first(apply_order_filters(order_select(fields), request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunks = export_chunks(db.session, export_format, statement, fields, include_line_items,
+                           batch_size=app.config['EXPORT_BATCH_SIZE'])
+    filename = f"orders-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{export_format}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/orders/search', methods=['GET'])
+def search_orders():
+    """Full-text search over invoice numbers, customers and line items.
+    
+    Query parameters: ``q`` (every word must match, as a prefix),
+    ``limit``, ``cursor`` (from ``next_cursor``), ``include_line_items``
+    (default true, as on ``GET /api/orders``), ``fields`` and the filters
+    of ``GET /api/orders``. Orders are returned best match first.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'), default=20)
+        fields = parse_fields(request.args.get('fields'))
+        include_line_items = parse_bool(request.args.get('include_line_items'), True)
+        matches, next_cursor = search_order_ids(
+            db.session, request.args.get('q'),
+            filter_orders=lambda statement: apply_order_filters(statement, request.args),
+            cursor=request.args.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    order_ids = [order_id for order_id, _ in matches]
+    rows = db.session.execute(order_select(fields).where(SalesOrderHeader.id.in_(order_ids))).all() if order_ids else []
+    by_id = dict(zip((row.id for row in rows), serialize_orders(db.session, rows, fields, include_line_items)))
+    # Skip orders deleted between the search and this read
+    orders = [dict(by_id[order_id], score=round(score, 6)) for order_id, score in matches if order_id in by_id]
+    return json_response({
+        'orders': orders,
+        'count': len(orders),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
-    """Get a specific order"""
-    order = SalesOrderHeader.query.get_or_404(order_id)
-    return jsonify(order.to_dict())
+    """Get a specific order; supports ``fields`` like the list endpoint.
+    
+    Responses are cached until the order changes and support ``If-None-Match``.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        row = db.session.execute(
+            order_select(fields).where(SalesOrderHeader.id == order_id)
+        ).first()
+        if row is None:
+            abort(404)
+        return serialize_orders(db.session, [row], fields)[0]
+    
+    return _cached_json(order_scope(order_id), ','.join(fields) if fields else '*', build)
+
+
+def _stale_order_response(order):
+    return jsonify({
+        'error': 'Order was modified by someone else; reload it and apply your changes again',
+        'version': order.version
+    }), 409
 
 
 @app.route('/api/orders/<int:order_id>', methods=['PUT'])
 def update_order(order_id):
-    """Update an order with Pydantic validation"""
+    """Update an order with Pydantic validation.
+    
+    ``line_items`` is the complete list of lines: entries are matched to the
+    stored lines by ``id`` (or ``line_number``), and only new, changed and
+    removed lines are written. Passing the ``version`` the client loaded
+    rejects the update with 409 if the order changed in the meantime.
+    """
     order = SalesOrderHeader.query.get_or_404(order_id)
     
     try:
@@ -150,6 +670,9 @@ def update_order(order_id):
         # Update header fields
         update_dict = update_data.dict(exclude_unset=True)
         
+        if update_dict.get('version') is not None and update_dict['version'] != order.version:
+            return _stale_order_response(order)
+        
         if 'invoice_number' in update_dict:
             order.invoice_number = update_dict['invoice_number']
         if 'invoice_date' in update_dict and update_dict['invoice_date']:
@@ -177,34 +700,41 @@ def update_order(order_id):
         
         order.updated_at = datetime.utcnow()
         
-        # Update line items if provided
-        if 'line_items' in update_dict and update_dict['line_items']:
-            # Delete existing line items
-            SalesOrderDetail.query.filter_by(order_id=order_id).delete()
-            
-            # Add new line items
-            for item_data in update_dict['line_items']:
-                line_item = SalesOrderDetail(
-                    order_id=order.id,
-                    line_number=item_data.get('line_number'),
-                    product_code=item_data.get('product_code'),
-                    product_name=item_data.get('product_name'),
-                    description=item_data.get('description'),
-                    quantity=item_data.get('quantity'),
-                    unit_price=item_data.get('unit_price'),
-                    discount=item_data.get('discount', 0),
-                    line_total=item_data.get('line_total')
-                )
-                db.session.add(line_item)
+        # Apply only the line item differences
+        line_item_changes = None
+        if update_dict.get('line_items') is not None:
+            try:
+                inserts, updates, deletes = diff_line_items(order.line_items, update_dict['line_items'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            for line_item, changes in updates:
+                for field, value in changes.items():
+                    setattr(line_item, field, value)
+            for line_item in deletes:
+                order.line_items.remove(line_item)  # delete-orphan
+            for item_data in inserts:
+                values = {field: item_data.get(field) for field in EDITABLE_FIELDS}
+                if values['discount'] is None:
+                    values['discount'] = 0
+                order.line_items.append(SalesOrderDetail(**values))
+            line_item_changes = {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
         
+        db.session.flush()
+        index_orders(db.session.connection(), [order.id])
         db.session.commit()
+        order_cache.invalidate_order(order_id)
         return jsonify({
             'message': 'Order updated successfully',
-            'order': order.to_dict()
+            'order': order.to_dict(),
+            'line_item_changes': line_item_changes
         })
         
     except ValidationError as e:
         return jsonify({'error': 'Validation failed', 'details': e.errors()}), 400
+    except StaleDataError:
+        # Another writer committed between our read and our UPDATE
+        db.session.rollback()
+        return _stale_order_response(SalesOrderHeader.query.get_or_404(order_id))
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Update failed: {str(e)}'}), 500
@@ -215,15 +745,13 @@ def delete_order(order_id):
     """Delete an order"""
     order = SalesOrderHeader.query.get_or_404(order_id)
     
-    # Delete associated file if exists
-    if order.file_path and os.path.exists(order.file_path):
-        try:
-            os.remove(order.file_path)
-        except:
-            pass
-    
+    # The file stays: files are stored by content hash, so an upload of the
+    # same document may be about to reuse it. The sweep_uploads task removes
+    # files no order references (see storage.sweep_unreferenced).
+    remove_orders(db.session.connection(), [order.id])
     db.session.delete(order)
     db.session.commit()
+    order_cache.invalidate_order(order_id)
     
     return jsonify({'message': 'Order deleted successfully'})
 
@@ -241,7 +769,8 @@ def get_task_status(task_id):
     elif task.state == 'PROGRESS':
         response = {
             'state': task.state,
-            'status': task.info.get('status', 'Processing...')
+            'status': task.info.get('status', 'Processing...'),
+            'progress': task.info
         }
     elif task.state == 'SUCCESS':
         response = {
@@ -261,9 +790,8 @@ def get_task_status(task_id):
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    """Get statistics about orders"""
-    total_orders = SalesOrderHeader.query.count()
-    total_value = db.session.query(db.func.sum(SalesOrderHeader.total)).scalar() or 0
+    """Get statistics about orders (read from the incrementally maintained rollup)"""
+    total_orders, total_value = read_order_stats()
     
     return jsonify({
         'total_orders': total_orders,
@@ -272,24 +800,90 @@ def get_stats():
     })
 
 
-# Initialize database tables (only when not in testing mode)
-if not app.config.get('TESTING'):
-    import time
-    max_retries = 5
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            with app.app_context():
-                db.create_all()
-                print("Database tables created successfully")
-                break
-        except Exception as e:
-            retry_count += 1
-            if retry_count < max_retries:
-                print(f"Database connection failed, retrying ({retry_count}/{max_retries}): {e}")
-                time.sleep(2)
-            else:
-                print(f"Warning: Could not create database tables after {max_retries} attempts: {e}")
+@app.route('/api/analytics/daily', methods=['GET'])
+def get_analytics_daily():
+    """Completed order value per day, week or month (``bucket``) and currency"""
+    try:
+        date_from, date_to = analytics.parse_date_range(request.args)
+        rows = analytics.value_by_period(
+            date_from,
+            date_to,
+            bucket=request.args.get('bucket', 'day'),
+            currency=request.args.get('currency'),
+            customer=request.args.get('customer')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), 'results': rows})
+
+
+@app.route('/api/analytics/customers', methods=['GET'])
+def get_analytics_customers():
+    """Top customers by completed order value"""
+    try:
+        date_from, date_to = analytics.parse_date_range(request.args)
+        limit = parse_limit(request.args.get('limit'), default=20, maximum=analytics.MAX_TOP_CUSTOMERS)
+        rows = analytics.value_by_customer(date_from, date_to, currency=request.args.get('currency'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), 'results': rows})
+
+
+@app.route('/api/analytics/currencies', methods=['GET'])
+def get_analytics_currencies():
+    """Completed order value per currency"""
+    try:
+        date_from, date_to = analytics.parse_date_range(request.args)
+        rows = analytics.value_by_currency(date_from, date_to)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), 'results': rows})
+
+
+@app.route('/api/metrics/llm-cache', methods=['GET'])
+def get_llm_cache_metrics():
+    """Get LLM extraction cache hit/miss counters"""
+    return jsonify(extraction_cache.stats())
+
+
+@app.route('/api/metrics/templates', methods=['GET'])
+def get_template_metrics():
+    """Get vendor template hit-rate counters"""
+    return jsonify(template_store.stats())
+
+
+@app.route('/api/metrics/single-flight', methods=['GET'])
+def get_single_flight_metrics():
+    """Get counters of duplicate parses/extractions that were coalesced"""
+    return jsonify(pipeline_flight.stats())
+
+
+@app.route('/api/metrics/response-cache', methods=['GET'])
+def get_response_cache_metrics():
+    """Hit rate of the order response cache"""
+    return jsonify(order_cache.stats())
+
+
+@app.route('/api/templates', methods=['GET'])
+def get_templates():
+    """List learned vendor templates, most used first"""
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    templates = VendorTemplate.query.order_by(
+        VendorTemplate.hit_count.desc(), VendorTemplate.fingerprint
+    ).limit(limit).all()
+    return jsonify({'templates': [template.to_dict() for template in templates], 'count': len(templates)})
+
+
+@app.route('/api/templates/<fingerprint>', methods=['DELETE'])
+def invalidate_template(fingerprint):
+    """Deactivate a vendor template; it is relearned from the next LLM extraction"""
+    if not template_store.invalidate(fingerprint):
+        return jsonify({'error': 'Template not found'}), 404
+    db.session.commit()
+    return jsonify({'message': 'Template invalidated'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+"""
+Benchmark concurrent order number allocation.
+
+Compares the former ``ORD-<YYYYmmddHHMMSS>`` numbers with
+``order_numbers.OrderNumberGenerator`` (time + node + sequence). Threads share
+one generator, as the threads of a gunicorn or Celery worker do; processes
+each get their own node id, as separate workers do. Every run allocates
+``--count`` numbers per thread or process and reports allocations per second
+and how many of them were unique; a duplicate is an IntegrityError on
+``sales_order_header.order_number``.
+
+Usage (from backend/):
+    python benchmarks/bench_order_numbers.py --count 200000 --threads 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_numbers import OrderNumberGenerator  # noqa: E402
+
+
+def timestamp_numbers(count):
+    """Former scheme: unique only to the second"""
+    return [f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}" for _ in range(count)]
+
+
+def generator_numbers(generator, count, batch):
+    if batch == 1:
+        return [generator.next() for _ in range(count)]
+    numbers = []
+    for _ in range(count // batch):
+        numbers.extend(generator.allocate(batch))
+    return numbers
+
+
+def run_threads(threads, allocate):
+    """Run ``allocate()`` on each thread; return (numbers, seconds)"""
+    results = [None] * threads
+
+    def work(index):
+        results[index] = allocate()
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return [number for numbers in results for number in numbers], elapsed
+
+
+def _process_worker(node_id, count, queue):
+    generator = OrderNumberGenerator(node_id=node_id, redis_getter=None)
+    queue.put(generator_numbers(generator, count, 1))
+
+
+def run_processes(processes, count):
+    """One generator (node) per process; return (numbers, seconds)"""
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    workers = [context.Process(target=_process_worker, args=(node_id, count, queue)) for node_id in range(processes)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    numbers = [number for _ in workers for number in queue.get()]
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+    return numbers, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200000, help='numbers per thread or process')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    shared = OrderNumberGenerator(node_id=0, redis_getter=None)
+    runs = {
+        'timestamp, 1 thread (before)': run_threads(1, lambda: timestamp_numbers(args.count)),
+        f'timestamp, {args.threads} threads (before)': run_threads(
+            args.threads, lambda: timestamp_numbers(args.count)),
+        'generator, 1 thread': run_threads(1, lambda: generator_numbers(shared, args.count, 1)),
+        f'generator, {args.threads} threads': run_threads(
+            args.threads, lambda: generator_numbers(shared, args.count, 1)),
+        f'generator, {args.threads} threads, `allocate(100)`': run_threads(
+            args.threads, lambda: generator_numbers(shared, args.count, 100)),
+        f'generator, {args.processes} processes': run_processes(args.processes, args.count),
+    }
+
+    print(f'{args.count:,} numbers per thread or process, {os.cpu_count()} CPUs')
+    print('\n| Allocation | Numbers/sec | Unique |')
+    print('|---|---:|---:|')
+    for name, (numbers, elapsed) in runs.items():
+        print(f'| {name} | {len(numbers) / elapsed:,.0f} | {len(set(numbers)):,} of {len(numbers):,} |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark serializing pages of orders for GET /api/orders.
+
+Compares the former path (ORM objects with ``selectinload`` of line items,
+``to_dict()``, stdlib ``json``) with ``serializers`` (Core rows, per-column
+converters, orjson when installed), with and without a sparse fieldset.
+Each run loads and encodes every page of the seeded orders and reports
+orders per second.
+
+Usage (from backend/):
+    python benchmarks/bench_order_serialization.py --orders 20000 --lines-per-order 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.orm import Session, selectinload  # noqa: E402
+
+import serializers  # noqa: E402
+from models import db, SalesOrderHeader, SalesOrderDetail  # noqa: E402
+from serializers import order_select, serialize_orders  # noqa: E402
+
+header = SalesOrderHeader.__table__
+detail = SalesOrderDetail.__table__
+
+
+def seed(engine, orders, lines_per_order, rng):
+    base = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(header.insert(), [{
+            'id': order_id,
+            'order_number': f'ORD-BENCH-{order_id:07d}',
+            'invoice_number': f'INV-{order_id:07d}',
+            'invoice_date': (base + timedelta(days=order_id % 365)).date(),
+            'customer_name': f'Customer {rng.randint(1, 500)}',
+            'customer_email': 'billing@example.com',
+            'subtotal': round(rng.uniform(10, 5000), 2),
+            'tax': round(rng.uniform(1, 500), 2),
+            'total': round(rng.uniform(10, 5500), 2),
+            'currency': 'USD',
+            'status': 'pending',
+            'processing_status': 'completed',
+            'created_at': base + timedelta(minutes=order_id),
+            'updated_at': base + timedelta(minutes=order_id),
+        } for order_id in range(1, orders + 1)])
+        conn.execute(detail.insert(), [{
+            'order_id': order_id,
+            'line_number': line_number,
+            'product_code': f'SKU-{rng.randint(1, 99999):05d}',
+            'product_name': f'Product {rng.randint(1, 500)}',
+            'quantity': rng.randint(1, 50),
+            'unit_price': round(rng.uniform(1, 500), 2),
+            'discount': 0,
+            'line_total': round(rng.uniform(1, 5000), 2),
+        } for order_id in range(1, orders + 1) for line_number in range(1, lines_per_order + 1)])
+
+
+def pages(orders, page_size):
+    for start in range(1, orders + 1, page_size):
+        yield start, min(start + page_size, orders + 1)
+
+
+def orm_to_dict(session, start, stop):
+    """Former path: ORM objects, to_dict() and the stdlib encoder"""
+    orders = session.scalars(
+        select(SalesOrderHeader)
+        .where(SalesOrderHeader.id >= start, SalesOrderHeader.id < stop)
+        .options(selectinload(SalesOrderHeader.line_items))
+    ).all()
+    body = json.dumps({'orders': [order.to_dict() for order in orders]}).encode('utf-8')
+    session.expunge_all()
+    return body
+
+
+def core_rows(fields):
+    def serialize(session, start, stop):
+        rows = session.execute(order_select(fields).where(header.c.id >= start, header.c.id < stop)).all()
+        return serializers.dumps({'orders': serialize_orders(session, rows, fields)})
+    return serialize
+
+
+def run(engine, orders, page_size, serialize, repeat):
+    """Median orders/sec of serializing every page"""
+    rates = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with Session(engine) as session:
+            for start, stop in pages(orders, page_size):
+                serialize(session, start, stop)
+        rates.append(orders / (time.perf_counter() - started))
+    return statistics.median(rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--lines-per-order', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    db.metadata.create_all(engine)
+    seed(engine, args.orders, args.lines_per_order, random.Random(42))
+
+    encoder = 'orjson' if serializers.orjson is not None else 'stdlib json'
+    strategies = {
+        'ORM + to_dict() + json (before)': orm_to_dict,
+        f'Core rows + {encoder}': core_rows(None),
+        f'Core rows + {encoder}, fields=id,total,status': core_rows(['id', 'total', 'status']),
+    }
+
+    print(f'{args.orders} orders x {args.lines_per_order} line items, pages of {args.page_size}')
+    results = {name: run(engine, args.orders, args.page_size, serialize, args.repeat)
+               for name, serialize in strategies.items()}
+
+    baseline = results['ORM + to_dict() + json (before)']
+    print('\n| Strategy | Orders/sec | Speedup |')
+    print('|---|---:|---:|')
+    for name, rate in results.items():
+        print(f'| {name} | {rate:,.0f} | {rate / baseline:.1f}x |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Load test the web tier under gunicorn: former sync workers vs gthread.
+
+Starts gunicorn with ``gunicorn_config.py`` twice: once overridden to the
+former settings (``sync`` workers, ``cpu_count * 2 + 1`` of them, one
+thread each) and once as configured (``gthread``). Each run seeds a
+temporary SQLite database with orders, then drives two kinds of clients for
+``--duration`` seconds:
+
+* fast clients (keep-alive) reading ``GET /api/orders/<id>`` and a list
+  page, whose requests/sec and latency percentiles are reported;
+* slow uploaders trickling ``POST /api/upload`` bodies over
+  ``--upload-seconds``, like clients on a slow link. A sync worker is busy
+  for the whole upload; a gthread worker only loses one thread.
+
+Usage (from backend/):
+    python benchmarks/bench_web_load.py --duration 20 --clients 16 --slow-uploads 4
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from models import db, SalesOrderHeader, SalesOrderDetail  # noqa: E402
+
+SYNC_WORKERS = multiprocessing.cpu_count() * 2 + 1
+CONFIGS = {
+    f'sync, {SYNC_WORKERS} workers (before)': ['--worker-class', 'sync', '--workers', str(SYNC_WORKERS),
+                                              '--threads', '1'],
+    'gthread (gunicorn_config.py)': [],
+}
+
+
+def seed(database_url, orders, lines):
+    engine = create_engine(database_url)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(SalesOrderHeader.__table__.insert(), [
+            {'id': order_id, 'order_number': f'ORD-LOAD-{order_id:06d}', 'customer_name': f'Customer {order_id % 50}',
+             'total': 100 + order_id, 'currency': 'USD', 'processing_status': 'completed', 'status': 'completed'}
+            for order_id in range(1, orders + 1)
+        ])
+        conn.execute(SalesOrderDetail.__table__.insert(), [
+            {'order_id': order_id, 'line_number': line, 'product_name': f'Product {line}', 'quantity': line,
+             'unit_price': 9.99, 'line_total': 9.99 * line}
+            for order_id in range(1, orders + 1) for line in range(1, lines + 1)
+        ])
+    engine.dispose()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(overrides, workdir, database_url, port):
+    env = dict(os.environ, DATABASE_URL=database_url, CELERY_BROKER_URL='memory://',
+               CELERY_RESULT_BACKEND='cache+memory://', OPENAI_API_KEY='load-test')
+    env.pop('TESTING', None)
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'ab')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn_config.py'),
+         '--bind', f'127.0.0.1:{port}', '--pythonpath', BACKEND_DIR, '--chdir', workdir,
+         '--access-logfile', os.devnull, *overrides, 'wsgi:app'],
+        env=env, stdout=log, stderr=log,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'gunicorn did not start; see {workdir}/gunicorn.log')
+
+
+def fast_client(port, orders, stop, latencies, errors):
+    rng = random.Random()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while not stop.is_set():
+        if rng.random() < 0.8:
+            path = f'/api/orders/{rng.randint(1, orders)}'
+        else:
+            path = '/api/orders?limit=20&include_line_items=false'
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise OSError(f'HTTP {response.status}')
+                latencies.append(time.perf_counter() - started)
+                break
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                # Retry once, like HTTP client libraries do when a recycled
+                # worker closed an idle keep-alive connection
+                if attempt:
+                    errors.append(path)
+
+
+def slow_uploader(port, upload_seconds, stop, completed):
+    chunks = 20
+    while not stop.is_set():
+        boundary = uuid.uuid4().hex
+        content = b'%PDF-1.4 load test ' + uuid.uuid4().bytes * 2048
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="slow.pdf"\r\n'
+                f'Content-Type: application/pdf\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+        size = len(body) // chunks + 1
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        try:
+            conn.putrequest('POST', '/api/upload')
+            conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+            conn.putheader('Content-Length', str(len(body)))
+            conn.endheaders()
+            for offset in range(0, len(body), size):
+                conn.send(body[offset:offset + size])
+                time.sleep(upload_seconds / chunks)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 202:
+                completed.append(1)
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+
+
+def run(port, args):
+    stop = threading.Event()
+    latencies, errors, uploads = [], [], []
+    threads = [threading.Thread(target=fast_client, args=(port, args.orders, stop, latencies, errors))
+               for _ in range(args.clients)]
+    threads += [threading.Thread(target=slow_uploader, args=(port, args.upload_seconds, stop, uploads))
+                for _ in range(args.slow_uploads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        'errors': len(errors),
+        'uploads': len(uploads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load per configuration')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent fast (read) clients')
+    parser.add_argument('--slow-uploads', type=int, default=4, help='concurrent slow uploaders')
+    parser.add_argument('--upload-seconds', type=float, default=5, help='time each upload body takes to send')
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--lines-per-order', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{args.clients} read clients, {args.slow_uploads} slow uploaders ({args.upload_seconds:g}s per upload), '
+          f'{args.duration:g}s per run, {multiprocessing.cpu_count()} CPUs')
+    results = {}
+    for name, overrides in CONFIGS.items():
+        workdir = tempfile.mkdtemp()
+        database_url = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+        seed(database_url, args.orders, args.lines_per_order)
+        port = free_port()
+        server = start_server(overrides, workdir, database_url, port)
+        try:
+            results[name] = run(port, args)
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print('\n| Workers | Requests/sec | p50 (ms) | p99 (ms) | Errors | Uploads completed |')
+    print('|---|---:|---:|---:|---:|---:|')
+    for name, result in results.items():
+        print(f"| {name} | {result['rps']:,.0f} | {result['p50']:.1f} | {result['p99']:.1f} | "
+              f"{result['errors']} | {result['uploads']} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+LLM extraction for documents of any length.
+
+Documents that fit in one chunk are extracted with a single call. Longer
+documents are split on line boundaries (lines longer than a chunk on
+whitespace) into token-bounded, slightly overlapping chunks; line items are
+extracted from every chunk while the header fields are extracted from the
+opening and closing sections only (where invoice numbers, parties and totals
+live). All calls are submitted to the LLM executor (llm_executor.py) at once,
+so they run concurrently within its in-flight cap and rate limits. The results
+are merged back into the usual JSON structure, with items repeated in the
+overlap between neighbouring chunks removed, so wall-clock time follows the
+slowest chunk rather than the sum of all of them.
+"""
+import json
+import math
+import os
+import re
+import time
+
+try:
+    import tiktoken
+except ImportError:  # Optional: exact token counts instead of an estimate
+    tiktoken = None
+
+CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', '3000'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('LLM_CHUNK_OVERLAP_TOKENS', '200'))
+HEADER_TOKENS = int(os.getenv('LLM_HEADER_TOKENS', '1500'))  # From each end of the document
+CHARS_PER_TOKEN = 4  # Estimate used when tiktoken is not installed
+
+SYSTEM_PROMPT = "You are a helpful assistant that extracts structured data from invoices. Always return valid JSON only."
+
+_LINE_ITEM_SCHEMA = """{{
+      "line_number": number,
+      "product_code": "string or null",
+      "product_name": "string or null",
+      "description": "string or null",
+      "quantity": number,
+      "unit_price": number,
+      "discount": number (default: 0),
+      "line_total": number
+    }}"""
+
+_HEADER_SCHEMA = """  "order_number": "string or null",
+  "invoice_number": "string or null",
+  "invoice_date": "YYYY-MM-DD or null",
+  "due_date": "YYYY-MM-DD or null",
+  "customer_name": "string or null",
+  "customer_address": "string or null",
+  "customer_email": "string or null",
+  "customer_phone": "string or null",
+  "subtotal": number or null,
+  "tax": number or null,
+  "total": number or null,
+  "currency": "string (default: USD)\""""
+
+FULL_PROMPT = """Extract invoice information from the following document text and return it as a JSON object with this exact structure:
+
+{{
+""" + _HEADER_SCHEMA + """,
+  "line_items": [
+    """ + _LINE_ITEM_SCHEMA + """
+  ]
+}}
+
+Document text:
+{text}
+
+Return ONLY valid JSON, no additional text or explanation."""
+
+HEADER_PROMPT = """The following text is the beginning and the end of a long invoice (the middle, which only contains line items, is omitted). Extract the invoice header and totals and return them as a JSON object with this exact structure:
+
+{{
+""" + _HEADER_SCHEMA + """
+}}
+
+Document text:
+{text}
+
+Return ONLY valid JSON, no additional text or explanation."""
+
+ITEMS_PROMPT = """The following text is part {part} of {parts} of a long invoice. Extract the line items that appear in this part and return them as a JSON object with this exact structure:
+
+{{
+  "line_items": [
+    """ + _LINE_ITEM_SCHEMA + """
+  ]
+}}
+
+The part may start or end in the middle of a line item: skip items whose quantity, price or total is cut off. Ignore subtotals, taxes and totals.
+
+Document text:
+{text}
+
+Return ONLY valid JSON, no additional text or explanation."""
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Token count of ``text`` (exact with tiktoken, otherwise ~4 chars per token)"""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('o200k_base')
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _cut(text, max_tokens):
+    """``text`` cut by characters into pieces of fewer than ``max_tokens``"""
+    pieces = []
+    while text:
+        size = min(len(text), max_tokens * CHARS_PER_TOKEN)
+        while size > 1 and estimate_tokens(text[:size]) >= max_tokens:
+            size = size * 3 // 4
+        pieces.append(text[:size])
+        text = text[size:]
+    return pieces
+
+
+def _fit_line(line, max_tokens):
+    """``line`` split on whitespace (or by characters) into pieces that fit a chunk"""
+    if estimate_tokens(line) < max_tokens:
+        return [line]
+    pieces, current = [], ''
+    for word in line.split():
+        for part in _cut(word, max_tokens):
+            candidate = f"{current} {part}" if current else part
+            if current and estimate_tokens(candidate) >= max_tokens:
+                pieces.append(current)
+                candidate = part
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _split_lines(text, max_tokens):
+    """Lines of ``text``, with lines too long for one chunk split up"""
+    return [piece for line in text.splitlines() for piece in _fit_line(line, max_tokens)]
+
+
+def _take_lines(lines, max_tokens):
+    """Leading lines of ``lines`` that fit in ``max_tokens`` (at least one)"""
+    taken, size = [], 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if taken and size + tokens > max_tokens:
+            break
+        taken.append(line)
+        size += tokens
+    return taken
+
+
+def chunk_text(text, max_tokens=None, overlap_tokens=None):
+    """Split ``text`` on line boundaries into chunks of at most ``max_tokens``.
+
+    Each chunk after the first repeats the last ``overlap_tokens`` of the
+    previous one so a line item cut at a boundary appears whole in one chunk.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    lines = _split_lines(text, max_tokens)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        taken = _take_lines(lines[start:], max_tokens)
+        chunks.append("\n".join(taken))
+        end = start + len(taken)
+        if end >= len(lines):
+            break
+        overlap = len(_take_lines(reversed(taken), overlap_tokens)) if overlap_tokens else 0
+        # Always move forward, even when a single line fills the overlap
+        start = max(end - overlap, start + 1) if overlap < len(taken) else end
+    return chunks
+
+
+def header_text(text, max_tokens=None):
+    """The opening and closing sections of a document, for header fields"""
+    max_tokens = max_tokens or HEADER_TOKENS
+    lines = _split_lines(text, max_tokens)
+    head = _take_lines(lines, max_tokens)
+    tail = list(reversed(_take_lines(reversed(lines[len(head):]), max_tokens)))
+    if len(head) + len(tail) < len(lines):
+        return "\n".join(head) + "\n[...]\n" + "\n".join(tail)
+    return "\n".join(head + tail)
+
+
+def _completion_request(model, prompt, max_tokens=2000):
+    """Keyword arguments of one chat completion for ``prompt``"""
+    return {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.1,
+        'max_tokens': max_tokens,
+    }
+
+
+def parse_json_response(response):
+    """Parse the JSON answer of a chat completion; returns (data, total_tokens)"""
+    content = response.choices[0].message.content.strip()
+    # Remove markdown code blocks if present
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    content = content.strip()
+
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        print(f"Response content: {content[:500]}")
+        raise
+    usage = getattr(response, 'usage', None)
+    tokens = getattr(usage, 'total_tokens', None)
+    return data, tokens if isinstance(tokens, int) else None
+
+
+def complete_json(client, model, prompt, max_tokens=2000):
+    """Run one chat completion and parse its JSON answer; returns (data, total_tokens)"""
+    return parse_json_response(client.chat.completions.create(**_completion_request(model, prompt, max_tokens)))
+
+
+def _normalize(value):
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower()
+
+
+def _item_key(item):
+    return tuple(_normalize(item.get(field)) for field in
+                 ('product_code', 'product_name', 'description', 'quantity', 'unit_price', 'line_total'))
+
+
+def merge_line_items(chunk_items):
+    """Concatenate per-chunk items in order, dropping the overlap duplicates.
+
+    Neighbouring chunks share a few lines, so the items at the start of a
+    chunk may repeat the items at the end of the previous one; only that
+    prefix/suffix is de-duplicated, genuine repeats elsewhere are kept.
+    """
+    merged = []
+    previous = []
+    for items in chunk_items:
+        items = [item for item in items or [] if isinstance(item, dict)]
+        previous_keys = [_item_key(item) for item in previous]
+        keys = [_item_key(item) for item in items]
+        overlap = next(
+            (size for size in range(min(len(previous_keys), len(keys)), 0, -1)
+             if previous_keys[-size:] == keys[:size]),
+            0
+        )
+        merged.extend(items[overlap:])
+        previous = items
+    return [dict(item, line_number=number) for number, item in enumerate(merged, start=1)]
+
+
+def extract_with_llm(client, model, text_content):
+    """Extract invoice data with one call, or chunked map-reduce for long documents.
+
+    ``client`` is the LLM executor: the header and chunk calls of a long
+    document are all submitted at once and their futures gathered.
+    Returns ``(data, total_tokens)``; total_tokens is None when the API did
+    not report usage.
+    """
+    chunks = chunk_text(text_content)
+    if len(chunks) <= 1:
+        return complete_json(client, model, FULL_PROMPT.format(text=text_content))
+
+    requests = [_completion_request(model, HEADER_PROMPT.format(text=header_text(text_content)), 1000)]
+    requests += [
+        _completion_request(model, ITEMS_PROMPT.format(part=part, parts=len(chunks), text=chunk))
+        for part, chunk in enumerate(chunks, start=1)
+    ]
+    futures = [client.submit(**request) for request in requests]
+    deadline = time.monotonic() + client.wait_timeout
+    try:
+        results = [
+            parse_json_response(future.result(timeout=max(0, deadline - time.monotonic())))
+            for future in futures
+        ]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    (header, header_tokens), results = results[0], results[1:]
+    data = {key: value for key, value in header.items() if key != 'line_items'}
+    data['line_items'] = merge_line_items(
+        items.get('line_items') if isinstance(items, dict) else items for items, _ in results
+    )
+    usage = [header_tokens] + [tokens for _, tokens in results]
+    total_tokens = sum(usage) if all(tokens is not None for tokens in usage) else None
+    return data, total_tokens
@@ -1,14 +1,30 @@
 # Gunicorn configuration file
 import multiprocessing
+import os
 
 bind = "0.0.0.0:5000"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+
+# Threaded workers: a slow upload, export or SSE stream occupies one thread,
+# not a whole process. Streams hold their thread for their whole duration
+# (SSE up to SSE_MAX_SECONDS), so app.py lets at most MAX_STREAMS_PER_WORKER
+# (default half of GUNICORN_THREADS) run at once per worker and answers
+# further ones with 503; the other threads stay free for short requests.
+# Raise GUNICORN_THREADS along with it if many clients watch progress at
+# once. Each thread uses at most one database connection, so
+# app.py sizes the SQLAlchemy pool from GUNICORN_THREADS; keep
+# workers * (threads + DB_MAX_OVERFLOW) below PostgreSQL's max_connections.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_class = "gthread"
 worker_connections = 1000
+# gthread workers heartbeat from their main thread, so long streamed
+# responses are not killed by the timeout
 timeout = 30
-keepalive = 2
-max_requests = 1000
-max_requests_jitter = 50
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers after about as many requests per thread as the former sync workers
+max_requests = 1000 * threads
+max_requests_jitter = 50 * threads
 preload_app = True
 
 # Logging
@@ -16,3 +32,14 @@ accesslog = "-"
 errorlog = "-"
 loglevel = "info"
 
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master (opened while preloading the app)"""
+    from app import app, db
+    from redis_client import reset_redis
+
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False: leave the parent's sockets alone, just stop using them
+            engine.dispose(close=False)
+    reset_redis()
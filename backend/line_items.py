@@ -0,0 +1,148 @@
+"""
+Bulk writes of invoice line items.
+
+Extracted invoices can carry hundreds of lines. Instead of building one ORM
+object per line, line items are written as plain rows in the caller's
+transaction: large invoices on PostgreSQL (psycopg2) are streamed with a
+single ``COPY ... FROM STDIN``, everything else uses one executemany INSERT,
+which SQLAlchemy sends as batched multi-row statements.
+"""
+import io
+import os
+from decimal import Decimal
+
+from sqlalchemy import insert
+
+from models import SalesOrderDetail
+
+# Below this many rows an executemany INSERT is as fast as COPY
+COPY_MIN_ROWS = int(os.getenv('LINE_ITEM_COPY_MIN_ROWS', '200'))
+
+COLUMNS = ('order_id', 'line_number', 'product_code', 'product_name', 'description',
+           'quantity', 'unit_price', 'discount', 'line_total')
+
+_table = SalesOrderDetail.__table__
+
+
+def line_item_rows(order_id, items):
+    """Rows for ``insert_line_items`` from extracted line item dicts"""
+    rows = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        row = {column: item.get(column) for column in COLUMNS}
+        row['order_id'] = order_id
+        if row['discount'] is None:
+            row['discount'] = 0
+        rows.append(row)
+    return rows
+
+
+def _csv_field(value):
+    if value is None:
+        return ''  # Unquoted empty field: NULL
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _csv_buffer(rows):
+    """CSV for COPY: NULL is an unquoted empty field, text is always quoted"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_csv_field(row[column]) for column in COLUMNS))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_rows(connection, rows):
+    """Stream ``rows`` with COPY on the connection's current transaction"""
+    statement = f"COPY {_table.name} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, _csv_buffer(rows))
+    finally:
+        cursor.close()
+
+
+def _supports_copy(connection):
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+
+def insert_line_items(connection, rows, copy_min_rows=None):
+    """Insert line item ``rows`` in one statement; returns the row count"""
+    if not rows:
+        return 0
+    copy_min_rows = COPY_MIN_ROWS if copy_min_rows is None else copy_min_rows
+    if len(rows) >= copy_min_rows and _supports_copy(connection):
+        _copy_rows(connection, rows)
+    else:
+        connection.execute(insert(_table), rows)
+    return len(rows)
+
+
+# Fields a client may change on a stored line item
+EDITABLE_FIELDS = COLUMNS[1:]
+
+
+def _same(stored, submitted):
+    if isinstance(stored, Decimal) or isinstance(submitted, (int, float)):
+        # to_dict() reports zero amounts as null, so clients send them back that way
+        stored = stored or 0
+        submitted = submitted or 0
+    if stored is None or submitted is None:
+        return stored is submitted
+    if isinstance(stored, Decimal):
+        try:
+            return stored == Decimal(str(submitted))
+        except ArithmeticError:
+            return False
+    return stored == submitted
+
+
+def diff_line_items(existing, items):
+    """Match a submitted list of line items against the stored ones.
+
+    ``items`` is the complete new list. Each entry is matched to a stored
+    line by ``id``, otherwise by ``line_number``; unmatched entries are new.
+    Returns ``(inserts, updates, deletes)``: item dicts to insert,
+    ``(line, changes)`` pairs with only the fields whose value differs, and
+    the stored lines missing from ``items``. Raises ValueError for an
+    ``id`` that is not one of ``existing`` or that appears twice.
+    """
+    by_id = {line.id: line for line in existing}
+    matches = [None] * len(items)
+    matched = set()
+    for index, item in enumerate(items):
+        line_id = item.get('id')
+        if line_id is None:
+            continue
+        if line_id not in by_id:
+            raise ValueError(f"Line item {line_id} does not belong to this order")
+        if line_id in matched:
+            raise ValueError(f"Line item {line_id} appears more than once")
+        matches[index] = by_id[line_id]
+        matched.add(line_id)
+
+    # Items without an id take the first unclaimed line with their line_number
+    by_number = {}
+    for line in existing:
+        if line.id not in matched and line.line_number is not None:
+            by_number.setdefault(line.line_number, []).append(line)
+    for index, item in enumerate(items):
+        if matches[index] is None and item.get('id') is None and by_number.get(item.get('line_number')):
+            matches[index] = by_number[item['line_number']].pop(0)
+            matched.add(matches[index].id)
+
+    inserts, updates = [], []
+    for item, line in zip(items, matches):
+        if line is None:
+            inserts.append(item)
+            continue
+        changes = {field: item[field] for field in EDITABLE_FIELDS
+                   if field in item and not _same(getattr(line, field), item[field])}
+        if changes:
+            updates.append((line, changes))
+    deletes = [line for line in existing if line.id not in matched]
+    return inserts, updates, deletes
@@ -0,0 +1,217 @@
+"""
+Content-hash keyed cache for LLM extraction results.
+
+Lookups go through a small in-process LRU first and then Redis. Redis entries
+expire after a TTL and the total number of entries is capped: a sorted set
+tracks insertion time so the oldest entries are evicted once the cap is
+exceeded. Hit/miss counters (and the LLM latency/tokens saved by hits) are
+kept both per process and, when Redis is available, across all workers.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import redis
+
+from redis_client import get_redis
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Collapse whitespace so cosmetic differences don't defeat the cache"""
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def make_cache_key(text, prompt_version, model):
+    """Build the cache key from the document text, prompt version and model"""
+    digest = hashlib.sha256()
+    digest.update(f"{model}\x00{prompt_version}\x00".encode('utf-8'))
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LLMExtractionCache:
+    """Two-level (local LRU + Redis) cache of extraction results"""
+
+    def __init__(self, namespace='llm_cache', local_size=256, ttl_seconds=7 * 24 * 3600,
+                 max_entries=50000, redis_getter=get_redis):
+        self.namespace = namespace
+        self.local_size = local_size
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._redis_getter = redis_getter
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters():
+        return {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'llm_seconds_saved': 0.0,
+            'tokens_saved': 0,
+        }
+
+    def _entry_key(self, key):
+        return f"{self.namespace}:entry:{key}"
+
+    @property
+    def _index_key(self):
+        return f"{self.namespace}:index"
+
+    @property
+    def _stats_key(self):
+        return f"{self.namespace}:stats"
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def _remember_local(self, key, payload):
+        with self._lock:
+            self._local[key] = payload
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _record(self, counter, entry=None):
+        latency = float(entry.get('latency') or 0) if entry else 0.0
+        tokens = int(entry.get('tokens') or 0) if entry else 0
+        with self._lock:
+            self._counters[counter] += 1
+            self._counters['llm_seconds_saved'] += latency
+            self._counters['tokens_saved'] += tokens
+
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hincrby(self._stats_key, counter, 1)
+            if latency:
+                pipe.hincrbyfloat(self._stats_key, 'llm_seconds_saved', latency)
+            if tokens:
+                pipe.hincrby(self._stats_key, 'tokens_saved', tokens)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Warning: could not update LLM cache stats in Redis: {e}")
+
+    def get(self, key):
+        """Return the cached extraction for ``key`` or None"""
+        with self._lock:
+            payload = self._local.get(key)
+            if payload is not None:
+                self._local.move_to_end(key)
+
+        if payload is not None:
+            entry = json.loads(payload)
+            self._record('local_hits', entry)
+            return entry['data']
+
+        client = self._redis()
+        if client is not None:
+            try:
+                payload = client.get(self._entry_key(key))
+            except redis.RedisError as e:
+                print(f"Warning: LLM cache lookup failed: {e}")
+                payload = None
+            if payload is not None:
+                payload = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+                self._remember_local(key, payload)
+                entry = json.loads(payload)
+                self._record('redis_hits', entry)
+                return entry['data']
+
+        self._record('misses')
+        return None
+
+    def set(self, key, data, latency=None, tokens=None):
+        """Store an extraction result along with what it cost to produce"""
+        payload = json.dumps({'data': data, 'latency': latency, 'tokens': tokens})
+        self._remember_local(key, payload)
+
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            score = client.time()[0]
+            pipe = client.pipeline(transaction=False)
+            pipe.set(self._entry_key(key), payload, ex=self.ttl_seconds)
+            pipe.zadd(self._index_key, {key: score})
+            # Entries expire on their own; drop index members older than the TTL
+            pipe.zremrangebyscore(self._index_key, '-inf', score - self.ttl_seconds)
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = client.zpopmin(self._index_key, size - self.max_entries)
+                if evicted:
+                    client.delete(*[self._entry_key(_decode(member)) for member, _ in evicted])
+        except redis.RedisError as e:
+            print(f"Warning: could not store LLM cache entry in Redis: {e}")
+
+    def stats(self):
+        """Hit/miss counters, cluster-wide when Redis is available"""
+        with self._lock:
+            counters = dict(self._counters)
+            local_entries = len(self._local)
+        scope = 'process'
+
+        client = self._redis()
+        if client is not None:
+            try:
+                shared = client.hgetall(self._stats_key)
+                counters = self._empty_counters()
+                for name, value in shared.items():
+                    name = _decode(name)
+                    if name in counters:
+                        counters[name] = type(counters[name])(float(_decode(value)))
+                scope = 'cluster'
+            except redis.RedisError as e:
+                print(f"Warning: could not read LLM cache stats from Redis: {e}")
+
+        hits = counters['local_hits'] + counters['redis_hits']
+        lookups = hits + counters['misses']
+        return {
+            'scope': scope,
+            'hits': hits,
+            'local_hits': counters['local_hits'],
+            'redis_hits': counters['redis_hits'],
+            'misses': counters['misses'],
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'llm_seconds_saved': round(counters['llm_seconds_saved'], 3),
+            'tokens_saved': counters['tokens_saved'],
+            'local_entries': local_entries,
+        }
+
+    def clear(self, include_redis=False):
+        """Forget local entries and counters (and optionally the Redis data)"""
+        with self._lock:
+            self._local.clear()
+            self._counters = self._empty_counters()
+        if not include_redis:
+            return
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            members = client.zrange(self._index_key, 0, -1)
+            keys = [self._entry_key(_decode(m)) for m in members]
+            client.delete(self._index_key, self._stats_key, *keys)
+        except redis.RedisError as e:
+            print(f"Warning: could not clear LLM cache in Redis: {e}")
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+extraction_cache = LLMExtractionCache(
+    local_size=int(os.getenv('LLM_CACHE_LOCAL_SIZE', '256')),
+    ttl_seconds=int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '50000')),
+)
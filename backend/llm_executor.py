@@ -0,0 +1,162 @@
+"""
+Asyncio executor for LLM requests.
+
+Each worker process runs one event loop in a background thread with a single
+``AsyncOpenAI`` client. Any thread (Celery task threads, the chunked
+extraction fan-out) hands requests to that loop, which keeps up to
+``max_in_flight`` of them open concurrently instead of blocking a process per
+request. Every request first draws from the shared rate limiter; 429s and
+transient API errors are retried with the pause the provider announced in
+its headers (or exponential backoff), and that pause is shared with every
+other caller through the limiter.
+
+``LLMExecutor`` also exposes the synchronous ``chat.completions.create``
+surface of the regular client, so existing callers use it unchanged. Callers
+wait at most ``wait_timeout`` (every attempt timing out and pausing), and
+``close()`` (e.g. on a settings reload) cancels the requests still pending,
+so no waiting thread is left hanging.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from types import SimpleNamespace
+
+import openai
+from openai import AsyncOpenAI
+
+from chunked_extraction import estimate_tokens
+from rate_limiter import RateLimiter, backoff_from_headers, exponential_backoff
+
+MAX_PAUSE_SECONDS = 60.0  # Longest retry backoff, and the rate limiter's window
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.InternalServerError,
+)
+
+
+def _request_tokens(kwargs):
+    """Upper bound of the tokens a request will use: prompt plus completion budget"""
+    prompt = "\n".join(str(message.get('content', '')) for message in kwargs.get('messages', []))
+    return estimate_tokens(prompt) + int(kwargs.get('max_tokens') or 0)
+
+
+async def _cancel_pending():
+    """Cancel every other task on the running loop and wait for them to finish"""
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class LLMExecutor:
+    """Process-wide event loop that runs rate-limited LLM requests concurrently"""
+
+    def __init__(self, client_factory, limiter, max_in_flight=8, max_retries=5, request_timeout=60.0):
+        self._client_factory = client_factory
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        # Longest a caller of create() waits: every attempt times out after a full pause
+        self.wait_timeout = (max_retries + 1) * (request_timeout + MAX_PAUSE_SECONDS)
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        # Same call shape as openai.OpenAI: executor.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build an executor from the cached settings (see settings.py)"""
+        limiter = RateLimiter(settings.llm_requests_per_minute, settings.llm_tokens_per_minute)
+        return cls(
+            lambda: AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout,
+                max_retries=0  # Retries go through the shared limiter instead
+            ),
+            limiter,
+            max_in_flight=settings.llm_max_in_flight,
+            max_retries=settings.openai_max_retries,
+            request_timeout=settings.openai_timeout,
+        )
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='llm-executor', daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    async def _request(self, kwargs):
+        if self._client is None:
+            self._client = self._client_factory()
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        estimated = _request_tokens(kwargs)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            try:
+                async with self._semaphore:
+                    raw = await self._client.chat.completions.with_raw_response.create(**kwargs)
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                response = getattr(e, 'response', None)
+                delay = (backoff_from_headers(getattr(response, 'headers', None))
+                         or exponential_backoff(attempt, maximum=MAX_PAUSE_SECONDS))
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                if isinstance(e, openai.RateLimitError):
+                    await self.limiter.block_for_async(delay)
+                await asyncio.sleep(delay)
+                continue
+
+            # Pause everyone early when the provider reports an exhausted budget
+            await self.limiter.block_for_async(backoff_from_headers(raw.headers))
+            response = raw.parse()
+            used = getattr(getattr(response, 'usage', None), 'total_tokens', None)
+            if isinstance(used, int):
+                await self.limiter.refund_async(estimated - used)
+            return response
+
+    def submit(self, **kwargs):
+        """Schedule a chat completion; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._request(kwargs), self._ensure_loop())
+
+    def create(self, **kwargs):
+        """Run a chat completion on the executor and wait for the response.
+        
+        Raises TimeoutError after ``wait_timeout`` seconds and CancelledError
+        if the executor is closed meanwhile.
+        """
+        future = self.submit(**kwargs)
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        """Cancel pending requests, close the HTTP client and stop the loop thread"""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = self._semaphore = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(_cancel_pending(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"Warning: could not cancel pending LLM requests: {e}")
+        if client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+            except Exception as e:
+                print(f"Warning: could not close LLM client cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
@@ -0,0 +1,63 @@
+"""Initial schema (tables previously created by db.create_all())
+
+Revision ID: 0001_initial
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'sales_order_header',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_number', sa.String(length=100), nullable=False),
+        sa.Column('invoice_number', sa.String(length=100), nullable=True),
+        sa.Column('invoice_date', sa.Date(), nullable=True),
+        sa.Column('due_date', sa.Date(), nullable=True),
+        sa.Column('customer_name', sa.String(length=200), nullable=True),
+        sa.Column('customer_address', sa.Text(), nullable=True),
+        sa.Column('customer_email', sa.String(length=200), nullable=True),
+        sa.Column('customer_phone', sa.String(length=50), nullable=True),
+        sa.Column('subtotal', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('tax', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('total', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('currency', sa.String(length=10), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('processing_status', sa.String(length=50), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('file_path', sa.String(length=500), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('order_number')
+    )
+    op.create_table(
+        'sales_order_detail',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('line_number', sa.Integer(), nullable=True),
+        sa.Column('product_code', sa.String(length=100), nullable=True),
+        sa.Column('product_name', sa.String(length=200), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('quantity', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('discount', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('line_total', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['sales_order_header.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('sales_order_detail')
+    op.drop_table('sales_order_header')
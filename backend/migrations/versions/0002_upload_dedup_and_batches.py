@@ -0,0 +1,32 @@
+"""Add content hash and batch id to order headers
+
+Revision ID: 0002_upload_dedup
+Revises: 0001_initial
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_upload_dedup'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=36), nullable=True))
+        batch_op.create_index(batch_op.f('ix_sales_order_header_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_sales_order_header_batch_id'), ['batch_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sales_order_header_batch_id'))
+        batch_op.drop_index(batch_op.f('ix_sales_order_header_content_hash'))
+        batch_op.drop_column('batch_id')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,33 @@
+"""Add composite indexes for order listing and line item lookups
+
+Revision ID: 0003_query_indexes
+Revises: 0002_upload_dedup
+Create Date: 2026-10-17 09:20:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_query_indexes'
+down_revision = '0002_upload_dedup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.create_index('ix_sales_order_header_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_sales_order_header_processing_status_created_at', ['processing_status', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('sales_order_detail', schema=None) as batch_op:
+        batch_op.create_index('ix_sales_order_detail_order_id_line_number', ['order_id', 'line_number'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sales_order_detail', schema=None) as batch_op:
+        batch_op.drop_index('ix_sales_order_detail_order_id_line_number')
+
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.drop_index('ix_sales_order_header_processing_status_created_at')
+        batch_op.drop_index('ix_sales_order_header_created_at_id')
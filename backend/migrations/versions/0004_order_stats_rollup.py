@@ -0,0 +1,35 @@
+"""Add order_stats rollup table backing /api/stats
+
+Revision ID: 0004_order_stats
+Revises: 0003_query_indexes
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_order_stats'
+down_revision = '0003_query_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_stats',
+        sa.Column('slot', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('total_orders', sa.BigInteger(), nullable=False),
+        sa.Column('total_value', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('slot')
+    )
+    # Backfill from the existing orders
+    op.execute(
+        "INSERT INTO order_stats (slot, total_orders, total_value) "
+        "SELECT 0, COUNT(*), COALESCE(SUM(total), 0) FROM sales_order_header"
+    )
+
+
+def downgrade():
+    op.drop_table('order_stats')
@@ -0,0 +1,46 @@
+"""Add order_daily_rollup backing /api/analytics
+
+Revision ID: 0005_daily_rollup
+Revises: 0004_order_stats
+Create Date: 2026-10-17 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_daily_rollup'
+down_revision = '0004_order_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_daily_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('customer', sa.String(length=200), nullable=False),
+        sa.Column('currency', sa.String(length=10), nullable=False),
+        sa.Column('order_count', sa.BigInteger(), nullable=False),
+        sa.Column('total_value', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'customer', 'currency')
+    )
+    with op.batch_alter_table('order_daily_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_order_daily_rollup_customer_day', ['customer', 'day'], unique=False)
+
+    # Backfill from the existing completed orders
+    op.execute(
+        "INSERT INTO order_daily_rollup (day, customer, currency, order_count, total_value) "
+        "SELECT COALESCE(invoice_date, DATE(created_at)), COALESCE(customer_name, ''), "
+        "COALESCE(currency, 'USD'), COUNT(*), COALESCE(SUM(total), 0) "
+        "FROM sales_order_header WHERE processing_status = 'completed' "
+        "GROUP BY COALESCE(invoice_date, DATE(created_at)), COALESCE(customer_name, ''), COALESCE(currency, 'USD')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('order_daily_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_daily_rollup_customer_day')
+
+    op.drop_table('order_daily_rollup')
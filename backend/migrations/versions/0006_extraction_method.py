@@ -0,0 +1,28 @@
+"""Record which extractor produced an order
+
+Revision ID: 0006_extraction_method
+Revises: 0005_daily_rollup
+Create Date: 2026-10-17 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_extraction_method'
+down_revision = '0005_daily_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extraction_method', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('extraction_confidence', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.drop_column('extraction_confidence')
+        batch_op.drop_column('extraction_method')
@@ -0,0 +1,35 @@
+"""Add vendor_template for learned invoice layouts
+
+Revision ID: 0007_vendor_template
+Revises: 0006_extraction_method
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_vendor_template'
+down_revision = '0006_extraction_method'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'vendor_template',
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('template', sa.JSON(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('hit_count', sa.Integer(), nullable=False),
+        sa.Column('failure_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('fingerprint')
+    )
+
+
+def downgrade():
+    op.drop_table('vendor_template')
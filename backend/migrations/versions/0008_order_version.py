@@ -0,0 +1,26 @@
+"""Optimistic concurrency version for orders
+
+Revision ID: 0008_order_version
+Revises: 0007_vendor_template
+Create Date: 2026-10-17 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_order_version'
+down_revision = '0007_vendor_template'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,36 @@
+"""Add export_watermark and the updated_at index for incremental exports
+
+Revision ID: 0009_export_watermark
+Revises: 0008_order_version
+Create Date: 2026-10-17 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_export_watermark'
+down_revision = '0008_order_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'export_watermark',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        sa.Column('last_run_orders', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.create_index('ix_sales_order_header_updated_at_id', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sales_order_header', schema=None) as batch_op:
+        batch_op.drop_index('ix_sales_order_header_updated_at_id')
+    op.drop_table('export_watermark')
@@ -0,0 +1,49 @@
+"""Add the order_search full-text index (PostgreSQL)
+
+Revision ID: 0010_order_search
+Revises: 0009_export_watermark
+Create Date: 2026-10-17 10:30:00.000000
+
+The search table depends on the database (tsvector + GIN here, an FTS5
+virtual table on SQLite), so it is not part of the models; see search.py.
+Only PostgreSQL is migrated; SQLite gets its FTS5 table from create_all.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_order_search'
+down_revision = '0009_export_watermark'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("""
+        CREATE TABLE order_search (
+            order_id INTEGER PRIMARY KEY REFERENCES sales_order_header (id) ON DELETE CASCADE,
+            document TSVECTOR NOT NULL
+        )
+    """)
+    op.execute("CREATE INDEX ix_order_search_document ON order_search USING gin (document)")
+    # Backfill existing orders
+    op.execute("""
+        INSERT INTO order_search (order_id, document)
+        SELECT h.id,
+            setweight(to_tsvector('simple', coalesce(h.invoice_number, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(h.customer_name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(h.customer_address, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(string_agg(
+                coalesce(d.product_name, '') || ' ' || coalesce(d.description, ''), ' '), '')), 'C')
+        FROM sales_order_header h
+        LEFT JOIN sales_order_detail d ON d.order_id = h.id
+        GROUP BY h.id
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_table('order_search')
@@ -6,6 +6,14 @@ db = SQLAlchemy()
 
 class SalesOrderHeader(db.Model):
     __tablename__ = 'sales_order_header'
+    __table_args__ = (
+        # GET /api/orders sorts and pages on (created_at, id)
+        db.Index('ix_sales_order_header_created_at_id', 'created_at', 'id'),
+        # Status-filtered listings (and worker/dashboard status lookups)
+        db.Index('ix_sales_order_header_processing_status_created_at', 'processing_status', 'created_at', 'id'),
+        # Incremental warehouse exports read changed orders in (updated_at, id) order
+        db.Index('ix_sales_order_header_updated_at_id', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(100), unique=True, nullable=False)
@@ -25,13 +33,22 @@ class SalesOrderHeader(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     file_path = db.Column(db.String(500))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the uploaded file
+    batch_id = db.Column(db.String(36), index=True)  # Set for orders created by a bulk upload
+    extraction_method = db.Column(db.String(20))  # rules, template, llm
+    extraction_confidence = db.Column(db.Float)  # Rule-based score of the result (rules and template paths)
     error_message = db.Column(db.Text)
+    # Bumped on every UPDATE of the row; an UPDATE based on a stale version
+    # raises StaleDataError (optimistic concurrency for PUT /api/orders/<id>)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationship
     line_items = db.relationship('SalesOrderDetail', backref='order', cascade='all, delete-orphan', lazy=True)
     
-    def to_dict(self):
-        return {
+    __mapper_args__ = {'version_id_col': version}
+    
+    def to_dict(self, include_line_items=True):
+        data = {
             'id': self.id,
             'order_number': self.order_number,
             'invoice_number': self.invoice_number,
@@ -50,13 +67,24 @@ class SalesOrderHeader(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'file_path': self.file_path,
+            'content_hash': self.content_hash,
+            'batch_id': self.batch_id,
+            'extraction_method': self.extraction_method,
+            'extraction_confidence': self.extraction_confidence,
             'error_message': self.error_message,
-            'line_items': [item.to_dict() for item in self.line_items]
+            'version': self.version,
         }
+        if include_line_items:
+            data['line_items'] = [item.to_dict() for item in self.line_items]
+        return data
 
 
 class SalesOrderDetail(db.Model):
     __tablename__ = 'sales_order_detail'
+    __table_args__ = (
+        # Line items are always fetched (and replaced) per order, in line order
+        db.Index('ix_sales_order_detail_order_id_line_number', 'order_id', 'line_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('sales_order_header.id'), nullable=False)
@@ -83,3 +111,81 @@ class SalesOrderDetail(db.Model):
             'line_total': float(self.line_total) if self.line_total else None
         }
 
+
+
+class OrderStats(db.Model):
+    """Running totals behind /api/stats, kept in sync by rollups.py.
+    
+    Writers increment one of several slots chosen at random so concurrent
+    transactions don't all queue on a single hot row; readers sum the slots.
+    """
+    __tablename__ = 'order_stats'
+    
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total_orders = db.Column(db.BigInteger, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+
+
+class OrderDailyRollup(db.Model):
+    """Completed order count and value per day, customer and currency.
+    
+    Maintained incrementally by rollups.py; the day is the invoice date, or
+    the upload date when the invoice has none.
+    """
+    __tablename__ = 'order_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_order_daily_rollup_customer_day', 'customer', 'day'),
+    )
+    
+    day = db.Column(db.Date, primary_key=True)
+    customer = db.Column(db.String(200), primary_key=True)  # '' when unknown
+    currency = db.Column(db.String(10), primary_key=True)
+    order_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+
+
+class VendorTemplate(db.Model):
+    """Field positions learned for one invoice layout (see vendor_templates.py).
+    
+    Keyed by the fingerprint of the document's label sequence; deactivated
+    when an applied template fails validation.
+    """
+    __tablename__ = 'vendor_template'
+    
+    fingerprint = db.Column(db.String(64), primary_key=True)
+    template = db.Column(db.JSON, nullable=False)
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'labels': self.template.get('labels', []),
+            'fields': sorted(self.template.get('fields', {})),
+            'line_items': (self.template.get('line_items') or {}).get('mode'),
+            'is_active': self.is_active,
+            'hit_count': self.hit_count,
+            'failure_count': self.failure_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+        }
+
+
+class ExportWatermark(db.Model):
+    """How far an incremental export has read (see warehouse_export.py).
+    
+    Orders are exported in ``(updated_at, id)`` order; the watermark is the
+    sort key of the last exported order, so the next run starts after it.
+    """
+    __tablename__ = 'export_watermark'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)
+    last_run_at = db.Column(db.DateTime)
+    last_run_orders = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,190 @@
+"""
+Collision-free order numbers.
+
+Order numbers used to be ``ORD-<YYYYmmddHHMMSS>``, unique only to the second:
+two uploads in the same second hit the unique constraint. They are now
+Snowflake-style 63-bit ids, allocated in memory without a database or Redis
+round trip:
+
+    41 bits  milliseconds since ORDER_NUMBER_EPOCH (2024-01-01, ~69 years)
+    10 bits  node id (one per process, 0-1023)
+    12 bits  sequence within the millisecond (4096 per node per ms)
+
+and written as ``ORD-`` plus 13 Crockford base32 characters, so numbers sort
+by allocation time.
+
+Uniqueness across gunicorn and Celery processes comes from the node id:
+
+* ``ORDER_NODE_ID`` if set (the operator guarantees it is unique per process);
+* otherwise a lease in Redis: the process claims ``order_numbers:node:<n>``
+  (SET NX with ``ORDER_NODE_LEASE_SECONDS``) for the first free ``n`` after
+  an INCR'd counter, and renews it while allocating. A process that lost its
+  lease (e.g. paused past the TTL) claims a new node before allocating again;
+* without Redis (tests, local runs) a random node id.
+
+Forked children (gunicorn ``preload_app``, Celery prefork) drop the parent's
+node and claim their own. If the clock goes backwards, or a node allocates
+more than 4096 numbers in a millisecond, it keeps counting from its last
+timestamp instead of waiting, so numbers never repeat.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import redis
+
+from redis_client import get_redis
+
+ORDER_NUMBER_PREFIX = 'ORD-'
+ORDER_NUMBER_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+ORDER_NODE_LEASE_SECONDS = int(os.getenv('ORDER_NODE_LEASE_SECONDS', '600'))
+
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODES = 1 << NODE_BITS
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+_EPOCH_MS = int(ORDER_NUMBER_EPOCH.timestamp() * 1000)
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+_WIDTH = 13
+
+# Extend the lease only if this process still owns it
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def format_order_number(value):
+    chars = []
+    for _ in range(_WIDTH):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return ORDER_NUMBER_PREFIX + ''.join(reversed(chars))
+
+
+def order_number_parts(order_number):
+    """Return ``(allocated_at, node_id, sequence)`` of a generated order number"""
+    if not order_number.startswith(ORDER_NUMBER_PREFIX):
+        raise ValueError(f"Not a generated order number: {order_number}")
+    value = 0
+    for char in order_number[len(ORDER_NUMBER_PREFIX):]:
+        value = value * 32 + _ALPHABET.index(char)
+    millis = value >> (NODE_BITS + SEQUENCE_BITS)
+    allocated_at = datetime.fromtimestamp((_EPOCH_MS + millis) / 1000, tz=timezone.utc)
+    return allocated_at, (value >> SEQUENCE_BITS) & (MAX_NODES - 1), value & MAX_SEQUENCE
+
+
+class OrderNumberGenerator:
+    """Time + node + sequence order numbers, unique across processes"""
+
+    def __init__(self, namespace='order_numbers', node_id=None, lease_seconds=ORDER_NODE_LEASE_SECONDS,
+                 redis_getter=get_redis, clock=time.time):
+        self.namespace = namespace
+        self.lease_seconds = lease_seconds
+        self._fixed_node_id = node_id
+        self._redis_getter = redis_getter
+        self._clock = clock
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._node_id = None
+        self._lease_token = None
+        self._lease_renewed_at = 0.0
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _node_key(self, node_id):
+        return f"{self.namespace}:node:{node_id}"
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def _claim_node(self):
+        """Pick this process's node id; called with the lock held"""
+        if self._fixed_node_id is not None:
+            return int(self._fixed_node_id) % MAX_NODES
+        env_node_id = os.getenv('ORDER_NODE_ID')
+        if env_node_id:
+            return int(env_node_id) % MAX_NODES
+
+        client = self._redis()
+        if client is not None:
+            token = uuid.uuid4().hex
+            try:
+                start = client.incr(f"{self.namespace}:node_counter")
+                for offset in range(MAX_NODES):
+                    node_id = (start + offset) % MAX_NODES
+                    if client.set(self._node_key(node_id), token, nx=True, ex=self.lease_seconds):
+                        self._lease_token = token
+                        self._lease_renewed_at = self._clock()
+                        return node_id
+                print(f"Warning: all {MAX_NODES} order number nodes are leased; using a random node id")
+            except redis.RedisError as e:
+                print(f"Warning: could not lease an order number node id: {e}")
+        return random.randrange(MAX_NODES)
+
+    def _ensure_node(self):
+        """Claim a node, or renew the lease before a third of it has passed"""
+        if self._node_id is None:
+            self._node_id = self._claim_node()
+            return
+        if self._lease_token is None or self._clock() - self._lease_renewed_at < self.lease_seconds / 3:
+            return
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            renewed = client.eval(_RENEW_SCRIPT, 1, self._node_key(self._node_id),
+                                  self._lease_token, self.lease_seconds)
+        except redis.RedisError as e:
+            print(f"Warning: could not renew the order number node lease: {e}")
+            return
+        if renewed:
+            self._lease_renewed_at = self._clock()
+        else:
+            # Another process may own this node now
+            self._lease_token = None
+            self._node_id = self._claim_node()
+
+    @property
+    def node_id(self):
+        with self._lock:
+            self._ensure_node()
+            return self._node_id
+
+    def allocate(self, count=1):
+        """Return ``count`` new order numbers, in increasing order"""
+        with self._lock:
+            self._ensure_node()
+            node = self._node_id << SEQUENCE_BITS
+            numbers = []
+            for _ in range(count):
+                now_ms = int(self._clock() * 1000) - _EPOCH_MS
+                if now_ms > self._last_ms:
+                    self._last_ms, self._sequence = now_ms, 0
+                elif self._sequence < MAX_SEQUENCE:
+                    self._sequence += 1
+                else:
+                    # Sequence exhausted (or clock went back): borrow the next millisecond
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+                numbers.append(format_order_number(
+                    (self._last_ms << (NODE_BITS + SEQUENCE_BITS)) | node | self._sequence
+                ))
+            return numbers
+
+    def next(self):
+        """Return one new order number"""
+        return self.allocate(1)[0]
+
+
+order_numbers = OrderNumberGenerator()
+
+# Forked children must not reuse the parent's node id or sequence
+os.register_at_fork(after_in_child=order_numbers._reset)
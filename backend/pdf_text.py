@@ -0,0 +1,135 @@
+"""
+PDF text extraction.
+
+Pages are produced lazily so extraction can stop as soon as enough text has
+been collected for the LLM budget. Long documents can be fanned out across a
+process pool in page ranges; results are consumed in page order with a
+bounded number of ranges in flight, and the text is joined once at the end.
+"""
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', '1'))  # 1 = serial
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '16'))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _page_text(page):
+    return (page.extract_text() or '') + "\n"
+
+
+def iter_pdf_pages(file_path, start=0, stop=None):
+    """Yield the text of each page (with a trailing newline), lazily"""
+    with open(file_path, 'rb') as file:
+        pages = PyPDF2.PdfReader(file).pages
+        stop = len(pages) if stop is None else min(stop, len(pages))
+        for index in range(start, stop):
+            yield _page_text(pages[index])
+
+
+def extract_page_range(file_path, start, stop):
+    """Extract pages [start, stop) - runs inside pool worker processes"""
+    return "".join(iter_pdf_pages(file_path, start, stop))
+
+
+def count_pages(file_path):
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _get_pool(workers):
+    """Process pool shared by all extractions in this process"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn: workers only import this module, and forking a process
+            # that runs threads (gunicorn, Celery) is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the worker processes (e.g. on worker shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _extract_serial(file_path, max_chars):
+    parts = []
+    size = 0
+    for text in iter_pdf_pages(file_path):
+        parts.append(text)
+        size += len(text)
+        if max_chars and size >= max_chars:
+            break
+    return parts
+
+
+def _extract_parallel(file_path, page_count, max_chars, workers, pages_per_task):
+    pool = _get_pool(workers)
+    ranges = deque(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    in_flight = deque()
+    parts = []
+    size = 0
+    try:
+        while ranges or in_flight:
+            # Keep a bounded window of page ranges queued, in page order
+            while ranges and len(in_flight) < workers * 2:
+                start, stop = ranges.popleft()
+                in_flight.append(pool.submit(extract_page_range, file_path, start, stop))
+            text = in_flight.popleft().result()
+            parts.append(text)
+            size += len(text)
+            if max_chars and size >= max_chars:
+                break
+    finally:
+        for future in in_flight:
+            future.cancel()
+    return parts
+
+
+def extract_pdf_text(file_path, max_chars=None, workers=None, pages_per_task=None):
+    """Extract the text of a PDF, stopping once ``max_chars`` are collected.
+
+    With ``workers`` > 1 and at least PDF_PARALLEL_MIN_PAGES pages, page
+    ranges are extracted in a process pool. Daemonic processes (e.g. Celery
+    prefork children) cannot start a pool, so they fall back to serial
+    extraction.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+
+    parts = None
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        page_count = count_pages(file_path)
+        if page_count >= PDF_PARALLEL_MIN_PAGES:
+            try:
+                parts = _extract_parallel(file_path, page_count, max_chars, workers, pages_per_task)
+            except (BrokenProcessPool, AssertionError, OSError) as e:
+                print(f"Parallel PDF extraction unavailable, falling back to serial: {e}")
+                shutdown_pool()
+                parts = None
+    if parts is None:
+        parts = _extract_serial(file_path, max_chars)
+
+    text = "".join(parts)
+    return text[:max_chars] if max_chars else text
@@ -0,0 +1,121 @@
+"""
+Processing progress events.
+
+Pipeline stages report what they are doing (parsing, extracting, persisting)
+and how they finished (completed, failed). Each event is published on a Redis
+pub/sub channel for the order and, for bulk uploads, one for its batch; the
+latest event per order is also kept for a while so a client that subscribes
+late still sees the current stage. The Server-Sent Events endpoints in app.py
+relay these channels to browsers, which replaces polling the orders API.
+
+Without Redis, events are dropped and the SSE endpoints fall back to the
+order rows in the database.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+import redis
+
+from redis_client import get_redis
+
+PROGRESS_TTL_SECONDS = int(os.getenv('PROGRESS_TTL_SECONDS', '3600'))
+
+STAGE_MESSAGES = {
+    'queued': 'Waiting to be processed',
+    'parsing': 'Reading document text',
+    'extracting': 'Extracting invoice fields',
+    'persisting': 'Saving extracted order',
+    'completed': 'Invoice processed successfully',
+    'failed': 'Processing failed',
+}
+TERMINAL_STAGES = ('completed', 'failed')
+
+
+def order_channel(order_id):
+    return f"progress:order:{order_id}"
+
+
+def batch_channel(batch_id):
+    return f"progress:batch:{batch_id}"
+
+
+def _latest_key(order_id):
+    return f"progress:latest:{order_id}"
+
+
+def publish_progress(order_id, stage, batch_id=None, **details):
+    """Publish a stage change for ``order_id``; returns the event"""
+    event = {
+        'order_id': order_id,
+        'batch_id': batch_id,
+        'stage': stage,
+        'status': STAGE_MESSAGES.get(stage, stage),
+        'at': datetime.utcnow().isoformat(),
+        **details
+    }
+    client = get_redis()
+    if client is None:
+        return event
+    payload = json.dumps(event, default=str)
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.set(_latest_key(order_id), payload, ex=PROGRESS_TTL_SECONDS)
+        pipe.publish(order_channel(order_id), payload)
+        if batch_id:
+            pipe.publish(batch_channel(batch_id), payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Warning: could not publish progress for order {order_id}: {e}")
+    return event
+
+
+def latest_progress(order_id):
+    """The last event published for ``order_id``, or None"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        payload = client.get(_latest_key(order_id))
+    except redis.RedisError:
+        return None
+    return json.loads(payload) if payload else None
+
+
+def subscribe(*channels):
+    """Open a pub/sub subscription to ``channels``, or None without Redis.
+
+    Subscribe before reading the current state from the database so no
+    event published in between is missed.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*channels)
+        return pubsub
+    except redis.RedisError as e:
+        print(f"Warning: progress subscription unavailable: {e}")
+        return None
+
+
+def listen(pubsub, timeout, max_seconds=None):
+    """Yield events from ``pubsub``; yields None after ``timeout`` seconds of silence.
+    
+    Stops after ``max_seconds`` (if given), so a stream's lifetime is bounded.
+    """
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    while True:
+        wait = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            wait = min(timeout, remaining)
+        message = pubsub.get_message(timeout=wait)
+        if message is None:
+            yield None
+        elif message['type'] == 'message':
+            yield json.loads(message['data'])
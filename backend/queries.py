@@ -0,0 +1,128 @@
+"""
+Query helpers for listing orders: filters and keyset (cursor) pagination.
+
+Orders are listed newest first on ``(created_at, id)``. The cursor is an
+opaque token holding the sort key of the last row returned, so each page is
+a bounded index range scan instead of an OFFSET over the whole table.
+"""
+import base64
+import json
+from datetime import datetime, date, time
+
+from sqlalchemy import tuple_
+
+from models import SalesOrderHeader
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+_FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def parse_bool(value, default):
+    """Parse a boolean query-string flag"""
+    if value is None or value == '':
+        return default
+    value = value.lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse the page size, clamped to ``maximum``"""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid limit: {value}")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def _parse_datetime(value, end_of_day=False):
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            return datetime.combine(day, time.max if end_of_day else time.min)
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+
+
+def encode_cursor(created_at, order_id):
+    """Encode the sort key of the last row on a page"""
+    raw = json.dumps([created_at.isoformat() if created_at else None, order_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(order_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def apply_order_filters(query, args):
+    """Apply the list filters from the request query string.
+
+    Supported: ``processing_status`` and ``status`` (comma-separated),
+    ``customer`` (case-insensitive substring of the customer name) and
+    ``date_from`` / ``date_to`` (ISO dates or datetimes on ``created_at``).
+    """
+    processing_status = args.get('processing_status')
+    if processing_status:
+        query = query.filter(SalesOrderHeader.processing_status.in_(processing_status.split(',')))
+
+    status = args.get('status')
+    if status:
+        query = query.filter(SalesOrderHeader.status.in_(status.split(',')))
+
+    customer = args.get('customer')
+    if customer:
+        query = query.filter(SalesOrderHeader.customer_name.ilike(f"%{customer}%"))
+
+    date_from = args.get('date_from')
+    if date_from:
+        query = query.filter(SalesOrderHeader.created_at >= _parse_datetime(date_from))
+
+    date_to = args.get('date_to')
+    if date_to:
+        query = query.filter(SalesOrderHeader.created_at <= _parse_datetime(date_to, end_of_day=True))
+
+    return query
+
+
+def newest_first(query):
+    """Order by ``(created_at, id)`` descending, the listing order"""
+    return query.order_by(SalesOrderHeader.created_at.desc(), SalesOrderHeader.id.desc())
+
+
+def paginate_orders(query, cursor=None, limit=DEFAULT_PAGE_SIZE, session=None):
+    """Return (orders, next_cursor) for one page, newest first.
+
+    ``query`` is an ORM query, or a Core select executed on ``session``
+    (which must select ``created_at`` and ``id``).
+    """
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(SalesOrderHeader.created_at, SalesOrderHeader.id) < tuple_(created_at, order_id)
+        )
+
+    query = newest_first(query).limit(limit + 1)
+    rows = session.execute(query).all() if session is not None else query.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
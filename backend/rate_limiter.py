@@ -0,0 +1,258 @@
+"""
+Token-bucket rate limiting for LLM requests, shared by all workers.
+
+Two buckets are debited together for every request: one counting requests
+per minute and one counting tokens per minute (estimated up front, corrected
+once the response reports actual usage). With Redis the buckets live on the
+server and are updated by a Lua script, so every worker process draws from
+the same budget; without Redis each process keeps its own buckets.
+
+The provider's rate-limit headers feed back into the limiter: a 429 (or a
+response reporting that a budget is exhausted) pauses all callers until the
+reset time the provider announced.
+
+The Redis client is synchronous, so the coroutines used by the LLM executor
+(``acquire``, ``refund_async``, ``block_for_async``) run Redis round trips in
+the loop's default thread pool: a slow or unreachable Redis then delays only
+the request waiting on it, not every request on the event loop.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+
+import redis
+
+from redis_client import get_redis
+
+MAX_WAIT_SECONDS = 5.0  # Longest single sleep before re-checking the buckets
+
+# KEYS: requests bucket, tokens bucket, blocked-until key
+# ARGV: requests/min, tokens/min, tokens needed
+# Returns 0 when granted, otherwise the seconds to wait (as a string)
+_ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local blocked = tonumber(redis.call('GET', KEYS[3]) or '0')
+if blocked > now then
+  return tostring(blocked - now)
+end
+
+local function level(key, capacity)
+  local state = redis.call('HMGET', key, 'level', 'ts')
+  local current = tonumber(state[1])
+  local ts = tonumber(state[2])
+  if current == nil then
+    return capacity
+  end
+  return math.min(capacity, current + (now - ts) * capacity / 60)
+end
+
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local needed = math.min(tonumber(ARGV[3]), tpm)
+local requests = level(KEYS[1], rpm)
+local tokens = level(KEYS[2], tpm)
+
+if requests >= 1 and tokens >= needed then
+  redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+  redis.call('HSET', KEYS[2], 'level', tokens - needed, 'ts', now)
+  redis.call('EXPIRE', KEYS[1], 120)
+  redis.call('EXPIRE', KEYS[2], 120)
+  return '0'
+end
+
+local wait = 0
+if requests < 1 then
+  wait = (1 - requests) * 60 / rpm
+end
+if tokens < needed then
+  wait = math.max(wait, (needed - tokens) * 60 / tpm)
+end
+return tostring(wait)
+"""
+
+# KEYS: tokens bucket; ARGV: tokens/min, tokens to give back (may be negative)
+_REFUND_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+if state[1] == false then
+  return 0
+end
+local tpm = tonumber(ARGV[1])
+redis.call('HSET', KEYS[1], 'level', math.min(tpm, tonumber(state[1]) + tonumber(ARGV[2])))
+return 1
+"""
+
+# KEYS: blocked-until key; ARGV: seconds to pause
+# Only ever extends the pause, so a shorter block never cuts a longer one short
+_BLOCK_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local seconds = tonumber(ARGV[1])
+local blocked = tonumber(redis.call('GET', KEYS[1]) or '0')
+if blocked >= now + seconds then
+  return 0
+end
+redis.call('SET', KEYS[1], tostring(now + seconds), 'PX', math.floor(seconds * 1000) + 1000)
+return 1
+"""
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """Parse '20ms', '1.5s' or '6m0s' style durations into seconds, or None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def backoff_from_headers(headers):
+    """Seconds to pause according to rate-limit response headers, or None"""
+    if not headers:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = parse_duration(headers.get('retry-after'))
+    if retry_after is not None:
+        return retry_after
+
+    # Budget exhausted: wait until the corresponding window resets
+    waits = []
+    for budget in ('requests', 'tokens'):
+        remaining = headers.get(f'x-ratelimit-remaining-{budget}')
+        if remaining is not None and remaining.strip() in ('0', '0.0'):
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{budget}'))
+            if reset:
+                waits.append(reset)
+    return max(waits) if waits else None
+
+
+def exponential_backoff(attempt, base=1.0, maximum=60.0):
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based)"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets, in Redis when available"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, namespace='llm_rate', redis_getter=get_redis):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.namespace = namespace
+        self._redis_getter = redis_getter
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._local = {
+            'requests': [float(requests_per_minute), now],
+            'tokens': [float(tokens_per_minute), now],
+        }
+        self._blocked_until = 0.0  # time.monotonic() based
+
+    def _keys(self):
+        return [f"{self.namespace}:requests", f"{self.namespace}:tokens", f"{self.namespace}:blocked_until"]
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def _refill(self, name, capacity, now):
+        bucket = self._local[name]
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * capacity / 60)
+        bucket[1] = now
+        return bucket
+
+    def _try_acquire_local(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                return self._blocked_until - now
+            requests = self._refill('requests', self.requests_per_minute, now)
+            token_bucket = self._refill('tokens', self.tokens_per_minute, now)
+            needed = min(tokens, self.tokens_per_minute)
+            if requests[0] >= 1 and token_bucket[0] >= needed:
+                requests[0] -= 1
+                token_bucket[0] -= needed
+                return 0.0
+            wait = 0.0
+            if requests[0] < 1:
+                wait = (1 - requests[0]) * 60 / self.requests_per_minute
+            if token_bucket[0] < needed:
+                wait = max(wait, (needed - token_bucket[0]) * 60 / self.tokens_per_minute)
+            return wait
+
+    def try_acquire(self, tokens):
+        """Take one request and ``tokens`` tokens; returns 0 or the seconds to wait"""
+        client = self._redis()
+        if client is not None:
+            try:
+                wait = client.eval(_ACQUIRE_SCRIPT, 3, *self._keys(),
+                                   self.requests_per_minute, self.tokens_per_minute, int(tokens))
+                return float(wait)
+            except redis.RedisError as e:
+                print(f"Warning: shared rate limiter unavailable, using local buckets: {e}")
+        return self._try_acquire_local(tokens)
+
+    async def _off_loop(self, fn, *args):
+        """Run ``fn`` in a thread when it talks to Redis, inline otherwise"""
+        if self._redis() is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def acquire(self, tokens):
+        """Wait until a request of ``tokens`` tokens fits in both budgets"""
+        while True:
+            wait = await self._off_loop(self.try_acquire, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, MAX_WAIT_SECONDS) + random.uniform(0, 0.05))
+
+    def refund(self, tokens):
+        """Return over-estimated tokens to the budget (negative to charge more)"""
+        if not tokens:
+            return
+        client = self._redis()
+        if client is not None:
+            try:
+                client.eval(_REFUND_SCRIPT, 1, self._keys()[1], self.tokens_per_minute, int(tokens))
+                return
+            except redis.RedisError as e:
+                print(f"Warning: could not refund rate limiter tokens: {e}")
+        with self._lock:
+            bucket = self._local['tokens']
+            bucket[0] = min(self.tokens_per_minute, bucket[0] + tokens)
+
+    def block_for(self, seconds):
+        """Pause every caller (all workers when shared) for ``seconds``"""
+        if not seconds or seconds <= 0:
+            return
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.eval(_BLOCK_SCRIPT, 1, self._keys()[2], float(seconds))
+        except redis.RedisError as e:
+            print(f"Warning: could not share rate limit pause: {e}")
+
+    async def refund_async(self, tokens):
+        """``refund`` for coroutines on the event loop"""
+        await self._off_loop(self.refund, tokens)
+
+    async def block_for_async(self, seconds):
+        """``block_for`` for coroutines on the event loop"""
+        await self._off_loop(self.block_for, seconds)
@@ -0,0 +1,47 @@
+"""
+Shared Redis connection helper.
+
+Redis is already our Celery broker, so caches, counters and locks reuse the
+same server. When the broker is not Redis (e.g. the in-memory broker used by
+the test suite) callers get ``None`` and fall back to in-process behaviour.
+"""
+import os
+import threading
+
+import redis
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis_url():
+    """Return the Redis URL to use, or None if Redis is not configured"""
+    url = os.getenv('REDIS_URL') or os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return url
+    return None
+
+
+def get_redis():
+    """Get the process-wide Redis client (created lazily), or None"""
+    global _client
+    if _client is None:
+        url = get_redis_url()
+        if not url:
+            return None
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    url,
+                    socket_timeout=5,
+                    socket_connect_timeout=5,
+                    health_check_interval=30,
+                )
+    return _client
+
+
+def reset_redis():
+    """Drop the cached client (e.g. after fork or in tests)"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,190 @@
+"""
+Redis cache of serialized order responses with ETags.
+
+``GET /api/orders/<id>`` and ``GET /api/orders`` pages are stored as the
+exact JSON bytes sent to the client, together with their ETag. A cached
+response costs one Redis round trip and no database query, and a request
+whose ``If-None-Match`` still matches gets a 304 without one either.
+
+Entries are grouped by scope: one per order (``order:<id>``, holding every
+``fields`` variant of it) and one for all list pages (``lists``). Writers
+call ``invalidate_order`` after committing a change to an order, which drops
+that order's entry and all list pages; ``invalidate_lists`` is for new
+orders. Each scope also has a generation counter that invalidation bumps: a
+reader stores what it built only if the generation it read before going to
+the database is still current, so a response built from data that was
+replaced in the meantime is never cached.
+
+Without Redis nothing is cached; ETags are still computed from the
+response, so unchanged responses still get a 304.
+"""
+import hashlib
+import os
+import threading
+
+import redis
+
+from redis_client import get_redis
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'))
+# List pages change with every new or updated order; keep them briefly
+RESPONSE_CACHE_LIST_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_LIST_TTL_SECONDS', '30'))
+
+LISTS = 'lists'
+
+# Store the entry only if the scope's generation is still the one read before building it
+_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+  return 0
+end
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3], 'etag:' .. ARGV[2], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return 1
+"""
+
+
+def order_scope(order_id):
+    return f"order:{order_id}"
+
+
+def make_etag(payload):
+    """ETag (unquoted) of a response body"""
+    return hashlib.blake2b(payload, digest_size=12).hexdigest()
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class ResponseCache:
+    """Serialized responses per scope and variant, in Redis"""
+
+    def __init__(self, namespace='response_cache', ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 list_ttl_seconds=RESPONSE_CACHE_LIST_TTL_SECONDS, redis_getter=get_redis):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.list_ttl_seconds = list_ttl_seconds
+        self._redis_getter = redis_getter
+        self._lock = threading.Lock()
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters():
+        return {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+    @property
+    def _stats_key(self):
+        return f"{self.namespace}:stats"
+
+    def _entry_key(self, scope):
+        return f"{self.namespace}:entry:{scope}"
+
+    def _generation_key(self, scope):
+        return f"{self.namespace}:gen:{scope}"
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def record(self, counter):
+        """Count a hit, miss or 304 (in Redis too when available)"""
+        with self._lock:
+            self._counters[counter] += 1
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.hincrby(self._stats_key, counter, 1)
+        except redis.RedisError as e:
+            print(f"Warning: could not update response cache stats in Redis: {e}")
+
+    def lookup(self, scope, variant):
+        """Return ``(payload, etag, generation)``; payload is None on a miss.
+
+        Pass ``generation`` to ``store`` for the response built after a miss.
+        """
+        client = self._redis()
+        if client is None:
+            return None, None, None
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hmget(self._entry_key(scope), variant, f"etag:{variant}")
+            pipe.get(self._generation_key(scope))
+            (payload, etag), generation = pipe.execute()
+        except redis.RedisError as e:
+            print(f"Warning: response cache unavailable: {e}")
+            return None, None, None
+        return payload, _text(etag), _text(generation) or ''
+
+    def store(self, scope, variant, payload, etag, generation):
+        """Cache a response built after ``lookup`` returned ``generation``"""
+        if generation is None:
+            return False
+        client = self._redis()
+        if client is None:
+            return False
+        ttl = self.list_ttl_seconds if scope == LISTS else self.ttl_seconds
+        try:
+            return bool(client.eval(_STORE_SCRIPT, 2, self._generation_key(scope), self._entry_key(scope),
+                                    generation, variant, payload, etag, ttl))
+        except redis.RedisError as e:
+            print(f"Warning: could not store response in cache: {e}")
+            return False
+
+    def _invalidate(self, scopes):
+        with self._lock:
+            self._counters['invalidations'] += 1
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for scope in scopes:
+                pipe.incr(self._generation_key(scope))
+                pipe.delete(self._entry_key(scope))
+            pipe.hincrby(self._stats_key, 'invalidations', 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Warning: could not invalidate cached responses for {', '.join(scopes)}: {e}")
+
+    def invalidate_order(self, order_id):
+        """Drop an order's cached responses and all list pages (after commit)"""
+        self._invalidate([order_scope(order_id), LISTS])
+
+    def invalidate_lists(self):
+        """Drop cached list pages, e.g. after orders were created"""
+        self._invalidate([LISTS])
+
+    def stats(self):
+        """Hit/miss counters (cluster-wide when Redis is available)"""
+        with self._lock:
+            counters = dict(self._counters)
+        scope = 'process'
+
+        client = self._redis()
+        if client is not None:
+            try:
+                shared = client.hgetall(self._stats_key)
+                counters = self._empty_counters()
+                for name, value in shared.items():
+                    name = _text(name)
+                    if name in counters:
+                        counters[name] = int(value)
+                scope = 'cluster'
+            except redis.RedisError as e:
+                print(f"Warning: could not read response cache stats from Redis: {e}")
+
+        requests = counters['hits'] + counters['misses'] + counters['not_modified']
+        served = counters['hits'] + counters['not_modified']
+        return dict(
+            counters,
+            scope=scope,
+            hit_rate=round(served / requests, 4) if requests else 0.0,
+        )
+
+    def clear_stats(self):
+        """Reset the in-process counters"""
+        with self._lock:
+            self._counters = self._empty_counters()
+
+
+order_cache = ResponseCache()
@@ -0,0 +1,273 @@
+"""
+Incrementally maintained aggregates over sales orders.
+
+A ``before_flush`` session listener turns every change to a
+``SalesOrderHeader`` (insert, delete, or an update of a tracked column) into
+deltas that are written to the rollup tables in the same transaction as the
+change itself, so readers get O(1) aggregates that are never ahead of or
+behind the committed orders. Writes that bypass the ORM unit of work (bulk
+INSERT statements) must call ``apply_stats_delta`` themselves.
+
+Two rollups are maintained:
+
+* ``order_stats``: order count and total value behind ``/api/stats``.
+* ``order_daily_rollup``: completed orders per (day, customer, currency),
+  behind the ``/api/analytics/*`` endpoints.
+
+``reconcile_order_stats`` and ``reconcile_daily_rollup`` recompute the
+rollups from the base table and repair any drift.
+"""
+import random
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import db, SalesOrderHeader, OrderStats, OrderDailyRollup
+
+STATS_SLOTS = 16
+
+# Header columns whose changes can move an order's contribution to a rollup
+TRACKED_COLUMNS = ('total', 'processing_status', 'invoice_date', 'created_at', 'customer_name', 'currency')
+
+_stats_table = OrderStats.__table__
+_daily_table = OrderDailyRollup.__table__
+
+
+def _to_decimal(value):
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _upsert_increment(connection, table, key_values, increments):
+    """INSERT a row or add ``increments`` to the existing row with the same key"""
+    values = dict(key_values, **increments)
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_values),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        connection.execute(stmt)
+        return
+
+    # Generic fallback: UPDATE, then INSERT if the row does not exist yet
+    conditions = [table.c[name] == value for name, value in key_values.items()]
+    result = connection.execute(
+        table.update().where(*conditions).values(
+            **{name: table.c[name] + value for name, value in increments.items()}
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**values))
+
+
+def apply_stats_delta(connection, orders=0, value=0):
+    """Add deltas to the /api/stats totals within the caller's transaction"""
+    value = _to_decimal(value)
+    if not orders and not value:
+        return
+    _upsert_increment(
+        connection,
+        _stats_table,
+        {'slot': random.randrange(STATS_SLOTS)},
+        {'total_orders': orders, 'total_value': value}
+    )
+
+
+def read_order_stats(session=None):
+    """Return (total_orders, total_value) from the rollup table"""
+    session = session or db.session
+    total_orders, total_value = session.execute(
+        select(
+            func.coalesce(func.sum(OrderStats.total_orders), 0),
+            func.coalesce(func.sum(OrderStats.total_value), 0)
+        )
+    ).one()
+    return int(total_orders), _to_decimal(total_value)
+
+
+def _state(order, old):
+    """Snapshot of the tracked columns before (old=True) or after a change"""
+    state = {}
+    attrs = inspect(order).attrs
+    for name in TRACKED_COLUMNS:
+        if old:
+            history = attrs[name].history
+            if history.deleted:
+                state[name] = history.deleted[0]
+            elif not history.added:
+                # Unchanged; loads the committed value if it was expired
+                state[name] = getattr(order, name)
+            else:
+                state[name] = None
+        else:
+            state[name] = getattr(order, name)
+    return state
+
+
+def _collect_changes(session):
+    """(old_state, new_state) pairs for every header touched by this flush"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, SalesOrderHeader):
+            changes.append((None, _state(obj, old=False)))
+    for obj in session.deleted:
+        if isinstance(obj, SalesOrderHeader):
+            changes.append((_state(obj, old=True), None))
+    for obj in session.dirty:
+        if isinstance(obj, SalesOrderHeader) and obj not in session.deleted:
+            attrs = inspect(obj).attrs
+            if any(attrs[name].history.has_changes() for name in TRACKED_COLUMNS):
+                changes.append((_state(obj, old=True), _state(obj, old=False)))
+    return changes
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def daily_rollup_key(state):
+    """(day, customer, currency) an order counts towards, or None"""
+    if state is None or state['processing_status'] != 'completed':
+        return None
+    day = _as_date(state['invoice_date']) or _as_date(state['created_at']) or datetime.utcnow().date()
+    return day, state['customer_name'] or '', (state['currency'] or 'USD').upper()
+
+
+def _daily_deltas(changes):
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for old, new in changes:
+        old_key = daily_rollup_key(old)
+        if old_key is not None:
+            deltas[old_key][0] -= 1
+            deltas[old_key][1] -= _to_decimal(old['total'])
+        new_key = daily_rollup_key(new)
+        if new_key is not None:
+            deltas[new_key][0] += 1
+            deltas[new_key][1] += _to_decimal(new['total'])
+    return {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+
+
+def apply_daily_deltas(connection, deltas):
+    """Add {(day, customer, currency): (orders, value)} deltas to the daily rollup"""
+    for (day, customer, currency), (orders, value) in sorted(deltas.items()):
+        _upsert_increment(
+            connection,
+            _daily_table,
+            {'day': day, 'customer': customer, 'currency': currency},
+            {'order_count': orders, 'total_value': _to_decimal(value)}
+        )
+
+
+def _stats_delta(changes):
+    orders = 0
+    value = Decimal('0')
+    for old, new in changes:
+        if old is not None:
+            orders -= 1
+            value -= _to_decimal(old['total'])
+        if new is not None:
+            orders += 1
+            value += _to_decimal(new['total'])
+    return orders, value
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_rollups(session, flush_context, instances):
+    with session.no_autoflush:
+        changes = _collect_changes(session)
+    if not changes:
+        return
+    connection = session.connection()
+    orders, value = _stats_delta(changes)
+    apply_stats_delta(connection, orders, value)
+    apply_daily_deltas(connection, _daily_deltas(changes))
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Make sure the previous value is loaded before a tracked column is
+# overwritten, so the listener can compute an exact delta.
+for _name in TRACKED_COLUMNS:
+    event.listen(getattr(SalesOrderHeader, _name), 'set', _track_previous_value,
+                 active_history=True, retval=True)
+
+
+def reconcile_order_stats(session=None):
+    """Recompute the stats rollup from the base table and repair any drift.
+
+    Runs in a single snapshot (REPEATABLE READ on PostgreSQL) and corrects the
+    rollup by adding the difference, which commutes with increments made by
+    concurrent transactions. Returns the correction that was applied.
+    """
+    session = session or db.session
+    if session.get_bind().dialect.name == 'postgresql':
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+    actual_orders, actual_value = session.execute(
+        select(func.count(SalesOrderHeader.id), func.coalesce(func.sum(SalesOrderHeader.total), 0))
+    ).one()
+    recorded_orders, recorded_value = read_order_stats(session)
+
+    order_drift = int(actual_orders) - recorded_orders
+    value_drift = _to_decimal(actual_value) - recorded_value
+    apply_stats_delta(session.connection(), order_drift, value_drift)
+    session.commit()
+    return {'orders': order_drift, 'value': float(value_drift)}
+
+
+def reconcile_daily_rollup(session=None):
+    """Recompute the daily rollup from the base table and repair any drift.
+
+    Differences are applied as increments (see ``reconcile_order_stats``);
+    rows that drop to zero orders are removed. Returns the number of
+    (day, customer, currency) rows that were corrected.
+    """
+    session = session or db.session
+    if session.get_bind().dialect.name == 'postgresql':
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+    day = func.coalesce(SalesOrderHeader.invoice_date, func.date(SalesOrderHeader.created_at))
+    customer = func.coalesce(SalesOrderHeader.customer_name, '')
+    currency = func.upper(func.coalesce(SalesOrderHeader.currency, 'USD'))
+    actual = {
+        (_as_date(row_day), row_customer, row_currency): (count, _to_decimal(value))
+        for row_day, row_customer, row_currency, count, value in session.execute(
+            select(day, customer, currency, func.count(SalesOrderHeader.id),
+                   func.coalesce(func.sum(SalesOrderHeader.total), 0))
+            .where(SalesOrderHeader.processing_status == 'completed')
+            .group_by(day, customer, currency)
+        )
+    }
+    recorded = {
+        (row.day, row.customer, row.currency): (row.order_count, _to_decimal(row.total_value))
+        for row in session.execute(select(_daily_table))
+    }
+
+    deltas = {}
+    for key in set(actual) | set(recorded):
+        actual_count, actual_value = actual.get(key, (0, Decimal('0')))
+        recorded_count, recorded_value = recorded.get(key, (0, Decimal('0')))
+        if actual_count != recorded_count or actual_value != recorded_value:
+            deltas[key] = (actual_count - recorded_count, actual_value - recorded_value)
+
+    connection = session.connection()
+    apply_daily_deltas(connection, deltas)
+    connection.execute(_daily_table.delete().where(_daily_table.c.order_count <= 0))
+    session.commit()
+    return len(deltas)
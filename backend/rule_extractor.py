@@ -0,0 +1,247 @@
+"""
+Deterministic fast path for well-formed invoices.
+
+Invoices with clearly labelled fields ("Invoice Number:", "Date:", "Total:")
+and a tabular item section (Code / Product / Qty / Price / Total) are parsed
+with regular expressions in milliseconds. The result is returned with a
+confidence score built from field coverage and arithmetic cross-checks
+(qty x price = line total, sum of lines = subtotal, subtotal + tax = total),
+so callers only trust it when the numbers actually add up and fall back to
+the LLM otherwise.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY'}
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d.%m.%Y', '%B %d, %Y', '%b %d, %Y', '%d %B %Y')
+TOLERANCE = Decimal('0.01')
+
+_AMOUNT = r'[$€£¥]?\s*-?[\d,]+(?:\.\d{1,2})?'
+_FIELD_LABELS = {
+    'invoice_number': r'invoice\s*(?:number|no\.?|#)',
+    'order_number': r'(?:order|po)\s*(?:number|no\.?|#)',
+    'due_date': r'due\s*date',
+    'invoice_date': r'(?:invoice\s*)?date',
+    'subtotal': r'sub\s*-?\s*total',
+    'tax': r'(?:tax|vat|gst)(?:\s*\([^)]*\))?',
+    'total': r'(?:grand\s*|amount\s*due|invoice\s*)?total(?:\s*due)?',
+    'currency': r'currency',
+}
+_HEADER_WORDS = {'code', 'product', 'description', 'item', 'items', 'qty', 'quantity',
+                 'unit', 'price', 'rate', 'amount', 'total', 'sku'}
+_ITEM_ROW = re.compile(
+    rf'^(?P<code>[A-Z0-9][\w.-]*)\s+(?P<name>.+?)\s+(?P<qty>\d+(?:\.\d+)?)\s+'
+    rf'(?P<price>{_AMOUNT})\s+(?P<total>{_AMOUNT})$'
+)
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_PHONE = re.compile(r'^\+?[\d\s().-]{7,20}$')
+
+# Weights sum to 1.0; the arithmetic checks carry most of the score
+_WEIGHTS = {
+    'invoice_number': 0.1,
+    'invoice_date': 0.1,
+    'customer_name': 0.05,
+    'total': 0.15,
+    'line_items': 0.1,
+    'line_totals': 0.2,
+    'subtotal_matches_lines': 0.15,
+    'total_matches_subtotal_and_tax': 0.15,
+}
+
+
+def parse_amount(value):
+    """Parse '$1,250.00' into Decimal('1250.00'), or None"""
+    if value is None:
+        return None
+    cleaned = re.sub(r'[^\d.-]', '', value)
+    try:
+        return Decimal(cleaned) if cleaned else None
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value):
+    """Parse a date in one of DATE_FORMATS into ISO format, or None"""
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def split_lines(text):
+    """Non-empty, stripped lines of ``text``"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _labelled_value(lines, label):
+    """Value after ``label:`` on the same line, or on the next line if empty"""
+    pattern = re.compile(rf'^{label}\s*:\s*(.*)$', re.IGNORECASE)
+    for index, line in enumerate(lines):
+        match = pattern.match(line)
+        if match:
+            value = match.group(1).strip()
+            if not value and index + 1 < len(lines):
+                value = lines[index + 1]
+            return value or None
+    return None
+
+
+def _detect_currency(text, explicit):
+    if explicit and re.fullmatch(r'[A-Za-z]{3}', explicit.strip()):
+        return explicit.strip().upper()
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    return 'USD'
+
+
+def _customer(lines):
+    """Name, address, email and phone from the block after 'Bill To:'"""
+    customer = {'customer_name': None, 'customer_address': None,
+                'customer_email': None, 'customer_phone': None}
+    for index, line in enumerate(lines):
+        if re.match(r'^(bill(ed)?\s*to|customer)\s*:?\s*$', line, re.IGNORECASE):
+            block = []
+            for candidate in lines[index + 1:index + 6]:
+                if re.match(r'^(items?|code|description|ship\s*to)\b', candidate, re.IGNORECASE):
+                    break
+                block.append(candidate)
+            for candidate in block:
+                if _EMAIL.fullmatch(candidate) and not customer['customer_email']:
+                    customer['customer_email'] = candidate
+                elif _PHONE.match(candidate) and not customer['customer_phone']:
+                    customer['customer_phone'] = candidate
+                elif not customer['customer_name']:
+                    customer['customer_name'] = candidate
+                elif not customer['customer_address']:
+                    customer['customer_address'] = candidate
+            break
+    return customer
+
+
+def _is_header(line):
+    return all(word.rstrip(':') in _HEADER_WORDS for word in line.lower().split())
+
+
+def _item_section(lines):
+    """Lines between the item table header and the subtotal"""
+    start = next((index for index, line in enumerate(lines) if _is_header(line)), None)
+    if start is None:
+        return []
+    # Skip the column headers, whether on one line or one per line
+    while start < len(lines) and _is_header(lines[start]):
+        start += 1
+    section = []
+    for line in lines[start:]:
+        if re.match(r'^(sub\s*-?\s*total|tax|vat|gst|total)\b', line, re.IGNORECASE):
+            break
+        section.append(line)
+    return section
+
+
+def _line_item(number, code, name, qty, price, total):
+    return {
+        'line_number': number,
+        'product_code': code,
+        'product_name': name,
+        'description': None,
+        'quantity': float(qty),
+        'unit_price': float(parse_amount(price)),
+        'discount': 0,
+        'line_total': float(parse_amount(total)),
+    }
+
+
+def parse_line_items(lines):
+    """Line items from a Code/Product/Qty/Price/Total table, or []"""
+    section = _item_section(lines)
+    if not section:
+        return []
+
+    # One row per line: "CODE Product name 2 $500.00 $1000.00"
+    rows = [_ITEM_ROW.match(line) for line in section]
+    if all(rows):
+        return [
+            _line_item(number, row['code'], row['name'], row['qty'], row['price'], row['total'])
+            for number, row in enumerate(rows, start=1)
+        ]
+
+    # One cell per line (typical PDF text extraction): code, name, qty, price, total
+    if len(section) % 5:
+        return []
+    items = []
+    for number, start in enumerate(range(0, len(section), 5), start=1):
+        code, name, qty, price, total = section[start:start + 5]
+        if not (re.fullmatch(r'\d+(?:\.\d+)?', qty)
+                and re.fullmatch(_AMOUNT, price) and re.fullmatch(_AMOUNT, total)):
+            return []
+        items.append(_line_item(number, code, name, qty, price, total))
+    return items
+
+
+def _close(a, b):
+    return a is not None and b is not None and abs(Decimal(str(a)) - Decimal(str(b))) <= TOLERANCE
+
+
+def consistency_checks(data):
+    """Arithmetic cross-checks; a check is None when its inputs are missing"""
+    items = data.get('line_items') or []
+    subtotal, tax, total = data.get('subtotal'), data.get('tax'), data.get('total')
+    line_sum = sum((Decimal(str(item.get('line_total') or 0)) for item in items), Decimal('0'))
+    return {
+        'line_totals': all(
+            item.get('quantity') is not None and item.get('unit_price') is not None
+            and _close(Decimal(str(item['quantity'])) * Decimal(str(item['unit_price'])), item.get('line_total'))
+            for item in items
+        ) if items else None,
+        'subtotal_matches_lines': _close(subtotal, line_sum) if items and subtotal is not None else None,
+        'total_matches_subtotal_and_tax': (
+            _close(Decimal(str(subtotal)) + Decimal(str(tax or 0)), total)
+            if subtotal is not None and total is not None else None
+        ),
+    }
+
+
+def score_extraction(data):
+    """Confidence in [0, 1] from field coverage and arithmetic consistency"""
+    checks = {
+        'invoice_number': bool(data.get('invoice_number')),
+        'invoice_date': bool(data.get('invoice_date')),
+        'customer_name': bool(data.get('customer_name')),
+        'total': data.get('total') is not None,
+        'line_items': bool(data.get('line_items')),
+        **{name: bool(passed) for name, passed in consistency_checks(data).items()},
+    }
+    return round(sum((_WEIGHTS[name] for name, passed in checks.items() if passed), 0.0), 3)
+
+
+def extract_invoice_data_with_rules(text_content):
+    """Parse a well-formed invoice without the LLM.
+
+    Returns ``(data, confidence)``; ``data`` has the same shape as the LLM
+    extraction so either result can be persisted the same way.
+    """
+    lines = split_lines(text_content or '')
+    if not lines:
+        return None, 0.0
+
+    values = {field: _labelled_value(lines, label) for field, label in _FIELD_LABELS.items()}
+    amounts = {field: parse_amount(values[field]) for field in ('subtotal', 'tax', 'total')}
+
+    data = {
+        'order_number': values['order_number'],
+        'invoice_number': values['invoice_number'],
+        'invoice_date': parse_date(values['invoice_date']),
+        'due_date': parse_date(values['due_date']),
+        **_customer(lines),
+        'subtotal': float(amounts['subtotal']) if amounts['subtotal'] is not None else None,
+        'tax': float(amounts['tax']) if amounts['tax'] is not None else None,
+        'total': float(amounts['total']) if amounts['total'] is not None else None,
+        'currency': _detect_currency(text_content, values['currency']),
+        'line_items': parse_line_items(lines),
+    }
+    return data, score_extraction(data)
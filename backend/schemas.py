@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, EmailStr, Field, field_validator, validator
 from typing import Optional, List
 from datetime import date
 
@@ -15,6 +15,7 @@ class LineItemCreate(BaseModel):
 
 
 class LineItemUpdate(BaseModel):
+    id: Optional[int] = None  # Stored line to update; otherwise matched by line_number
     line_number: Optional[int] = None
     product_code: Optional[str] = None
     product_name: Optional[str] = None
@@ -41,6 +42,11 @@ class OrderCreate(BaseModel):
     status: str = "pending"
     line_items: List[LineItemCreate] = []
 
+    @field_validator('currency')
+    @classmethod
+    def upper_currency(cls, value):
+        return value.upper()
+
 
 class OrderUpdate(BaseModel):
     invoice_number: Optional[str] = None
@@ -56,4 +62,11 @@ class OrderUpdate(BaseModel):
     currency: Optional[str] = None
     status: Optional[str] = None
     line_items: Optional[List[LineItemUpdate]] = None
+    version: Optional[int] = None  # Version the client edited; 409 if the order changed since
+
+    @field_validator('currency')
+    @classmethod
+    def upper_currency(cls, value):
+        """Currency codes are stored upper-case (analytics groups and filters on them)"""
+        return value.upper() if value else value
 
@@ -0,0 +1,197 @@
+"""
+Full-text search over orders and their line items.
+
+Each order has one search document built from its invoice number, customer
+name and address, and the product names and descriptions of its line items.
+Documents live in ``order_search``, outside the ORM models because its shape
+depends on the database:
+
+* PostgreSQL: ``order_search(order_id, document tsvector)`` with a GIN index,
+  ranked with ``ts_rank_cd``. Created by migration ``0010_order_search``.
+* SQLite (tests): an FTS5 virtual table keyed by ``rowid = order_id``,
+  ranked with ``bm25``. Created with the other tables by ``create_all``.
+
+Writers refresh the documents of the orders they change, in their own
+transaction, with ``index_orders`` (the persist stage and ``PUT
+/api/orders/<id>``) and ``remove_orders`` (``DELETE``).
+
+Queries are split into words; every word must match, as a prefix, so
+``acme wid`` finds "Acme Corp" orders with "Widget" lines. Results are
+ordered by score, then id, and paged with a keyset cursor on both.
+"""
+import base64
+import json
+import re
+
+from sqlalchemy import DDL, Double, event, bindparam, cast, column, func, literal_column, select, table, text, tuple_
+
+from models import SalesOrderHeader
+
+SEARCH_TABLE = 'order_search'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# PostgreSQL: weighted document built from the stored rows
+_PG_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(h.invoice_number, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(h.customer_name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(h.customer_address, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(string_agg(
+        coalesce(d.product_name, '') || ' ' || coalesce(d.description, ''), ' '), '')), 'C')
+"""
+
+PG_CREATE = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        order_id INTEGER PRIMARY KEY REFERENCES sales_order_header (id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+]
+
+# SQLite: column order matches the bm25() weights in _sqlite_matches
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        invoice_number, customer_name, customer_address, line_items, tokenize = 'unicode61'
+    )""",
+]
+
+DROP = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+
+# Create and drop the search table with the models (create_all / drop_all)
+for _statement in PG_CREATE:
+    event.listen(SalesOrderHeader.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+for _statement in SQLITE_CREATE:
+    event.listen(SalesOrderHeader.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(SalesOrderHeader.__table__, 'before_drop', DDL(DROP).execute_if(dialect=('postgresql', 'sqlite')))
+
+
+def supports_search(connection):
+    return connection.dialect.name in ('postgresql', 'sqlite')
+
+
+def pg_index_statement(where='h.id IN :order_ids'):
+    """Upsert the documents of the orders matching ``where``"""
+    return f"""
+        INSERT INTO {SEARCH_TABLE} (order_id, document)
+        SELECT h.id, {_PG_DOCUMENT}
+        FROM sales_order_header h
+        LEFT JOIN sales_order_detail d ON d.order_id = h.id
+        WHERE {where}
+        GROUP BY h.id
+        ON CONFLICT (order_id) DO UPDATE SET document = EXCLUDED.document
+    """
+
+
+def index_orders(connection, order_ids):
+    """Rebuild the search documents of ``order_ids`` from their stored rows.
+
+    Runs on the caller's connection so the documents commit with the
+    change; pending ORM changes must be flushed first.
+    """
+    order_ids = list(order_ids)
+    if not order_ids or not supports_search(connection):
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.execute(
+            text(pg_index_statement()).bindparams(bindparam('order_ids', expanding=True)),
+            {'order_ids': order_ids}
+        )
+        return
+    remove_orders(connection, order_ids)
+    connection.execute(
+        text(f"""
+            INSERT INTO {SEARCH_TABLE} (rowid, invoice_number, customer_name, customer_address, line_items)
+            SELECT h.id, h.invoice_number, h.customer_name, h.customer_address,
+                   (SELECT group_concat(coalesce(d.product_name, '') || ' ' || coalesce(d.description, ''), ' ')
+                    FROM sales_order_detail d WHERE d.order_id = h.id)
+            FROM sales_order_header h
+            WHERE h.id IN :order_ids
+        """).bindparams(bindparam('order_ids', expanding=True)),
+        {'order_ids': order_ids}
+    )
+
+
+def remove_orders(connection, order_ids):
+    """Drop the search documents of ``order_ids``"""
+    order_ids = list(order_ids)
+    if not order_ids or not supports_search(connection):
+        return
+    key = 'order_id' if connection.dialect.name == 'postgresql' else 'rowid'
+    connection.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN :order_ids").bindparams(
+            bindparam('order_ids', expanding=True)),
+        {'order_ids': order_ids}
+    )
+
+
+def query_words(query):
+    """Words of a search query; punctuation and operators are ignored"""
+    return _WORD.findall(query or '')
+
+
+def encode_search_cursor(score, order_id):
+    raw = json.dumps([score, order_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_search_cursor(cursor):
+    try:
+        score, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(score), int(order_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _pg_matches(words):
+    search = table(SEARCH_TABLE, column('order_id'), column('document'))
+    tsquery = func.to_tsquery('english', ' & '.join(f'{word}:*' for word in words))
+    return select(
+        search.c.order_id.label('order_id'),
+        # ts_rank_cd returns real; as double precision the cursor round-trips the
+        # exact score, so rows tied with the last one on a page are not skipped
+        cast(func.ts_rank_cd(search.c.document, tsquery), Double).label('score'),
+    ).where(search.c.document.op('@@')(tsquery))
+
+
+def _sqlite_matches(words):
+    search = table(SEARCH_TABLE, column('rowid'))
+    fts_query = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+    return select(
+        search.c.rowid.label('order_id'),
+        # bm25() is lower for better matches; weights follow the column order
+        (-func.bm25(literal_column(SEARCH_TABLE), 10.0, 10.0, 5.0, 1.0)).label('score'),
+    ).where(literal_column(SEARCH_TABLE).op('MATCH')(fts_query))
+
+
+def search_order_ids(session, query, filter_orders=None, cursor=None, limit=20):
+    """Return ``([(order_id, score)], next_cursor)`` for one page of matches, best first.
+
+    ``filter_orders`` narrows the matching orders: it gets and returns a
+    select over ``SalesOrderHeader`` (e.g. ``apply_order_filters``).
+    Raises ValueError for an empty query or a bad cursor.
+    """
+    words = query_words(query)
+    if not words:
+        raise ValueError("Search query must contain at least one word")
+    connection = session.connection()
+    if not supports_search(connection):
+        raise ValueError(f"Search is not supported on {connection.dialect.name}")
+
+    matches = (_pg_matches if connection.dialect.name == 'postgresql' else _sqlite_matches)(words).subquery()
+    statement = select(matches.c.order_id, matches.c.score).join(
+        SalesOrderHeader, SalesOrderHeader.id == matches.c.order_id
+    )
+    if filter_orders is not None:
+        statement = filter_orders(statement)
+    if cursor:
+        score, order_id = decode_search_cursor(cursor)
+        statement = statement.where(tuple_(matches.c.score, matches.c.order_id) < tuple_(score, order_id))
+
+    rows = session.execute(
+        statement.order_by(matches.c.score.desc(), matches.c.order_id.desc()).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1].score, rows[-1].order_id)
+    return [(row.order_id, row.score) for row in rows], next_cursor
@@ -0,0 +1,168 @@
+"""
+Fast serialization of orders for API responses.
+
+``SalesOrderHeader.to_dict()`` needs fully loaded ORM objects (identity map,
+attribute instrumentation, relationship loading) and ``jsonify`` then runs the
+stdlib encoder over the result. The list endpoints instead select only the
+columns they need with Core, convert each row with a precomputed converter
+per column and encode with orjson when it is installed. The output matches
+``to_dict()`` field for field.
+
+Clients may ask for a sparse fieldset (``?fields=id,total,status``): only
+those columns are selected and returned, and line items are loaded only
+when ``line_items`` is one of them.
+"""
+import json
+
+from flask import Response
+from sqlalchemy import select
+
+from models import SalesOrderHeader, SalesOrderDetail
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+header_table = SalesOrderHeader.__table__
+detail_table = SalesOrderDetail.__table__
+
+
+def _amount(value):
+    # Same as to_dict(): zero and NULL amounts are both reported as null
+    return float(value) if value else None
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# Field name -> converter (None: the column value is already JSON-ready), in to_dict() order
+ORDER_FIELDS = {
+    'id': None,
+    'order_number': None,
+    'invoice_number': None,
+    'invoice_date': _isoformat,
+    'due_date': _isoformat,
+    'customer_name': None,
+    'customer_address': None,
+    'customer_email': None,
+    'customer_phone': None,
+    'subtotal': _amount,
+    'tax': _amount,
+    'total': _amount,
+    'currency': None,
+    'status': None,
+    'processing_status': None,
+    'created_at': _isoformat,
+    'updated_at': _isoformat,
+    'file_path': None,
+    'content_hash': None,
+    'batch_id': None,
+    'extraction_method': None,
+    'extraction_confidence': None,
+    'error_message': None,
+    'version': None,
+}
+
+LINE_ITEM_FIELDS = {
+    'id': None,
+    'order_id': None,
+    'line_number': None,
+    'product_code': None,
+    'product_name': None,
+    'description': None,
+    'quantity': _amount,
+    'unit_price': _amount,
+    'discount': _amount,
+    'line_total': _amount,
+}
+
+# Pseudo-field of an order: its line items
+LINE_ITEMS = 'line_items'
+
+# Always selected: the keyset pagination sort key
+_SORT_KEY = ('created_at', 'id')
+
+
+def parse_fields(value):
+    """Parse a ``fields`` query parameter; None means every field.
+
+    Raises ValueError for unknown field names.
+    """
+    if value is None or value.strip() == '':
+        return None
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in ORDER_FIELDS and name != LINE_ITEMS:
+            raise ValueError(f"Unknown field: {name}")
+        fields.append(name)
+    return fields
+
+
+def order_select(fields=None):
+    """Core SELECT of the header columns needed for ``fields``"""
+    names = [name for name in (fields or ORDER_FIELDS) if name in ORDER_FIELDS]
+    names += [name for name in _SORT_KEY if name not in names]
+    return select(*(header_table.c[name] for name in names))
+
+
+def _converters(fields, available):
+    return [(name, available[name]) for name in fields if name in available]
+
+
+def row_to_dict(row, converters):
+    """Convert one Core row with a list of ``(field, converter)`` pairs"""
+    mapping = row._mapping
+    data = {}
+    for name, convert in converters:
+        value = mapping[name]
+        data[name] = convert(value) if convert is not None else value
+    return data
+
+
+def serialize_orders(session, rows, fields=None, include_line_items=True):
+    """Dicts for header rows from ``order_select``, with line items if requested.
+
+    Line items for all rows are loaded with one extra query.
+    """
+    converters = _converters(fields or ORDER_FIELDS, ORDER_FIELDS)
+    orders = [row_to_dict(row, converters) for row in rows]
+
+    if fields is not None:
+        include_line_items = LINE_ITEMS in fields
+    if include_line_items and orders:
+        order_ids = [row.id for row in rows]
+        items_by_order = line_items_by_order(session, order_ids)
+        for order, order_id in zip(orders, order_ids):
+            order[LINE_ITEMS] = items_by_order.get(order_id, [])
+    return orders
+
+
+def line_items_by_order(session, order_ids):
+    """Serialized line items of ``order_ids``, keyed by order id, in line order"""
+    converters = _converters(LINE_ITEM_FIELDS, LINE_ITEM_FIELDS)
+    statement = (
+        select(*(detail_table.c[name] for name in LINE_ITEM_FIELDS))
+        .where(detail_table.c.order_id.in_(order_ids))
+        .order_by(detail_table.c.order_id, detail_table.c.line_number, detail_table.c.id)
+    )
+    items_by_order = {}
+    for row in session.execute(statement):
+        items_by_order.setdefault(row.order_id, []).append(row_to_dict(row, converters))
+    return items_by_order
+
+
+def dumps(data):
+    """Encode ``data`` as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """A JSON response encoded with ``dumps``"""
+    return Response(dumps(data), status=status, mimetype='application/json')
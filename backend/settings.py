@@ -0,0 +1,99 @@
+"""
+Process-wide settings, loaded once from the environment and ``.env``.
+
+The first call to ``get_settings()`` reads the ``.env`` file (the first one
+found in ENV_PATHS) and caches the result. Nothing on the request or task hot
+path touches the filesystem afterwards. ``reload_settings()`` re-reads the
+file explicitly; worker processes call it on SIGHUP (see
+``install_reload_signal_handler``). Callbacks registered with ``on_reload``
+run after every reload, e.g. to rebuild clients that captured old settings.
+"""
+import os
+import signal
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Checked in order; the first existing file wins (local and Docker layouts)
+ENV_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'),  # Same directory as settings.py
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.env'),  # Parent directory
+    '.env',  # Current working directory
+    '/app/.env',  # Docker container path
+]
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: str = ''
+    openai_timeout: float = 60.0
+    openai_max_retries: int = 5
+    llm_max_in_flight: int = 8
+    llm_requests_per_minute: int = 500
+    llm_tokens_per_minute: int = 200000
+    env_file: Optional[str] = None
+
+
+_settings = None
+_lock = threading.Lock()
+_reload_callbacks = []
+
+
+def _load_env_file(override):
+    for env_path in ENV_PATHS:
+        if os.path.exists(env_path):
+            load_dotenv(env_path, override=override)
+            return env_path
+    # Fall back to python-dotenv's own search from the current directory
+    load_dotenv(override=override)
+    return None
+
+
+def load_settings(override=False):
+    """Read ``.env`` and the environment into a new Settings object"""
+    env_file = _load_env_file(override)
+    return Settings(
+        openai_api_key=os.environ.get('OPENAI_API_KEY', ''),
+        openai_timeout=float(os.environ.get('OPENAI_TIMEOUT', '60')),
+        openai_max_retries=int(os.environ.get('OPENAI_MAX_RETRIES', '5')),
+        llm_max_in_flight=int(os.environ.get('LLM_MAX_IN_FLIGHT', '8')),
+        llm_requests_per_minute=int(os.environ.get('LLM_REQUESTS_PER_MINUTE', '500')),
+        llm_tokens_per_minute=int(os.environ.get('LLM_TOKENS_PER_MINUTE', '200000')),
+        env_file=env_file,
+    )
+
+
+def get_settings():
+    """Get the cached settings, loading them on first use"""
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = load_settings()
+                source = _settings.env_file or 'environment only'
+                print(f"Settings loaded from: {source}")
+    return _settings
+
+
+def reload_settings():
+    """Re-read ``.env`` (overriding the environment) and notify listeners"""
+    global _settings
+    with _lock:
+        _settings = load_settings(override=True)
+    print(f"Settings reloaded from: {_settings.env_file or 'environment only'}")
+    for callback in list(_reload_callbacks):
+        callback(_settings)
+    return _settings
+
+
+def on_reload(callback):
+    """Register ``callback(settings)`` to run after each reload"""
+    _reload_callbacks.append(callback)
+    return callback
+
+
+def install_reload_signal_handler(signum=signal.SIGHUP):
+    """Reload settings when this process receives ``signum`` (main thread only)"""
+    signal.signal(signum, lambda *_: reload_settings())
@@ -0,0 +1,228 @@
+"""
+Single-flight execution of duplicate work.
+
+The same document uploaded twice within seconds (or redelivered while still
+running, with late acknowledgement and retries) would otherwise be parsed
+and sent to the LLM once per task. ``SingleFlight.do`` runs the work once per
+key: the first caller becomes the leader, concurrent callers with the same
+key wait for the leader and reuse its result.
+
+Two layers are used. Threads of one worker process coalesce in memory; the
+in-process leader then takes a Redis lock (SET NX with a TTL) so leaders of
+different processes coalesce too, and publishes its JSON result under the
+key for a while. Waiters whose leader fails (or whose lock expires) run the
+work themselves. Without Redis only the in-process layer applies.
+
+Lock and wait times are derived from the pipeline tasks' soft time limit: a
+crashed leader's lock expires, and a waiter gives up waiting, early enough
+that the waiter can still do the work itself before it is killed.
+"""
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+
+import redis
+
+from redis_client import get_redis
+
+# Soft time limit of the pipeline tasks (tasks.py uses this value)
+TASK_SOFT_TIME_LIMIT = int(os.getenv('TASK_SOFT_TIME_LIMIT', '240'))
+# A crashed leader's lock expires after this
+SINGLE_FLIGHT_LOCK_SECONDS = int(os.getenv('SINGLE_FLIGHT_LOCK_SECONDS', TASK_SOFT_TIME_LIMIT * 3 // 4))
+# Waiters give up on the leader after this, leaving half their time limit for the work
+SINGLE_FLIGHT_WAIT_SECONDS = int(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', TASK_SOFT_TIME_LIMIT // 2))
+# How long a finished result is served to late duplicates
+SINGLE_FLIGHT_RESULT_SECONDS = int(os.getenv('SINGLE_FLIGHT_RESULT_SECONDS', '600'))
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    """An in-process leader's pending result"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """Run work once per key across threads and worker processes"""
+
+    def __init__(self, namespace='single_flight', lock_seconds=SINGLE_FLIGHT_LOCK_SECONDS,
+                 wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS, result_seconds=SINGLE_FLIGHT_RESULT_SECONDS,
+                 poll_interval=0.2, redis_getter=get_redis):
+        self.namespace = namespace
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.result_seconds = result_seconds
+        self.poll_interval = poll_interval
+        self._redis_getter = redis_getter
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters():
+        return {'leaders': 0, 'shared': 0, 'takeovers': 0}
+
+    @property
+    def _stats_key(self):
+        return f"{self.namespace}:stats"
+
+    def _lock_key(self, key):
+        return f"{self.namespace}:lock:{key}"
+
+    def _result_key(self, key):
+        return f"{self.namespace}:result:{key}"
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def _record(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.hincrby(self._stats_key, counter, 1)
+        except redis.RedisError as e:
+            print(f"Warning: could not update single-flight stats in Redis: {e}")
+
+    def do(self, key, fn, on_wait=None):
+        """Return ``fn()``, or the result of an identical call already in flight.
+
+        ``fn`` must return a JSON-serializable value. ``on_wait`` is called
+        once if this caller has to wait for another one. Returns
+        ``(result, shared)`` where shared is True when another caller did the
+        work.
+        """
+        waiting = []
+
+        def notify_wait():
+            if on_wait is not None and not waiting:
+                waiting.append(True)
+                on_wait()
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            notify_wait()
+            if not call.done.wait(self.wait_seconds):
+                # Same budget as waiting on another process's leader
+                self._record('takeovers')
+                return fn(), False
+            if not call.failed:
+                self._record('shared')
+                return copy.deepcopy(call.result), True
+            # The leader failed: try again, possibly as the new leader
+
+        try:
+            call.result, shared = self._do_shared(key, fn, notify_wait)
+            return call.result, shared
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_shared(self, key, fn, notify_wait):
+        """Coalesce with the other worker processes through Redis"""
+        client = self._redis()
+        if client is None:
+            self._record('leaders')
+            return fn(), False
+
+        token = uuid.uuid4().hex
+        waited = False
+        deadline = time.monotonic() + self.wait_seconds
+        try:
+            while True:
+                payload = client.get(self._result_key(key))
+                if payload is not None:
+                    self._record('shared')
+                    return json.loads(payload), True
+                if client.set(self._lock_key(key), token, nx=True, ex=self.lock_seconds):
+                    break
+                if time.monotonic() >= deadline:
+                    # The leader is taking too long for us to wait any longer; do the work ourselves
+                    token = None
+                    break
+                waited = True
+                notify_wait()
+                time.sleep(self.poll_interval)
+        except redis.RedisError as e:
+            print(f"Warning: single-flight lock unavailable, running without it: {e}")
+            token = None
+
+        self._record('takeovers' if waited else 'leaders')
+        try:
+            result = fn()
+        except BaseException:
+            self._release(client, key, token)
+            raise
+        try:
+            client.set(self._result_key(key), json.dumps(result, default=str), ex=self.result_seconds)
+        except redis.RedisError as e:
+            print(f"Warning: could not share single-flight result: {e}")
+        self._release(client, key, token)
+        return result, False
+
+    def _release(self, client, key, token):
+        if token is None:
+            return
+        try:
+            client.eval(_RELEASE_SCRIPT, 1, self._lock_key(key), token)
+        except redis.RedisError as e:
+            print(f"Warning: could not release single-flight lock: {e}")
+
+    def stats(self):
+        """Leader/shared counters (cluster-wide when Redis is available)"""
+        with self._lock:
+            counters = dict(self._counters)
+        scope = 'process'
+
+        client = self._redis()
+        if client is not None:
+            try:
+                shared = client.hgetall(self._stats_key)
+                counters = self._empty_counters()
+                for name, value in shared.items():
+                    name = name.decode('utf-8') if isinstance(name, bytes) else name
+                    if name in counters:
+                        counters[name] = int(value)
+                scope = 'cluster'
+            except redis.RedisError as e:
+                print(f"Warning: could not read single-flight stats from Redis: {e}")
+
+        calls = counters['leaders'] + counters['shared'] + counters['takeovers']
+        return dict(
+            counters,
+            scope=scope,
+            shared_rate=round(counters['shared'] / calls, 4) if calls else 0.0,
+        )
+
+    def clear_stats(self):
+        """Reset the in-process counters"""
+        with self._lock:
+            self._counters = self._empty_counters()
+
+
+pipeline_flight = SingleFlight()
@@ -0,0 +1,118 @@
+"""
+Content-addressed storage for uploaded documents.
+
+Uploads are streamed to disk in chunks while being hashed, then stored under
+their SHA-256 digest so identical documents share a single file. Deleting an
+order never removes its file, since a concurrent upload of the same content
+may be about to reference it; ``sweep_unreferenced`` removes files that no
+order references once they are older than a grace period. ZIP archives
+are bounded by member count and total uncompressed size, so a small archive
+cannot expand to fill the upload volume.
+"""
+import hashlib
+import os
+import tempfile
+import time
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+MAX_ARCHIVE_MEMBERS = 10000
+MAX_ARCHIVE_UNCOMPRESSED_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+UPLOAD_GRACE_SECONDS = int(os.getenv('UPLOAD_GRACE_SECONDS', 3600))
+
+
+def digest_path(upload_folder, digest, file_ext):
+    """Path where a document with the given digest is stored"""
+    return os.path.join(upload_folder, f"{digest}.{file_ext}")
+
+
+def save_stream(stream, upload_folder, file_ext, chunk_size=CHUNK_SIZE):
+    """Save a binary stream by content hash, returning (file_path, digest)"""
+    hasher = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                tmp_file.write(chunk)
+
+        digest = hasher.hexdigest()
+        file_path = digest_path(upload_folder, digest, file_ext)
+        # Replace even when identical content is already stored: the file is
+        # then certain to exist and is new again for sweep_unreferenced
+        os.replace(tmp_path, file_path)
+        return file_path, digest
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def sweep_unreferenced(upload_folder, is_referenced, grace_seconds=UPLOAD_GRACE_SECONDS, now=None):
+    """Remove stored files no order references, returning how many were removed.
+    
+    ``is_referenced(file_path)`` is checked before the file's age, so an
+    upload that stores the same content meanwhile makes it new again and it
+    is kept. Leftover ``.part`` files of interrupted uploads go too.
+    """
+    cutoff = (now or time.time()) - grace_seconds
+    removed = 0
+    for entry in os.scandir(upload_folder):
+        if not entry.is_file():
+            continue
+        if not entry.name.endswith('.part') and is_referenced(entry.path):
+            continue
+        try:
+            if os.stat(entry.path).st_mtime > cutoff:
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def save_upload(file_storage, upload_folder, file_ext):
+    """Save a Werkzeug FileStorage upload by content hash"""
+    return save_stream(file_storage.stream, upload_folder, file_ext)
+
+
+class _BoundedMember:
+    """Archive member stream charging what it reads to the archive's byte budget"""
+
+    def __init__(self, member, budget):
+        self._member = member
+        self._budget = budget
+
+    def read(self, size=-1):
+        chunk = self._member.read(size)
+        self._budget['remaining'] -= len(chunk)
+        if self._budget['remaining'] < 0:
+            # Header sizes can lie; what is actually extracted counts
+            raise ValueError(f"Archive expands to more than {self._budget['limit']} bytes")
+        return chunk
+
+
+def iter_zip_members(stream, max_members=MAX_ARCHIVE_MEMBERS, max_total_size=MAX_ARCHIVE_UNCOMPRESSED_SIZE):
+    """Yield (filename, file_ext, binary stream) for each file in a ZIP archive.
+    
+    Raises ValueError for archives with more than ``max_members`` files or
+    more than ``max_total_size`` uncompressed bytes, declared or extracted.
+    """
+    with zipfile.ZipFile(stream) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) > max_members:
+            raise ValueError(f"Archive contains more than {max_members} files")
+        if sum(info.file_size for info in members) > max_total_size:
+            raise ValueError(f"Archive expands to more than {max_total_size} bytes")
+        budget = {'limit': max_total_size, 'remaining': max_total_size}
+        for info in members:
+            filename = os.path.basename(info.filename)
+            if not filename or filename.startswith('.'):
+                continue
+            file_ext = filename.lower().split('.')[-1]
+            with archive.open(info) as member:
+                yield filename, file_ext, _BoundedMember(member, budget)
@@ -1,33 +1,35 @@
-from celery import Celery
+from celery import Celery, chain, current_task, group
+from celery.concurrency import get_implementation
+from celery.signals import worker_process_init, worker_ready
 from models import db, SalesOrderHeader, SalesOrderDetail
 from datetime import datetime
 import os
 import sys
 import json
+import threading
+import time
 import traceback
-import PyPDF2
-from openai import OpenAI
 from flask import Flask
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-# Try multiple paths to find .env file (for both local and Docker environments)
-env_paths = [
-    os.path.join(os.path.dirname(__file__), '.env'),  # Same directory as tasks.py
-    os.path.join(os.path.dirname(__file__), '..', '.env'),  # Parent directory
-    '.env',  # Current working directory
-    '/app/.env',  # Docker container path
-]
-for env_path in env_paths:
-    if os.path.exists(env_path):
-        load_dotenv(env_path)
-        print(f"Loaded .env from: {env_path}")
-        break
-else:
-    # If no .env file found, try default load_dotenv() which searches current directory
-    load_dotenv()
-    print("Using default load_dotenv() - checking current directory and parent directories")
 
+from llm_cache import extraction_cache, make_cache_key
+from rollups import reconcile_order_stats, reconcile_daily_rollup
+from warehouse_export import export_changed_orders
+from storage import sweep_unreferenced
+from pdf_text import extract_pdf_text, count_pages
+from chunked_extraction import extract_with_llm
+from llm_executor import LLMExecutor
+from rule_extractor import extract_invoice_data_with_rules, score_extraction
+from vendor_templates import layout_fingerprint, template_store
+from text_refs import put_text, get_text, delete_text
+from progress import publish_progress, TERMINAL_STAGES
+from single_flight import TASK_SOFT_TIME_LIMIT, pipeline_flight
+from line_items import line_item_rows, insert_line_items
+from search import index_orders
+from response_cache import order_cache
+from settings import ENV_PATHS, get_settings, on_reload, install_reload_signal_handler
+
+# Settings (including .env) are read once per process, not per task
+get_settings()
 # Initialize Celery with connection retry settings
 # Use lazy connection to avoid connecting during import
 celery = Celery(
@@ -55,8 +57,8 @@ celery.conf.result_accept_content = ['json']
 celery.conf.task_acks_late = True  # Acknowledge tasks after completion
 celery.conf.task_reject_on_worker_lost = True  # Reject tasks if worker dies
 celery.conf.worker_prefetch_multiplier = 1  # Process one task at a time per worker
-celery.conf.task_time_limit = 300  # Hard time limit (5 minutes)
-celery.conf.task_soft_time_limit = 240  # Soft time limit (4 minutes) - raises SoftTimeLimitExceeded
+celery.conf.task_time_limit = TASK_SOFT_TIME_LIMIT + 60  # Hard time limit (5 minutes)
+celery.conf.task_soft_time_limit = TASK_SOFT_TIME_LIMIT  # Soft time limit (4 minutes) - raises SoftTimeLimitExceeded
 
 # Result backend settings
 celery.conf.result_expires = 3600  # Results expire after 1 hour
@@ -82,64 +84,96 @@ celery.conf.worker_max_tasks_per_child = 1000  # Restart worker after N tasks to
 celery.conf.worker_disable_rate_limits = False  # Enable rate limiting
 celery.conf.worker_send_task_events = True  # Send task events for monitoring
 
-# Initialize OpenAI client (will be re-initialized when Flask app is available)
-def get_openai_client():
-    """Get OpenAI client, re-reading API key from environment"""
-    api_key = os.getenv('OPENAI_API_KEY', '')
-    if not api_key:
-        # Provide helpful error message
-        env_file = os.path.join(os.path.dirname(__file__), '.env')
-        error_msg = (
-            "OpenAI API key not configured.\n"
-            f"Please set OPENAI_API_KEY environment variable or add it to {env_file}\n"
-            "In Docker, ensure the environment variable is set in docker-compose.yml"
-        )
-        raise ValueError(error_msg)
-    return OpenAI(api_key=api_key)
+# Periodic jobs (run with `celery -A tasks.celery beat`)
+celery.conf.beat_schedule = {
+    'reconcile-order-stats': {
+        'task': 'reconcile_order_stats',
+        'schedule': float(os.getenv('STATS_RECONCILE_INTERVAL', 3600)),  # seconds
+    },
+    'reconcile-daily-rollup': {
+        'task': 'reconcile_daily_rollup',
+        'schedule': float(os.getenv('ANALYTICS_RECONCILE_INTERVAL', 24 * 3600)),  # seconds
+    },
+    'export-parquet': {
+        'task': 'export_parquet',
+        'schedule': float(os.getenv('PARQUET_EXPORT_INTERVAL', 24 * 3600)),  # seconds
+    },
+    'sweep-uploads': {
+        'task': 'sweep_uploads',
+        'schedule': float(os.getenv('UPLOAD_SWEEP_INTERVAL', 24 * 3600)),  # seconds
+    },
+}
 
-# Module-level client (will be updated when app initializes)
+# Each pipeline stage has its own queue so workers can be sized per workload:
+# parsing is CPU bound (prefork), extraction mostly waits on the LLM (threads)
+# and persisting is short database work. Other tasks use the default queue.
+PARSE_QUEUE = os.getenv('PARSE_QUEUE', 'parse')
+EXTRACT_QUEUE = os.getenv('EXTRACT_QUEUE', 'extract')
+PERSIST_QUEUE = os.getenv('PERSIST_QUEUE', 'persist')
+celery.conf.task_routes = {
+    'parse_document': {'queue': PARSE_QUEUE},
+    'extract_fields': {'queue': EXTRACT_QUEUE},
+    'persist_order': {'queue': PERSIST_QUEUE},
+    'process_invoice': {'queue': EXTRACT_QUEUE},  # All stages; dominated by the LLM wait
+}
+
+# One long-lived client per process: an asyncio executor whose HTTP connection
+# pool keeps connections to the API alive across tasks, with up to
+# LLM_MAX_IN_FLIGHT requests open at once under the shared rate limiter.
 openai_client = None
+_openai_client_lock = threading.Lock()
+
 
-def _init_openai_client():
-    """Initialize OpenAI client from environment"""
+def get_openai_client():
+    """Get the process-wide LLM client (see llm_executor.py), creating it on first use"""
     global openai_client
-    try:
-        # Try all possible .env file locations
-        env_paths = [
-            os.path.join(os.path.dirname(__file__), '.env'),  # Same directory as tasks.py
-            '/app/.env',  # Docker container path
-            '.env',  # Current working directory
-        ]
-        loaded = False
-        for env_path in env_paths:
-            if os.path.exists(env_path):
-                load_dotenv(env_path, override=True)
-                print(f"Loaded .env from: {env_path}")
-                loaded = True
-                break
-        
-        if not loaded:
-            # Fallback to default load_dotenv
-            load_dotenv(override=True)
-            print("Using default load_dotenv()")
-        
-        # Check environment variable
-        api_key = os.getenv('OPENAI_API_KEY') or os.environ.get('OPENAI_API_KEY')
-        if api_key:
-            openai_client = OpenAI(api_key=api_key)
-            print(f"OpenAI client initialized successfully (key length: {len(api_key)} chars)")
-        else:
-            raise ValueError("OPENAI_API_KEY not found in environment or .env file")
-    except ValueError as e:
-        openai_client = None
-        print(f"Warning: OpenAI API key not found: {e}")
-        print("LLM extraction will not work. Set OPENAI_API_KEY environment variable.")
-    except Exception as e:
-        openai_client = None
-        print(f"Warning: Failed to initialize OpenAI client: {e}")
+    if openai_client is None:
+        with _openai_client_lock:
+            if openai_client is None:
+                settings = get_settings()
+                if not settings.openai_api_key:
+                    raise ValueError(
+                        "OpenAI API key not configured.\n"
+                        f"Please set OPENAI_API_KEY environment variable or add it to {ENV_PATHS[0]}\n"
+                        "In Docker, ensure the environment variable is set in docker-compose.yml"
+                    )
+                openai_client = LLMExecutor.from_settings(settings)
+                print(f"OpenAI client initialized (key length: {len(settings.openai_api_key)} chars, "
+                      f"{settings.llm_max_in_flight} requests in flight)")
+    return openai_client
+
 
-# Try to initialize on module load
-_init_openai_client()
+@on_reload
+def _reset_openai_client(settings):
+    """Drop the client so the next call picks up reloaded settings"""
+    global openai_client
+    with _openai_client_lock:
+        client, openai_client = openai_client, None
+    close = getattr(client, 'close', None)
+    if callable(close):
+        close()
+
+
+# Forked children (Celery prefork, gunicorn) must not share the parent's sockets
+os.register_at_fork(after_in_child=lambda: globals().update(openai_client=None))
+
+
+@worker_process_init.connect
+def _install_settings_reload(**kwargs):
+    """Reload settings in pool processes on SIGHUP"""
+    install_reload_signal_handler()
+
+
+@worker_ready.connect
+def _install_main_process_settings_reload(sender=None, **kwargs):
+    """Reload settings on SIGHUP where tasks run in the worker's own process.
+    
+    ``--pool threads`` (the extract worker) and ``solo`` never fork, so
+    worker_process_init does not fire. This runs after Celery installed
+    its SIGHUP restart handler, which prefork workers keep.
+    """
+    if not isinstance(getattr(sender, 'pool', None), get_implementation('prefork')):
+        install_reload_signal_handler()
 
 # Auto-initialize Flask app when running as Celery worker
 # This ensures the app context is available for tasks
@@ -202,12 +236,14 @@ def make_celery(app):
                 # Try to update order status if possible
                 try:
                     if args and len(args) >= 1:
-                        order_id = args[0]
+                        # Later pipeline stages receive the previous stage's result
+                        order_id = args[0]['order_id'] if isinstance(args[0], dict) else args[0]
                         order = SalesOrderHeader.query.get(order_id)
                         if order:
                             order.processing_status = 'failed'
                             order.error_message = str(exc)
                             db.session.commit()
+                            order_cache.invalidate_order(order_id)
                 except Exception as e:
                     print(f"Error updating order status on failure: {e}")
     
@@ -215,133 +251,50 @@ def make_celery(app):
     return celery
 
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF file"""
+# Stop reading pages once this much text is available for extraction
+PDF_TEXT_MAX_CHARS = int(os.getenv('PDF_TEXT_MAX_CHARS', '200000'))
+
+
+def extract_text_from_pdf(file_path, max_chars=PDF_TEXT_MAX_CHARS):
+    """Extract text from PDF file (page-parallel for long documents)"""
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+        return extract_pdf_text(file_path, max_chars=max_chars)
     except Exception as e:
         print(f"Error extracting PDF text: {e}")
         return ""
 
 
+# Model and prompt version are part of the LLM cache key; bump PROMPT_VERSION
+# whenever the prompt changes so stale extractions are not served.
+LLM_MODEL = "gpt-4o-mini"
+PROMPT_VERSION = "2"
+
+
 def extract_invoice_data_with_llm(text_content):
     """Use OpenAI to extract structured invoice data"""
     
-    # Re-initialize client if needed (in case env var was set after module load)
-    global openai_client
+    # Serve identical documents from the cache instead of calling the LLM again
+    cache_key = make_cache_key(text_content, PROMPT_VERSION, LLM_MODEL)
+    cached = extraction_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    # Always try to reload environment variables and re-initialize client
-    # This ensures we have the latest API key even if it was set after module load
-    try:
-        # Try all possible .env file locations
-        env_paths = [
-            os.path.join(os.path.dirname(__file__), '.env'),  # Same directory as tasks.py
-            '/app/.env',  # Docker container path
-            '.env',  # Current working directory
-        ]
-        for env_path in env_paths:
-            if os.path.exists(env_path):
-                load_dotenv(env_path, override=True)
-                print(f"Reloaded .env from: {env_path}")
-                break
-        else:
-            # Fallback to default load_dotenv
-            load_dotenv(override=True)
-        
-        # Check if API key is available
-        api_key = os.getenv('OPENAI_API_KEY', '')
-        if not api_key:
-            # Try to get from environment (might be set by docker-compose)
-            api_key = os.environ.get('OPENAI_API_KEY', '')
-        
-        if not api_key:
-            raise ValueError(
-                "OpenAI API key not found in environment.\n"
-                f"Checked paths: {env_paths}\n"
-                "Please ensure OPENAI_API_KEY is set in:\n"
-                "1. backend/.env file, or\n"
-                "2. docker-compose.yml environment section, or\n"
-                "3. Host environment variable"
-            )
-        
-        # Re-initialize client with the API key only if not already set
-        if not openai_client:
-            openai_client = OpenAI(api_key=api_key)
-            print(f"OpenAI client initialized (key length: {len(api_key)} chars)")
-        
-    except ValueError as e:
-        raise ValueError(f"OpenAI API key not configured: {e}") from e
-    except Exception as e:
-        raise ValueError(f"Failed to initialize OpenAI client: {e}") from e
-    
-    if not openai_client:
-        raise ValueError("OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.")
+    client = get_openai_client()
     
-    prompt = f"""Extract invoice information from the following document text and return it as a JSON object with this exact structure:
-
-{{
-  "order_number": "string or null",
-  "invoice_number": "string or null",
-  "invoice_date": "YYYY-MM-DD or null",
-  "due_date": "YYYY-MM-DD or null",
-  "customer_name": "string or null",
-  "customer_address": "string or null",
-  "customer_email": "string or null",
-  "customer_phone": "string or null",
-  "subtotal": number or null,
-  "tax": number or null,
-  "total": number or null,
-  "currency": "string (default: USD)",
-  "line_items": [
-    {{
-      "line_number": number,
-      "product_code": "string or null",
-      "product_name": "string or null",
-      "description": "string or null",
-      "quantity": number,
-      "unit_price": number,
-      "discount": number (default: 0),
-      "line_total": number
-    }}
-  ]
-}}
-
-Document text:
-{text_content[:4000]}
-
-Return ONLY valid JSON, no additional text or explanation."""
-
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts structured data from invoices. Always return valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=2000
+        started = time.monotonic()
+        # Long documents are chunked and extracted concurrently (no truncation)
+        extracted_data, total_tokens = extract_with_llm(client, LLM_MODEL, text_content)
+        extraction_cache.set(
+            cache_key,
+            extracted_data,
+            latency=time.monotonic() - started,
+            tokens=total_tokens
         )
-        
-        content = response.choices[0].message.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-        
-        return json.loads(content)
+        return extracted_data
     except json.JSONDecodeError as e:
         error_msg = f"Failed to parse LLM response as JSON: {e}"
         print(f"Error with LLM extraction: {error_msg}")
-        print(f"Response content: {content[:500] if 'content' in locals() else 'N/A'}")
         raise ValueError(error_msg)
     except Exception as e:
         error_msg = f"Error with LLM extraction: {e}"
@@ -349,8 +302,116 @@ Return ONLY valid JSON, no additional text or explanation."""
         raise ValueError(error_msg)
 
 
-def _process_invoice_task_impl(self, order_id, file_path):
-    """Internal implementation of invoice processing task"""
+# Rule-based results scoring at least this much skip the LLM entirely
+RULE_EXTRACTION_MIN_CONFIDENCE = float(os.getenv('RULE_EXTRACTION_MIN_CONFIDENCE', '0.9'))
+
+
+def extract_invoice_data(text_content):
+    """Extract invoice data, trying the rule-based fast path and learned
+    vendor templates before the LLM.
+    
+    Returns ``(data, method, confidence)`` where method is 'rules',
+    'template' or 'llm'.
+    """
+    try:
+        data, confidence = extract_invoice_data_with_rules(text_content)
+    except Exception as e:
+        print(f"Rule-based extraction failed, using LLM: {e}")
+        data, confidence = None, 0.0
+    if data is not None and confidence >= RULE_EXTRACTION_MIN_CONFIDENCE:
+        return data, 'rules', confidence
+    
+    # Repeat vendors: read fields at the positions learned from their layout
+    fingerprint = None
+    try:
+        fingerprint = layout_fingerprint(text_content)
+        data = template_store.extract(fingerprint, text_content) if fingerprint else None
+        if data is not None:
+            return data, 'template', score_extraction(data)
+    except Exception as e:
+        print(f"Vendor template lookup failed, using LLM: {e}")
+    
+    data = extract_invoice_data_with_llm(text_content)
+    if fingerprint:
+        try:
+            template_store.learn(fingerprint, text_content, data)
+        except Exception as e:
+            print(f"Could not learn vendor template: {e}")
+    return data, 'llm', None
+
+
+def _report_progress(order_id, batch_id, stage, **details):
+    """Publish a stage change and mirror it as the PROGRESS state of the tracked task"""
+    event = publish_progress(order_id, stage, batch_id=batch_id, **details)
+    if stage in TERMINAL_STAGES or not current_task or current_task.request.called_directly:
+        return
+    # Clients track the chain's last task; the remaining tasks of a chain
+    # travel with the request, last task first
+    request = current_task.request
+    pending = request.chain or []
+    tracked_id = (pending[0].get('options') or {}).get('task_id') if pending else request.id
+    if not tracked_id:
+        return
+    try:
+        current_task.update_state(task_id=tracked_id, state='PROGRESS', meta=event)
+    except Exception as e:
+        print(f"Warning: could not record task progress: {e}")
+
+
+def _page_count(file_path):
+    """Number of pages of a PDF, or None when it cannot be read"""
+    try:
+        return count_pages(file_path)
+    except Exception:
+        return None
+
+
+def _mark_failed(order_id, error):
+    """Record a pipeline failure on the order"""
+    error_msg = str(error)
+    print(f"Error processing invoice for order {order_id}: {error_msg}")
+    print(traceback.format_exc())
+    
+    db.session.rollback()
+    order = SalesOrderHeader.query.get(order_id)
+    if order:
+        order.processing_status = 'failed'
+        order.error_message = error_msg
+        db.session.commit()
+        order_cache.invalidate_order(order_id)
+        _report_progress(order_id, order.batch_id, 'failed', error=error_msg)
+
+
+def _single_flight(stage, content_hash, fn, on_wait=None):
+    """Run a stage's work once per document content across concurrent tasks.
+    
+    ``on_wait`` runs when this task waits for a duplicate, e.g. to report the
+    stage's progress for its own order.
+    """
+    if not content_hash:
+        return fn()
+    result, shared = pipeline_flight.do(f"{stage}:{content_hash}", fn, on_wait=on_wait)
+    if shared:
+        print(f"Reused in-flight {stage} result for document {content_hash[:12]}")
+    return result
+
+
+def _read_document_text(file_path):
+    """Text of an uploaded document"""
+    file_ext = file_path.lower().split('.')[-1]
+    if file_ext == 'pdf':
+        text_content = extract_text_from_pdf(file_path)
+    else:
+        # For images, we'd use OCR here
+        text_content = "Image file detected. OCR processing would happen here."
+    
+    if not text_content or len(text_content.strip()) < 10:
+        raise ValueError("Could not extract text from document")
+    return text_content
+
+
+def _parse_document_impl(order_id, file_path):
+    """Stage 1: read the document's text (CPU bound)"""
     try:
         # Update status to processing
         order = SalesOrderHeader.query.get(order_id)
@@ -359,24 +420,86 @@ def _process_invoice_task_impl(self, order_id, file_path):
         
         order.processing_status = 'processing'
         db.session.commit()
+        order_cache.invalidate_order(order_id)
+        batch_id = order.batch_id
+        content_hash = order.content_hash
         
-        # Extract text from file
-        file_ext = file_path.lower().split('.')[-1]
-        if file_ext == 'pdf':
-            text_content = extract_text_from_pdf(file_path)
-        else:
-            # For images, we'd use OCR here
-            text_content = "Image file detected. OCR processing would happen here."
+        def parse():
+            if file_path.lower().endswith('.pdf'):
+                _report_progress(order_id, batch_id, 'parsing', pages=_page_count(file_path))
+            text_content = _read_document_text(file_path)
+            return put_text(f"content:{content_hash}" if content_hash else f"order:{order_id}", text_content)
+        
+        # Pass a reference, not the text itself, to the next stage; duplicate
+        # uploads being parsed concurrently share one reference
+        return {
+            'order_id': order_id,
+            'batch_id': batch_id,
+            'content_hash': content_hash,
+            'file_path': file_path,
+            'text_ref': _single_flight('parse', content_hash, parse,
+                                       on_wait=lambda: _report_progress(order_id, batch_id, 'parsing'))
+        }
         
-        if not text_content or len(text_content.strip()) < 10:
-            raise ValueError("Could not extract text from document")
+    except Exception as e:
+        _mark_failed(order_id, e)
+        # Re-raise to let Celery know the task failed
+        raise
+
+
+def _extract_fields_impl(parsed):
+    """Stage 2: turn the text into structured data (rules, template or LLM; I/O bound)"""
+    order_id = parsed['order_id']
+    batch_id = parsed.get('batch_id')
+    try:
+        def extract():
+            text_content = get_text(parsed['text_ref'])
+            if text_content is None:
+                # The stored text expired, e.g. a duplicate upload that waited in a
+                # backlogged queue; read the document again rather than failing
+                order = db.session.get(SalesOrderHeader, order_id)
+                file_path = parsed.get('file_path') or (order.file_path if order else None)
+                if not file_path:
+                    raise ValueError("Document text expired before extraction")
+                print(f"Text for order {order_id} expired before extraction; parsing the document again")
+                text_content = _read_document_text(file_path)
+            
+            _report_progress(order_id, batch_id, 'extracting', characters=len(text_content))
+            # Extract structured data (rule-based fast path, else LLM)
+            extracted_data, extraction_method, extraction_confidence = extract_invoice_data(text_content)
+            db.session.commit()  # Vendor template bookkeeping
+            if not parsed.get('content_hash'):
+                # Text stored per content hash may still be needed by a later
+                # upload of the same document; it expires after TEXT_REF_TTL_SECONDS
+                delete_text(parsed['text_ref'])
+            return {
+                'data': extracted_data,
+                'extraction_method': extraction_method,
+                'extraction_confidence': extraction_confidence
+            }
         
-        # Extract structured data using LLM
-        extracted_data = extract_invoice_data_with_llm(text_content)
+        # Duplicates in flight wait for, and reuse, one extraction
+        result = _single_flight('extract', parsed.get('content_hash'), extract,
+                                on_wait=lambda: _report_progress(order_id, batch_id, 'extracting'))
+        return {'order_id': order_id, 'batch_id': batch_id, **result}
+        
+    except Exception as e:
+        _mark_failed(order_id, e)
+        raise
+
+
+def _persist_order_impl(extracted):
+    """Stage 3: write the extracted header and line items"""
+    order_id = extracted['order_id']
+    extracted_data = extracted['data']
+    try:
+        order = SalesOrderHeader.query.get(order_id)
+        if not order:
+            raise ValueError(f"Order {order_id} not found")
         
-        # Generate order number if not present
-        if not extracted_data.get('order_number'):
-            extracted_data['order_number'] = f"ORD-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        line_items = extracted_data.get('line_items', [])
+        _report_progress(order_id, order.batch_id, 'persisting',
+                         extraction_method=extracted['extraction_method'], line_items=len(line_items))
         
         # Parse dates
         invoice_date = None
@@ -403,30 +526,23 @@ def _process_invoice_task_impl(self, order_id, file_path):
         order.subtotal = extracted_data.get('subtotal') or order.subtotal
         order.tax = extracted_data.get('tax') or order.tax
         order.total = extracted_data.get('total') or order.total
-        order.currency = extracted_data.get('currency', 'USD')
+        # Models return codes like 'usd'; rollups and analytics compare upper-case
+        order.currency = (extracted_data.get('currency') or 'USD').strip().upper()
+        order.extraction_method = extracted['extraction_method']
+        order.extraction_confidence = extracted['extraction_confidence']
         order.processing_status = 'completed'
         order.status = 'completed'
         order.error_message = None
         
-        # Delete existing line items
+        # Replace the line items with set-based statements; the header update
+        # and the new lines are committed in one transaction
         SalesOrderDetail.query.filter_by(order_id=order_id).delete()
-        
-        # Create line items
-        for item_data in extracted_data.get('line_items', []):
-            line_item = SalesOrderDetail(
-                order_id=order.id,
-                line_number=item_data.get('line_number'),
-                product_code=item_data.get('product_code'),
-                product_name=item_data.get('product_name'),
-                description=item_data.get('description'),
-                quantity=item_data.get('quantity'),
-                unit_price=item_data.get('unit_price'),
-                discount=item_data.get('discount', 0),
-                line_total=item_data.get('line_total')
-            )
-            db.session.add(line_item)
-        
+        insert_line_items(db.session.connection(), line_item_rows(order.id, line_items))
+        db.session.flush()
+        index_orders(db.session.connection(), [order.id])
         db.session.commit()
+        order_cache.invalidate_order(order_id)
+        _report_progress(order_id, order.batch_id, 'completed', line_items=len(line_items))
         
         return {
             'status': 'success',
@@ -435,25 +551,19 @@ def _process_invoice_task_impl(self, order_id, file_path):
         }
         
     except Exception as e:
-        # Update order with error
-        error_msg = str(e)
-        print(f"Error processing invoice for order {order_id}: {error_msg}")
-        print(traceback.format_exc())
-        
-        order = SalesOrderHeader.query.get(order_id)
-        if order:
-            order.processing_status = 'failed'
-            order.error_message = error_msg
-            db.session.commit()
-        
-        # Re-raise to let Celery know the task failed
+        _mark_failed(order_id, e)
         raise
 
 
+def _process_invoice_task_impl(self, order_id, file_path):
+    """Internal implementation of invoice processing: all stages in one process"""
+    return _persist_order_impl(_extract_fields_impl(_parse_document_impl(order_id, file_path)))
+
+
 # Initialize Flask app for worker process if not already initialized
 def _ensure_flask_app():
     """Ensure Flask app is initialized for worker process"""
-    global _flask_app, openai_client
+    global _flask_app
     if _flask_app is None:
         try:
             # Try to import app from app.py (this will call make_celery)
@@ -462,8 +572,6 @@ def _ensure_flask_app():
             # make_celery should have been called in app.py, but ensure it
             if not hasattr(celery, 'flask_app'):
                 make_celery(flask_app)
-            # Re-initialize OpenAI client now that we have the app context
-            _init_openai_client()
         except ImportError as e:
             # If app.py can't be imported, create a minimal app
             print(f"Warning: Could not import app from app.py: {e}")
@@ -487,22 +595,9 @@ def _ensure_flask_app():
             db.init_app(flask_app)
             _flask_app = flask_app
             make_celery(flask_app)
-            # Re-initialize OpenAI client
-            _init_openai_client()
 
-@celery.task(
-    bind=True,
-    name='process_invoice',
-    max_retries=3,
-    default_retry_delay=60,  # Wait 60 seconds before retry
-    soft_time_limit=240,  # 4 minutes soft limit
-    time_limit=300,  # 5 minutes hard limit
-    retry_backoff=True,  # Exponential backoff for retries
-    retry_backoff_max=600,  # Max 10 minutes between retries
-    retry_jitter=True  # Add randomness to retry delays to prevent thundering herd
-)
-def process_invoice_task(self, order_id, file_path):
-    """Celery task to process invoice document with retry logic"""
+def _run_stage(self, impl, *args):
+    """Run a pipeline stage inside the Flask app context, retrying transient failures"""
     # Ensure Flask app is initialized (for worker process)
     _ensure_flask_app()
     
@@ -514,12 +609,12 @@ def process_invoice_task(self, order_id, file_path):
         flask_app = _flask_app or getattr(celery, 'flask_app', None)
         if flask_app:
             with flask_app.app_context():
-                return _process_invoice_task_impl(self, order_id, file_path)
+                return impl(*args)
         else:
             raise RuntimeError("No Flask application context available and no Flask app found")
     
     try:
-        return _process_invoice_task_impl(self, order_id, file_path)
+        return impl(*args)
     except (ValueError, RuntimeError) as exc:
         # Don't retry on these errors - they're likely permanent failures
         raise
@@ -529,3 +624,111 @@ def process_invoice_task(self, order_id, file_path):
         # Retry with exponential backoff (handled by retry_backoff=True)
         raise self.retry(exc=exc)
 
+
+# Retry policy shared by every processing task
+_PROCESSING_TASK_OPTIONS = dict(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,  # Wait 60 seconds before retry
+    soft_time_limit=TASK_SOFT_TIME_LIMIT,  # 4 minutes soft limit (single-flight waits are derived from it)
+    time_limit=TASK_SOFT_TIME_LIMIT + 60,  # 5 minutes hard limit
+    retry_backoff=True,  # Exponential backoff for retries
+    retry_backoff_max=600,  # Max 10 minutes between retries
+    retry_jitter=True  # Add randomness to retry delays to prevent thundering herd
+)
+
+
+@celery.task(name='parse_document', **_PROCESSING_TASK_OPTIONS)
+def parse_document_task(self, order_id, file_path):
+    """Pipeline stage 1: extract the document text"""
+    return _run_stage(self, _parse_document_impl, order_id, file_path)
+
+
+@celery.task(name='extract_fields', **_PROCESSING_TASK_OPTIONS)
+def extract_fields_task(self, parsed):
+    """Pipeline stage 2: extract structured fields from the text"""
+    return _run_stage(self, _extract_fields_impl, parsed)
+
+
+@celery.task(name='persist_order', **_PROCESSING_TASK_OPTIONS)
+def persist_order_task(self, extracted):
+    """Pipeline stage 3: save the extracted order"""
+    return _run_stage(self, _persist_order_impl, extracted)
+
+
+@celery.task(name='process_invoice', **_PROCESSING_TASK_OPTIONS)
+def process_invoice_task(self, order_id, file_path):
+    """Celery task running all pipeline stages in one process (chunked batches)"""
+    return _run_stage(self, _process_invoice_task_impl, self, order_id, file_path)
+
+
+def invoice_pipeline(order_id, file_path):
+    """Signature of the parse -> extract -> persist chain for one document"""
+    return chain(
+        parse_document_task.s(order_id, file_path),
+        extract_fields_task.s(),
+        persist_order_task.s()
+    )
+
+
+def start_invoice_pipeline(order_id, file_path):
+    """Queue one document; the returned result (and its id) tracks the final stage"""
+    return invoice_pipeline(order_id, file_path).apply_async()
+
+
+def enqueue_invoice_batch(jobs, chunk_size=0):
+    """Dispatch many (order_id, file_path) jobs to the workers in one go.
+    
+    Jobs are sent as a single Celery group of pipelines. With ``chunk_size``
+    > 1 they are packed into chunks so each message processes several
+    invoices end to end, which cuts broker overhead for very large batches at
+    the cost of per-invoice retries and per-stage queues.
+    """
+    jobs = [(order_id, file_path) for order_id, file_path in jobs]
+    if chunk_size and chunk_size > 1:
+        return process_invoice_task.chunks(jobs, chunk_size).group().apply_async()
+    return group(invoice_pipeline(order_id, file_path) for order_id, file_path in jobs).apply_async()
+
+
+@celery.task(name='reconcile_order_stats')
+def reconcile_order_stats_task():
+    """Recompute the /api/stats rollup from the orders table and repair drift"""
+    _ensure_flask_app()
+    drift = reconcile_order_stats()
+    if drift['orders'] or drift['value']:
+        print(f"Repaired order stats drift: {drift}")
+    return drift
+
+
+@celery.task(name='reconcile_daily_rollup')
+def reconcile_daily_rollup_task():
+    """Recompute the analytics rollup from the orders table and repair drift"""
+    _ensure_flask_app()
+    corrected = reconcile_daily_rollup()
+    if corrected:
+        print(f"Repaired {corrected} drifted analytics rollup rows")
+    return corrected
+
+
+@celery.task(name='export_parquet')
+def export_parquet_task():
+    """Write orders changed since the last run to the Parquet warehouse export"""
+    _ensure_flask_app()
+    summary = export_changed_orders()
+    print(f"Parquet export {summary['run_id']}: {summary['orders']} orders, "
+          f"{summary['line_items']} line items, watermark {summary['watermark']}")
+    return summary
+
+
+@celery.task(name='sweep_uploads')
+def sweep_uploads_task():
+    """Remove stored documents that no order references any more"""
+    _ensure_flask_app()
+
+    def is_referenced(file_path):
+        return db.session.query(SalesOrderHeader.id).filter_by(file_path=file_path).first() is not None
+
+    removed = sweep_unreferenced(_flask_app.config.get('UPLOAD_FOLDER', 'uploads'), is_referenced)
+    if removed:
+        print(f"Removed {removed} unreferenced uploaded files")
+    return removed
@@ -1,5 +1,6 @@
 import pytest
 import os
+import fakeredis
 import tempfile
 import sys
 from flask import Flask
@@ -16,6 +17,10 @@ os.environ['OPENAI_API_KEY'] = 'test-key-for-testing'
 # Import app after setting environment variables
 from app import app, db
 from models import SalesOrderHeader, SalesOrderDetail
+from llm_cache import extraction_cache
+from vendor_templates import template_store
+from single_flight import pipeline_flight
+from response_cache import order_cache
 
 
 @pytest.fixture(scope='function', autouse=True)
@@ -41,6 +46,41 @@ def setup_test_db():
         db.drop_all()
 
 
+@pytest.fixture(scope='function', autouse=True)
+def clear_llm_cache():
+    """Start every test with an empty in-process LLM cache"""
+    extraction_cache.clear()
+    yield
+    extraction_cache.clear()
+
+
+@pytest.fixture(scope='function', autouse=True)
+def clear_template_stats():
+    """Start every test with zeroed vendor template counters"""
+    template_store.clear_stats()
+    yield
+
+
+@pytest.fixture(scope='function', autouse=True)
+def clear_single_flight_stats():
+    """Start every test with zeroed single-flight counters"""
+    pipeline_flight.clear_stats()
+    yield
+
+
+@pytest.fixture(scope='function', autouse=True)
+def clear_response_cache_stats():
+    """Start every test with zeroed response cache counters"""
+    order_cache.clear_stats()
+    yield
+
+
+@pytest.fixture
+def fake_redis():
+    """In-memory Redis (fakeredis, with Lua scripting) private to the test"""
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+
 @pytest.fixture(scope='function')
 def client():
     """Create a test client"""
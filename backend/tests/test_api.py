@@ -1,6 +1,7 @@
 import pytest
 import json
 import os
+import time
 from io import BytesIO
 from unittest.mock import patch, MagicMock
 from app import app, db
@@ -21,12 +22,12 @@ class TestHealthCheck:
 class TestUpload:
     """Test upload endpoint"""
     
-    @patch('app.process_invoice_task')
+    @patch('app.start_invoice_pipeline')
     def test_upload_pdf_success(self, mock_task, client):
         """Test successful PDF upload"""
         mock_task_instance = MagicMock()
         mock_task_instance.id = 'task-123'
-        mock_task.delay.return_value = mock_task_instance
+        mock_task.return_value = mock_task_instance
         
         # Create a mock PDF file
         data = {
@@ -40,7 +41,59 @@ class TestUpload:
         assert 'order_id' in response_data
         assert 'task_id' in response_data
         assert response_data['processing_status'] == 'pending'
-    
+
+    @patch('app.start_invoice_pipeline')
+    def test_uploads_in_the_same_second(self, mock_task, client):
+        """Test uploads within one second get distinct order numbers"""
+        mock_task.return_value = MagicMock(id='task-123')
+        numbers = set()
+        for i in range(5):
+            response = client.post('/api/upload', data={'file': (BytesIO(f'%PDF-1.4 {i}'.encode()), 'test.pdf')},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 202
+            numbers.add(json.loads(response.data)['order_number'])
+        assert len(numbers) == 5
+
+    @patch('app.start_invoice_pipeline')
+    def test_upload_stores_file_by_content_hash(self, mock_task, client):
+        """Test uploads are stored under their SHA-256 digest"""
+        import hashlib
+        mock_task.return_value = MagicMock(id='task-123')
+        content = b'%PDF-1.4 hashed pdf content'
+
+        response = client.post('/api/upload', data={'file': (BytesIO(content), 'test.pdf')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 202
+
+        digest = hashlib.sha256(content).hexdigest()
+        order = db.session.get(SalesOrderHeader, json.loads(response.data)['order_id'])
+        assert order.content_hash == digest
+        assert os.path.basename(order.file_path) == f'{digest}.pdf'
+        assert os.path.exists(order.file_path)
+
+    @patch('app.start_invoice_pipeline')
+    def test_upload_duplicate_links_to_completed_order(self, mock_task, client):
+        """Test re-uploading an already extracted document skips the pipeline"""
+        mock_task.return_value = MagicMock(id='task-123')
+        content = b'%PDF-1.4 duplicate pdf content'
+
+        first = client.post('/api/upload', data={'file': (BytesIO(content), 'a.pdf')},
+                            content_type='multipart/form-data')
+        first_id = json.loads(first.data)['order_id']
+        order = db.session.get(SalesOrderHeader, first_id)
+        order.processing_status = 'completed'
+        db.session.commit()
+
+        second = client.post('/api/upload', data={'file': (BytesIO(content), 'b.pdf')},
+                             content_type='multipart/form-data')
+        assert second.status_code == 200
+        data = json.loads(second.data)
+        assert data['duplicate'] is True
+        assert data['order_id'] == first_id
+        assert data['task_id'] is None
+        assert mock_task.call_count == 1
+        assert SalesOrderHeader.query.count() == 1
+
     def test_upload_no_file(self, client):
         """Test upload without file"""
         response = client.post('/api/upload')
@@ -60,6 +113,137 @@ class TestUpload:
         assert 'Unsupported file type' in data['error']
 
 
+class TestBatchUpload:
+    """Test bulk upload endpoints"""
+
+    @patch('app.enqueue_invoice_batch')
+    def test_batch_upload_files(self, mock_enqueue, client):
+        """Test multipart batch upload creates orders and dispatches one group"""
+        mock_enqueue.return_value = MagicMock(id='group-123')
+        data = {
+            'files': [
+                (BytesIO(b'%PDF-1.4 one'), 'one.pdf'),
+                (BytesIO(b'%PDF-1.4 two'), 'two.pdf'),
+                (BytesIO(b'%PDF-1.4 one'), 'one-again.pdf'),
+                (BytesIO(b'notes'), 'notes.txt'),
+            ]
+        }
+
+        response = client.post('/api/upload/batch', data=data, content_type='multipart/form-data')
+        assert response.status_code == 202
+
+        result = json.loads(response.data)
+        assert result['queued'] == 2
+        assert result['group_id'] == 'group-123'
+        assert result['rejected'][0]['filename'] == 'notes.txt'
+        assert result['orders'][0]['filenames'] == ['one.pdf', 'one-again.pdf']
+
+        jobs = mock_enqueue.call_args[0][0]
+        assert [order_id for order_id, _ in jobs] == [o['order_id'] for o in result['orders']]
+        assert SalesOrderHeader.query.filter_by(batch_id=result['batch_id']).count() == 2
+        assert json.loads(client.get('/api/stats').data)['total_orders'] == 2
+
+    @patch('app.enqueue_invoice_batch')
+    def test_batch_upload_zip(self, mock_enqueue, client):
+        """Test ZIP archives are expanded into individual orders"""
+        import zipfile
+        mock_enqueue.return_value = MagicMock(id='group-123')
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('march/a.pdf', b'%PDF-1.4 a')
+            zf.writestr('march/b.pdf', b'%PDF-1.4 b')
+            zf.writestr('march/', b'')
+        archive.seek(0)
+
+        response = client.post('/api/upload/batch', data={'files': (archive, 'march.zip')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 202
+        assert json.loads(response.data)['queued'] == 2
+
+    @patch('app.enqueue_invoice_batch')
+    def test_batch_upload_rejects_zip_bomb(self, mock_enqueue, client, monkeypatch):
+        """Test archives expanding past MAX_ARCHIVE_UNCOMPRESSED_SIZE create no orders"""
+        import zipfile
+        monkeypatch.setitem(app.config, 'MAX_ARCHIVE_UNCOMPRESSED_SIZE', 1024 * 1024)
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('a.pdf', b'%PDF-1.4 a')
+            zf.writestr('bomb.pdf', b'\0' * (4 * 1024 * 1024))
+        archive.seek(0)
+
+        response = client.post('/api/upload/batch', data={'files': (archive, 'bomb.zip')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 400
+        result = json.loads(response.data)
+        assert result['rejected'][0]['filename'] == 'bomb.zip'
+        assert 'expands to more than' in result['rejected'][0]['error']
+        assert SalesOrderHeader.query.count() == 0
+        mock_enqueue.assert_not_called()
+
+    @patch('app.enqueue_invoice_batch')
+    def test_batch_upload_drops_members_of_failed_archive(self, mock_enqueue, client):
+        """Test members stored before an archive failed mid-stream are not queued"""
+        mock_enqueue.return_value = MagicMock(id='group-123')
+
+        def members(stream, max_total_size):
+            yield 'shared.pdf', 'pdf', BytesIO(b'%PDF-1.4 shared')
+            yield 'only-in-zip.pdf', 'pdf', BytesIO(b'%PDF-1.4 zip')
+            raise ValueError('Archive expands to more than 10 bytes')
+
+        data = {'files': [(BytesIO(b'%PDF-1.4 shared'), 'shared.pdf'), (BytesIO(b'PK'), 'lying.zip')]}
+        with patch('app.iter_zip_members', side_effect=members):
+            response = client.post('/api/upload/batch', data=data, content_type='multipart/form-data')
+        assert response.status_code == 202
+        result = json.loads(response.data)
+        assert result['queued'] == 1
+        assert result['orders'][0]['filenames'] == ['shared.pdf']
+        assert result['rejected'][0]['filename'] == 'lying.zip'
+
+    @patch('app.enqueue_invoice_batch')
+    def test_batch_upload_links_completed_duplicates(self, mock_enqueue, client):
+        """Test already extracted documents are not queued again"""
+        import hashlib
+        content = b'%PDF-1.4 done'
+        existing = SalesOrderHeader(order_number='ORD-DONE', processing_status='completed',
+                                    content_hash=hashlib.sha256(content).hexdigest())
+        db.session.add(existing)
+        db.session.commit()
+
+        response = client.post('/api/upload/batch', data={'files': [(BytesIO(content), 'done.pdf')]},
+                               content_type='multipart/form-data')
+        result = json.loads(response.data)
+        assert result['queued'] == 0
+        assert result['duplicates'] == [{'filename': 'done.pdf', 'order_id': existing.id}]
+        mock_enqueue.assert_not_called()
+
+    def test_batch_upload_no_files(self, client):
+        """Test batch upload without files"""
+        response = client.post('/api/upload/batch')
+        assert response.status_code == 400
+
+    def test_batch_status(self, client):
+        """Test aggregate batch progress"""
+        statuses = ['completed', 'completed', 'failed', 'processing']
+        for i, status in enumerate(statuses):
+            db.session.add(SalesOrderHeader(order_number=f'ORD-B-{i}', batch_id='batch-1',
+                                            processing_status=status))
+        db.session.commit()
+
+        response = client.get('/api/upload/batch/batch-1')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['total'] == 4
+        assert data['completed'] == 2
+        assert data['failed'] == 1
+        assert data['progress'] == 0.75
+        assert data['done'] is False
+
+    def test_batch_status_not_found(self, client):
+        """Test progress for an unknown batch"""
+        response = client.get('/api/upload/batch/unknown')
+        assert response.status_code == 404
+
+
 class TestGetOrders:
     """Test get orders endpoint"""
     
@@ -89,6 +273,269 @@ class TestGetOrders:
         assert len(order['line_items']) == 2
 
 
+    def _create_orders(self, count):
+        """Create orders with distinct creation times, oldest first"""
+        from datetime import datetime, timedelta
+        base = datetime(2024, 1, 1)
+        orders = []
+        for i in range(count):
+            order = SalesOrderHeader(
+                order_number=f'ORD-PAGE-{i}',
+                customer_name='Acme Corp' if i % 2 else 'Globex',
+                processing_status='completed' if i % 3 else 'failed',
+                created_at=base + timedelta(days=i)
+            )
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(SalesOrderDetail(order_id=order.id, line_number=1, product_name='Widget'))
+            orders.append(order)
+        db.session.commit()
+        return orders
+
+    def test_get_orders_keyset_pagination(self, client):
+        """Test walking all pages with the cursor"""
+        orders = self._create_orders(5)
+
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/orders?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = json.loads(client.get(url).data)
+            seen.extend(o['id'] for o in data['orders'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+
+        assert seen == [o.id for o in reversed(orders)]
+
+    def test_get_orders_filters(self, client):
+        """Test status, customer and date range filters"""
+        self._create_orders(6)
+
+        data = json.loads(client.get('/api/orders?processing_status=failed').data)
+        assert {o['processing_status'] for o in data['orders']} == {'failed'}
+        assert data['count'] == 2
+
+        data = json.loads(client.get('/api/orders?customer=acme').data)
+        assert {o['customer_name'] for o in data['orders']} == {'Acme Corp'}
+
+        data = json.loads(client.get('/api/orders?date_from=2024-01-02&date_to=2024-01-03').data)
+        assert [o['order_number'] for o in data['orders']] == ['ORD-PAGE-2', 'ORD-PAGE-1']
+
+    def test_get_orders_without_line_items(self, client):
+        """Test line items can be omitted"""
+        self._create_orders(2)
+        data = json.loads(client.get('/api/orders?include_line_items=false').data)
+        assert all('line_items' not in o for o in data['orders'])
+
+    def test_get_orders_line_items_loaded_in_one_query(self, client):
+        """Test line items are eager loaded instead of one query per order"""
+        from sqlalchemy import event
+        self._create_orders(10)
+        db.session.expire_all()
+
+        statements = []
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            data = json.loads(client.get('/api/orders').data)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+
+        assert all(len(o['line_items']) == 1 for o in data['orders'])
+        detail_queries = [s for s in statements if 'FROM sales_order_detail' in s]
+        assert len(detail_queries) == 1
+
+    def test_get_orders_sparse_fields(self, client):
+        """Test only the requested fields are returned, with keyset paging intact"""
+        orders = self._create_orders(3)
+
+        data = json.loads(client.get('/api/orders?fields=id,processing_status&limit=2').data)
+        assert data['orders'] == [
+            {'id': orders[2].id, 'processing_status': 'completed'},
+            {'id': orders[1].id, 'processing_status': 'completed'},
+        ]
+
+        data = json.loads(client.get(f"/api/orders?fields=id,line_items&cursor={data['next_cursor']}").data)
+        assert [o['id'] for o in data['orders']] == [orders[0].id]
+        assert data['orders'][0]['line_items'][0]['product_name'] == 'Widget'
+
+    def test_get_orders_invalid_params(self, client):
+        """Test invalid cursor, limit and fields are rejected"""
+        assert client.get('/api/orders?cursor=not-a-cursor').status_code == 400
+        assert client.get('/api/orders?limit=0').status_code == 400
+        assert client.get('/api/orders?fields=id,secret').status_code == 400
+
+
+class TestExportOrders:
+    """Test streaming CSV / NDJSON export"""
+
+    def _create_orders(self, count, lines=2):
+        from datetime import datetime, timedelta
+        base = datetime(2024, 1, 1)
+        for i in range(count):
+            order = SalesOrderHeader(order_number=f'ORD-EXP-{i}', total=10 * i,
+                                     processing_status='failed' if i == 0 else 'completed',
+                                     created_at=base + timedelta(days=i))
+            db.session.add(order)
+            db.session.flush()
+            for n in range(1, lines + 1):
+                db.session.add(SalesOrderDetail(order_id=order.id, line_number=n, product_name=f'Item, "{n}"',
+                                                quantity=n, unit_price=2.5, line_total=2.5 * n))
+        db.session.commit()
+
+    def test_ndjson(self, client):
+        """Test one order per line, newest first, with filters applied"""
+        self._create_orders(3)
+        response = client.get('/api/orders/export?format=ndjson&processing_status=completed')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'application/x-ndjson'
+        assert 'attachment; filename="orders-' in response.headers['Content-Disposition']
+
+        orders = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [o['order_number'] for o in orders] == ['ORD-EXP-2', 'ORD-EXP-1']
+        assert [item['line_number'] for item in orders[0]['line_items']] == [1, 2]
+
+    def test_csv_one_row_per_line_item(self, client):
+        """Test CSV repeats order columns on each line item row"""
+        import csv
+        from datetime import datetime
+        self._create_orders(2)
+        db.session.add(SalesOrderHeader(order_number='ORD-EXP-EMPTY', created_at=datetime(2023, 1, 1)))
+        db.session.commit()
+
+        response = client.get('/api/orders/export?format=csv&fields=order_number,total,line_items')
+        assert response.mimetype == 'text/csv'
+        rows = list(csv.reader(response.data.decode().splitlines()))
+        assert rows[0][:3] == ['order_number', 'total', 'line_number']
+        assert rows[1][:3] == ['ORD-EXP-1', '10.00', '1']
+        assert rows[1][rows[0].index('product_name')] == 'Item, "1"'
+        assert [row[0] for row in rows[1:]] == ['ORD-EXP-1', 'ORD-EXP-1', 'ORD-EXP-0', 'ORD-EXP-0', 'ORD-EXP-EMPTY']
+        assert rows[-1][2:] == [''] * (len(rows[0]) - 2)
+
+    def test_streams_in_batches(self, client):
+        """Test orders are read in batches, each with one line item query"""
+        from sqlalchemy import event
+        self._create_orders(5, lines=1)
+
+        statements = []
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            with patch.dict(app.config, {'EXPORT_BATCH_SIZE': 2}):
+                lines = client.get('/api/orders/export?format=ndjson').data.decode().splitlines()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        assert len(lines) == 5
+        assert len([s for s in statements if 'FROM sales_order_detail' in s]) == 3
+
+    def test_invalid_params(self, client):
+        """Test unknown formats and bad filters are rejected before streaming"""
+        assert client.get('/api/orders/export?format=xml').status_code == 400
+        assert client.get('/api/orders/export?date_from=yesterday').status_code == 400
+        assert client.get('/api/orders/export?fields=nope').status_code == 400
+
+    def test_open_streams_are_capped_per_worker(self, monkeypatch):
+        """Test streams beyond MAX_STREAMS_PER_WORKER get 503 until one ends"""
+        import threading
+        from flask import Response
+        from app import holds_stream_slot
+        monkeypatch.setattr('app._stream_slots', threading.BoundedSemaphore(1))
+        stream = holds_stream_slot(lambda: Response(iter(['chunk'])))
+        missing = holds_stream_slot(lambda: ({'error': 'Order not found'}, 404))
+
+        with app.test_request_context():
+            assert missing().status_code == 404  # Not streamed, slot freed at once
+            first = stream()
+            assert first.status_code == 200
+            busy = stream()
+            assert busy.status_code == 503
+            assert busy.headers['Retry-After'] == '2'
+
+            first.close()  # Closed before its body was read
+            second = stream()
+            assert list(second.response) == ['chunk']
+            assert stream().status_code == 200
+
+
+class TestSearchOrders:
+    """Test the full-text search endpoint"""
+
+    def _add(self, number, customer, product, status='completed'):
+        from search import index_orders
+        order = SalesOrderHeader(order_number=number, customer_name=customer, processing_status=status)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(SalesOrderDetail(order_id=order.id, line_number=1, product_name=product))
+        db.session.flush()
+        index_orders(db.session.connection(), [order.id])
+        db.session.commit()
+        return order
+
+    def test_search_ranked_with_filters_and_fields(self, client):
+        """Test results are ranked, filtered like the list endpoint and support fields"""
+        by_product = self._add('ORD-Q-1', 'Globex', 'Acme anvil')
+        by_customer = self._add('ORD-Q-2', 'Acme Corp', 'Rocket skates')
+        self._add('ORD-Q-3', 'Acme Corp', 'Bird seed', status='failed')
+
+        data = json.loads(client.get('/api/orders/search?q=acme&processing_status=completed'
+                                     '&fields=order_number').data)
+        assert [o['order_number'] for o in data['orders']] == ['ORD-Q-2', 'ORD-Q-1']
+        assert data['orders'][0]['score'] > data['orders'][1]['score']
+        assert set(data['orders'][0]) == {'order_number', 'score'}
+        assert not data['has_more']
+
+        data = json.loads(client.get('/api/orders/search?q=acme&limit=1&processing_status=completed').data)
+        assert [o['id'] for o in data['orders']] == [by_customer.id]
+        data = json.loads(client.get(f"/api/orders/search?q=acme&limit=1&processing_status=completed"
+                                     f"&cursor={data['next_cursor']}").data)
+        assert [o['id'] for o in data['orders']] == [by_product.id]
+
+    def test_search_follows_updates_and_deletes(self, client):
+        """Test PUT and DELETE keep the index in sync"""
+        order = self._add('ORD-Q-1', 'Acme Corp', 'Anvil')
+        client.put(f'/api/orders/{order.id}', content_type='application/json',
+                   data=json.dumps({'customer_name': 'Initech',
+                                    'line_items': [{'line_number': 1, 'product_name': 'Stapler'}]}))
+        assert json.loads(client.get('/api/orders/search?q=acme').data)['count'] == 0
+        assert json.loads(client.get('/api/orders/search?q=initech stapler').data)['count'] == 1
+
+        client.delete(f'/api/orders/{order.id}')
+        assert json.loads(client.get('/api/orders/search?q=initech').data)['count'] == 0
+
+    def test_search_line_items_default_and_deleted_matches(self, client):
+        """Test line items are included like the list endpoint and vanished orders are skipped"""
+        kept = self._add('ORD-Q-1', 'Acme Corp', 'Anvil')
+        gone = self._add('ORD-Q-2', 'Acme Corp', 'Rocket skates')
+
+        data = json.loads(client.get('/api/orders/search?q=acme').data)
+        assert [len(o['line_items']) for o in data['orders']] == [1, 1]
+        data = json.loads(client.get('/api/orders/search?q=acme&include_line_items=false').data)
+        assert all('line_items' not in o for o in data['orders'])
+
+        # Deleted after the index was searched, before the rows were read
+        matches = [(gone.id, 2.0), (kept.id, 1.0)]
+        SalesOrderDetail.query.filter_by(order_id=gone.id).delete()
+        db.session.delete(gone)
+        db.session.commit()
+        with patch('app.search_order_ids', return_value=(matches, None)):
+            response = client.get('/api/orders/search?q=acme')
+        assert response.status_code == 200
+        assert [o['id'] for o in json.loads(response.data)['orders']] == [kept.id]
+
+    def test_search_invalid_params(self, client):
+        """Test missing queries and bad cursors are rejected"""
+        assert client.get('/api/orders/search').status_code == 400
+        assert client.get('/api/orders/search?q=acme&cursor=bogus').status_code == 400
+
+
 class TestGetOrder:
     """Test get single order endpoint"""
     
@@ -99,7 +546,12 @@ class TestGetOrder:
         data = json.loads(response.data)
         assert data['id'] == sample_order.id
         assert data['order_number'] == sample_order.order_number
-    
+
+    def test_get_order_sparse_fields(self, client, sample_order):
+        """Test a specific order with a sparse fieldset"""
+        response = client.get(f'/api/orders/{sample_order.id}?fields=total,version')
+        assert json.loads(response.data) == {'total': 1100.0, 'version': 1}
+
     def test_get_order_not_found(self, client):
         """Test getting non-existent order"""
         response = client.get('/api/orders/99999')
@@ -169,6 +621,81 @@ class TestUpdateOrder:
         assert len(data['order']['line_items']) == 1
         assert data['order']['line_items'][0]['product_name'] == 'New Product'
     
+    def test_update_line_items_applies_diff(self, client, sample_order_with_items):
+        """Test only new, changed and removed line items are written"""
+        order = sample_order_with_items.to_dict()
+        first, second = sorted(order['line_items'], key=lambda item: item['line_number'])
+        update_data = {
+            'line_items': [
+                dict(first, quantity=4, line_total=2000.00),
+                {'line_number': 3, 'product_name': 'Added', 'quantity': 1, 'unit_price': 5, 'line_total': 5}
+            ]
+        }
+
+        response = client.put(f'/api/orders/{order["id"]}', data=json.dumps(update_data),
+                              content_type='application/json')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['line_item_changes'] == {'inserted': 1, 'updated': 1, 'deleted': 1}
+        lines = {item['line_number']: item for item in data['order']['line_items']}
+        assert sorted(lines) == [1, 3]
+        assert lines[1]['id'] == first['id']
+        assert lines[1]['quantity'] == 4
+        assert lines[3]['discount'] is None or lines[3]['discount'] == 0
+        assert db.session.get(SalesOrderDetail, second['id']) is None
+
+    def test_update_unchanged_line_items_writes_nothing(self, client, sample_order_with_items):
+        """Test resubmitting the same lines keeps their rows"""
+        order = sample_order_with_items.to_dict()
+        response = client.put(f'/api/orders/{order["id"]}', data=json.dumps({'line_items': order['line_items']}),
+                              content_type='application/json')
+        data = json.loads(response.data)
+        assert data['line_item_changes'] == {'inserted': 0, 'updated': 0, 'deleted': 0}
+        assert sorted(item['id'] for item in data['order']['line_items']) == \
+            sorted(item['id'] for item in order['line_items'])
+
+    def test_update_rejects_foreign_line_item(self, client, sample_order_with_items):
+        """Test line item ids from another order are rejected"""
+        response = client.put(f'/api/orders/{sample_order_with_items.id}',
+                              data=json.dumps({'line_items': [{'id': 99999, 'quantity': 1}]}),
+                              content_type='application/json')
+        assert response.status_code == 400
+
+    def test_update_with_stale_version_conflicts(self, client, sample_order):
+        """Test optimistic concurrency: an edit based on an old version gets 409"""
+        order_id = sample_order.id
+        loaded_version = sample_order.version
+
+        first = client.put(f'/api/orders/{order_id}', content_type='application/json',
+                           data=json.dumps({'customer_name': 'Editor A', 'version': loaded_version}))
+        assert first.status_code == 200
+        assert json.loads(first.data)['order']['version'] == loaded_version + 1
+
+        second = client.put(f'/api/orders/{order_id}', content_type='application/json',
+                            data=json.dumps({'customer_name': 'Editor B', 'version': loaded_version}))
+        assert second.status_code == 409
+        assert json.loads(second.data)['version'] == loaded_version + 1
+        db.session.expire_all()
+        assert db.session.get(SalesOrderHeader, order_id).customer_name == 'Editor A'
+
+    def test_concurrent_commit_conflicts(self, client, sample_order):
+        """Test a write committed after the order was read is detected at UPDATE time"""
+        order_id = sample_order.id
+        original_flush = db.session.flush
+
+        # The order's UPDATE is flushed before the search index refresh and the commit
+        def flush_after_concurrent_edit():
+            with db.engine.begin() as conn:
+                conn.execute(SalesOrderHeader.__table__.update()
+                             .where(SalesOrderHeader.id == order_id)
+                             .values(version=SalesOrderHeader.version + 1))
+            original_flush()
+
+        with patch.object(db.session, 'flush', side_effect=flush_after_concurrent_edit):
+            response = client.put(f'/api/orders/{order_id}', content_type='application/json',
+                                  data=json.dumps({'customer_name': 'Lost update'}))
+        assert response.status_code == 409
+
     def test_update_order_not_found(self, client):
         """Test updating non-existent order"""
         update_data = {'customer_name': 'Test'}
@@ -208,6 +735,27 @@ class TestDeleteOrder:
             assert SalesOrderHeader.query.get(order_id) is None
             assert SalesOrderDetail.query.filter_by(order_id=order_id).count() == 0
     
+    def test_delete_order_leaves_file_for_sweep(self, client):
+        """Test deletes keep the content-addressed file; the sweep removes it once unreferenced"""
+        import tasks
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'shared.pdf')
+        with open(file_path, 'wb') as f:
+            f.write(b'%PDF-1.4')
+        os.utime(file_path, (0, 0))  # Older than the sweep's grace period
+        first = SalesOrderHeader(order_number='ORD-SHARED-1', file_path=file_path)
+        second = SalesOrderHeader(order_number='ORD-SHARED-2', file_path=file_path)
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        client.delete(f'/api/orders/{first.id}')
+        assert tasks.sweep_uploads_task() == 0
+        assert os.path.exists(file_path)
+
+        client.delete(f'/api/orders/{second.id}')
+        assert os.path.exists(file_path)
+        assert tasks.sweep_uploads_task() == 1
+        assert not os.path.exists(file_path)
+
     def test_delete_order_not_found(self, client):
         """Test deleting non-existent order"""
         response = client.delete('/api/orders/99999')
@@ -258,6 +806,68 @@ class TestStats:
         assert data['average_order_value'] == 1500.0
 
 
+class TestAnalytics:
+    """Test analytics rollup endpoints"""
+
+    @pytest.fixture
+    def completed_orders(self, client):
+        from datetime import date
+        rows = [
+            ('Acme', date(2024, 1, 1), 'USD', 100),
+            ('Acme', date(2024, 1, 2), 'USD', 50),
+            ('Globex', date(2024, 1, 9), 'USD', 300),
+            ('Globex', date(2024, 2, 1), 'EUR', 70),
+        ]
+        for i, (customer, invoice_date, currency, total) in enumerate(rows):
+            db.session.add(SalesOrderHeader(order_number=f'ORD-A-{i}', processing_status='completed',
+                                            customer_name=customer, invoice_date=invoice_date,
+                                            currency=currency, total=total))
+        db.session.add(SalesOrderHeader(order_number='ORD-A-PENDING', processing_status='pending',
+                                        invoice_date=date(2024, 1, 1), total=999))
+        db.session.commit()
+
+    def test_daily(self, client, completed_orders):
+        """Test per-day values"""
+        response = client.get('/api/analytics/daily?date_from=2024-01-01&date_to=2024-01-31')
+        assert response.status_code == 200
+        results = json.loads(response.data)['results']
+        assert results == [
+            {'period': '2024-01-01', 'currency': 'USD', 'order_count': 1, 'total_value': 100.0},
+            {'period': '2024-01-02', 'currency': 'USD', 'order_count': 1, 'total_value': 50.0},
+            {'period': '2024-01-09', 'currency': 'USD', 'order_count': 1, 'total_value': 300.0},
+        ]
+
+    def test_monthly_buckets(self, client, completed_orders):
+        """Test month buckets per currency"""
+        response = client.get('/api/analytics/daily?date_from=2024-01-01&date_to=2024-02-29&bucket=month')
+        results = json.loads(response.data)['results']
+        assert results == [
+            {'period': '2024-01-01', 'currency': 'USD', 'order_count': 3, 'total_value': 450.0},
+            {'period': '2024-02-01', 'currency': 'EUR', 'order_count': 1, 'total_value': 70.0},
+        ]
+
+    def test_customers(self, client, completed_orders):
+        """Test top customers by value"""
+        response = client.get('/api/analytics/customers?date_from=2024-01-01&date_to=2024-12-31&currency=usd')
+        results = json.loads(response.data)['results']
+        assert [(r['customer'], r['total_value']) for r in results] == [('Globex', 300.0), ('Acme', 150.0)]
+
+    def test_currencies(self, client, completed_orders):
+        """Test totals by currency"""
+        response = client.get('/api/analytics/currencies?date_from=2024-01-01&date_to=2024-12-31')
+        results = json.loads(response.data)['results']
+        assert results == [
+            {'currency': 'EUR', 'order_count': 1, 'total_value': 70.0},
+            {'currency': 'USD', 'order_count': 3, 'total_value': 450.0},
+        ]
+
+    def test_invalid_params(self, client):
+        """Test invalid dates and buckets are rejected"""
+        assert client.get('/api/analytics/daily?date_from=yesterday').status_code == 400
+        assert client.get('/api/analytics/daily?bucket=year').status_code == 400
+        assert client.get('/api/analytics/currencies?date_from=2024-02-01&date_to=2024-01-01').status_code == 400
+
+
 class TestTaskStatus:
     """Test task status endpoint"""
     
@@ -289,3 +899,151 @@ class TestTaskStatus:
         assert data['state'] == 'SUCCESS'
         assert 'result' in data
 
+
+
+class FakePubSub:
+    """Pub/sub stand-in replaying a fixed list of events (callables run on delivery)"""
+
+    def __init__(self, events):
+        self.events = [None] + list(events)
+        self.closed = False
+
+    def get_message(self, timeout=None):
+        if not self.events:
+            return None
+        event = self.events.pop(0)
+        if callable(event):
+            event = event()
+        return None if event is None else {'type': 'message', 'data': json.dumps(event)}
+
+    def close(self):
+        self.closed = True
+
+
+class SilentPubSub:
+    """Pub/sub stand-in that never delivers an event"""
+
+    def __init__(self):
+        self.waits = []
+        self.closed = False
+
+    def get_message(self, timeout=None):
+        self.waits.append(timeout)
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+def parse_sse(body):
+    """(event, data) pairs of a text/event-stream body"""
+    events = []
+    for block in body.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class TestProgressEvents:
+    """Test Server-Sent Events progress streams"""
+
+    def test_finished_order_sends_final_state(self, client):
+        """Test a completed order's stream sends its state and ends"""
+        order = SalesOrderHeader(order_number='ORD-SSE-1', processing_status='completed')
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+
+        response = client.get(f'/api/orders/{order_id}/events')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert parse_sse(response.data) == [
+            ('progress', {'order_id': order_id, 'batch_id': None, 'stage': 'completed',
+                          'status': 'Invoice processed successfully'})
+        ]
+
+    def test_order_stream_relays_stage_changes(self, client):
+        """Test stage changes are relayed until the order finishes"""
+        order = SalesOrderHeader(order_number='ORD-SSE-2', processing_status='processing')
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+        pubsub = FakePubSub([
+            {'order_id': order_id, 'stage': 'extracting'},
+            {'order_id': order_id, 'stage': 'completed'},
+            {'order_id': order_id, 'stage': 'never-sent'},
+        ])
+
+        with patch('app.subscribe', return_value=pubsub):
+            body = client.get(f'/api/orders/{order_id}/events').data
+        assert [data['stage'] for _, data in parse_sse(body)] == ['parsing', 'extracting', 'completed']
+        assert ': keep-alive' in body.decode()
+        assert pubsub.closed
+
+    def test_streams_end_after_max_seconds(self, client, monkeypatch):
+        """Test idle streams close after SSE_MAX_SECONDS so clients reconnect"""
+        order = SalesOrderHeader(order_number='ORD-SSE-3', batch_id='batch-2', processing_status='processing')
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+        monkeypatch.setitem(app.config, 'SSE_MAX_SECONDS', 0.05)
+
+        for url in (f'/api/orders/{order_id}/events', '/api/upload/batch/batch-2/events'):
+            pubsub = SilentPubSub()
+            with patch('app.subscribe', return_value=pubsub):
+                body = client.get(url).data.decode()
+            assert body.startswith(f"retry: {app.config['SSE_RETRY_MS']}")
+            assert pubsub.waits and sum(pubsub.waits) <= 0.05
+            assert pubsub.closed
+
+    def test_unknown_order(self, client):
+        """Test streaming a missing order returns 404"""
+        assert client.get('/api/orders/99999/events').status_code == 404
+        assert client.get('/api/upload/batch/missing/events').status_code == 404
+
+    def test_batch_stream_sends_counts(self, client):
+        """Test batch streams send aggregate counts as orders finish"""
+        orders = [SalesOrderHeader(order_number=f'ORD-SSE-B{i}', batch_id='batch-1', processing_status='processing')
+                  for i in range(2)]
+        db.session.add_all(orders)
+        db.session.commit()
+        order_ids = [order.id for order in orders]
+
+        def finish(order_id):
+            def deliver():
+                db.session.get(SalesOrderHeader, order_id).processing_status = 'completed'
+                db.session.commit()
+                return {'order_id': order_id, 'stage': 'completed'}
+            return deliver
+
+        pubsub = FakePubSub([{'order_id': order_ids[0], 'stage': 'extracting'}] + [finish(i) for i in order_ids])
+        with patch('app.subscribe', return_value=pubsub):
+            events = parse_sse(client.get('/api/upload/batch/batch-1/events').data)
+        batches = [data for event, data in events if event == 'batch']
+        assert [batch['completed'] for batch in batches] == [0, 1, 2]
+        assert batches[-1]['done'] is True
+        assert len([event for event, _ in events if event == 'progress']) == 3
+
+
+class TestMetrics:
+    """Test metrics endpoints"""
+    
+    def test_single_flight_metrics(self, client):
+        """Test coalesced-work counters are exposed"""
+        response = client.get('/api/metrics/single-flight')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['leaders'] == 0
+        assert data['shared'] == 0
+        assert data['scope'] == 'process'
+    
+    def test_llm_cache_metrics(self, client):
+        """Test LLM cache counters are exposed"""
+        response = client.get('/api/metrics/llm-cache')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['hits'] == 0
+        assert data['misses'] == 0
+        assert 'llm_seconds_saved' in data
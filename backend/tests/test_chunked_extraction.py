@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from chunked_extraction import (
+    chunk_text, estimate_tokens, extract_with_llm, header_text, merge_line_items
+)
+from llm_executor import LLMExecutor
+from rate_limiter import RateLimiter
+
+
+def long_invoice(items=120):
+    lines = ["INVOICE", "Invoice Number: INV-LONG", "Bill To:", "Big Customer"]
+    lines += [f"SKU-{n:04d} Widget number {n} 1 $10.00 $10.00" for n in range(1, items + 1)]
+    lines += ["Subtotal: $1200.00", "Tax: $0.00", "Total: $1200.00"]
+    return "\n".join(lines)
+
+
+class FakeClient:
+    """Async client answering header and item prompts from the prompt text itself"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create)
+        ))
+
+    async def create(self, model, messages, temperature, max_tokens):
+        prompt = messages[-1]['content']
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if 'line items that appear in this part' in prompt:
+            document = prompt.split('Document text:\n', 1)[1]
+            items = [
+                {'product_code': line.split()[0], 'quantity': 1, 'unit_price': 10.0, 'line_total': 10.0}
+                for line in document.splitlines() if line.startswith('SKU-')
+            ]
+            answer = {'line_items': items}
+        else:
+            answer = {'invoice_number': 'INV-LONG', 'total': 1200.0, 'line_items': []}
+        response = MagicMock()
+        response.choices[0].message.content = json.dumps(answer)
+        response.usage.total_tokens = 100
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def make_executor():
+    """LLM executors around a FakeClient, closed after the test"""
+    executors = []
+
+    def make(client, max_in_flight=64):
+        limiter = RateLimiter(10 ** 6, 10 ** 8, redis_getter=None)
+        executor = LLMExecutor(lambda: client, limiter, max_in_flight=max_in_flight)
+        executors.append(executor)
+        return executor
+
+    yield make
+    for executor in executors:
+        executor.close()
+
+
+def chunks_text(text):
+    return "\n".join(chunk_text(text, max_tokens=300, overlap_tokens=40))
+
+
+class TestChunking:
+    """Test token-bounded chunking and the header excerpt"""
+
+    def test_chunks_are_bounded_and_overlap(self):
+        """Test every chunk fits the budget and neighbours share lines"""
+        text = long_invoice()
+        chunks = chunk_text(text, max_tokens=300, overlap_tokens=40)
+        assert len(chunks) > 3
+        assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+        for previous, current in zip(chunks, chunks[1:]):
+            assert previous.splitlines()[-1] in current.splitlines()
+        # Nothing is lost
+        covered = set(line for chunk in chunks for line in chunk.splitlines())
+        assert covered == set(text.splitlines())
+
+    def test_long_lines_are_split(self):
+        """Test text without line breaks (or whitespace) still gets bounded chunks"""
+        words = " ".join(f"SKU-{n:04d} Widget $10.00" for n in range(400))
+        for text in (words, "x" * 6000):
+            chunks = chunk_text(text, max_tokens=300, overlap_tokens=40)
+            assert len(chunks) > 3
+            assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+        assert "SKU-0399" in chunks_text(words)
+        assert estimate_tokens(header_text("x" * 6000, max_tokens=40)) < 100
+
+    def test_short_document_is_one_chunk(self):
+        """Test documents under the budget are not split"""
+        assert chunk_text("Invoice\nTotal: 5", max_tokens=300) == ["Invoice\nTotal: 5"]
+
+    def test_header_text_keeps_both_ends(self):
+        """Test the header excerpt has the opening and the totals"""
+        excerpt = header_text(long_invoice(), max_tokens=40)
+        assert 'Invoice Number: INV-LONG' in excerpt
+        assert 'Total: $1200.00' in excerpt
+        assert 'SKU-0060' not in excerpt
+
+
+class TestMergeLineItems:
+    """Test merging per-chunk line items"""
+
+    def test_overlap_duplicates_removed(self):
+        """Test items repeated at a chunk boundary are kept once"""
+        a, b, c, d = ({'product_code': code, 'line_total': 1} for code in 'ABCD')
+        merged = merge_line_items([[a, b, c], [b, c, d]])
+        assert [item['product_code'] for item in merged] == ['A', 'B', 'C', 'D']
+        assert [item['line_number'] for item in merged] == [1, 2, 3, 4]
+
+    def test_genuine_repeats_kept(self):
+        """Test identical items that are not in the overlap survive"""
+        a, b = {'product_code': 'A', 'line_total': 1}, {'product_code': 'B', 'line_total': 1}
+        merged = merge_line_items([[a, b, a], [b]])
+        assert [item['product_code'] for item in merged] == ['A', 'B', 'A', 'B']
+
+
+class TestExtractWithLLM:
+    """Test single-pass and map-reduce extraction"""
+
+    def test_long_document_map_reduce(self, monkeypatch, make_executor):
+        """Test all line items of a long document are extracted"""
+        monkeypatch.setattr('chunked_extraction.CHUNK_TOKENS', 400)
+        client = FakeClient()
+        data, tokens = extract_with_llm(make_executor(client), 'gpt-4o-mini', long_invoice())
+        assert data['invoice_number'] == 'INV-LONG'
+        assert [item['product_code'] for item in data['line_items']] == [f"SKU-{n:04d}" for n in range(1, 121)]
+        assert tokens == 100 * len(client.prompts)
+        assert len(client.prompts) > 2
+
+    def test_chunks_run_concurrently(self, monkeypatch, make_executor):
+        """Test wall-clock time follows the slowest chunk, not the number of chunks"""
+        monkeypatch.setattr('chunked_extraction.CHUNK_TOKENS', 150)
+        client = FakeClient(delay=0.2)
+        started = time.monotonic()
+        extract_with_llm(make_executor(client), 'gpt-4o-mini', long_invoice())
+        elapsed = time.monotonic() - started
+        assert len(client.prompts) >= 20
+        assert client.max_in_flight == len(client.prompts)  # All submitted at once
+        assert elapsed < 0.6
+
+    def test_executor_caps_fan_out(self, monkeypatch, make_executor):
+        """Test the executor's in-flight cap bounds the chunk calls"""
+        monkeypatch.setattr('chunked_extraction.CHUNK_TOKENS', 400)
+        client = FakeClient(delay=0.02)
+        extract_with_llm(make_executor(client, max_in_flight=3), 'gpt-4o-mini', long_invoice())
+        assert client.max_in_flight == 3
+
+    def test_short_document_single_call(self, make_executor):
+        """Test short documents keep the single full-extraction prompt"""
+        client = FakeClient()
+        data, _ = extract_with_llm(make_executor(client), 'gpt-4o-mini', "Invoice Number: INV-1\nTotal: 5")
+        assert len(client.prompts) == 1
+        assert 'Invoice Number: INV-1' in client.prompts[0]
@@ -0,0 +1,23 @@
+import gunicorn_config
+import redis_client
+from app import db
+
+
+class TestGunicornConfig:
+    """Test the gunicorn worker settings and fork hook"""
+
+    def test_threaded_workers(self):
+        """Test the web tier runs threaded workers with a matching recycle limit"""
+        assert gunicorn_config.worker_class == 'gthread'
+        assert gunicorn_config.threads >= 1
+        assert gunicorn_config.max_requests == 1000 * gunicorn_config.threads
+
+    def test_post_fork_drops_inherited_connections(self, client, monkeypatch):
+        """Test a forked worker gets fresh connection pools and Redis client"""
+        pool = db.engine.pool
+        monkeypatch.setattr(redis_client, '_client', object())
+
+        gunicorn_config.post_fork(server=None, worker=None)
+
+        assert db.engine.pool is not pool
+        assert redis_client._client is None
@@ -0,0 +1,79 @@
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import pytest
+from line_items import COLUMNS, _csv_buffer, diff_line_items, insert_line_items, line_item_rows
+
+
+class TestLineItemRows:
+    """Test rows built for bulk line item inserts"""
+
+    def test_rows_have_every_column(self):
+        """Test rows share one key set so they can be sent as one executemany"""
+        rows = line_item_rows(5, [{'line_number': 1, 'product_name': 'A', 'unexpected': 'x'},
+                                  'not a line item', {'line_number': 2, 'discount': 3}])
+        assert [tuple(row) for row in rows] == [COLUMNS, COLUMNS]
+        assert rows[0]['order_id'] == 5
+        assert rows[0]['discount'] == 0
+        assert rows[1]['discount'] == 3
+
+    def test_copy_csv_distinguishes_null_and_empty_text(self):
+        """Test NULLs stay unquoted while text (including empty text) is quoted"""
+        rows = line_item_rows(1, [{'line_number': 1, 'product_name': 'Widget "XL", blue',
+                                   'description': '', 'quantity': 2, 'unit_price': 9.5}])
+        assert _csv_buffer(rows).read() == '1,1,,"Widget ""XL"", blue","",2,9.5,0,\n'
+
+    def test_copy_only_on_postgres(self):
+        """Test other databases get an executemany INSERT"""
+        connection = MagicMock()
+        connection.dialect.name = 'sqlite'
+        rows = line_item_rows(1, [{'line_number': n} for n in range(3)])
+        assert insert_line_items(connection, rows, copy_min_rows=0) == 3
+        connection.execute.assert_called_once()
+        connection.connection.cursor.assert_not_called()
+
+        connection = MagicMock()
+        connection.dialect.name = 'postgresql'
+        connection.dialect.driver = 'psycopg2'
+        insert_line_items(connection, rows, copy_min_rows=0)
+        connection.execute.assert_not_called()
+        copy_sql = connection.connection.cursor.return_value.copy_expert.call_args.args[0]
+        assert copy_sql.startswith('COPY sales_order_detail (order_id, line_number')
+
+        assert insert_line_items(connection, []) == 0
+
+
+def stored_line(line_id, line_number, quantity):
+    return SimpleNamespace(id=line_id, line_number=line_number, product_code=None, product_name=f'Item {line_number}',
+                           description=None, quantity=Decimal(quantity), unit_price=Decimal('1.00'),
+                           discount=Decimal('0.00'), line_total=Decimal(quantity))
+
+
+class TestDiffLineItems:
+    """Test submitted line items are matched to stored ones"""
+
+    def test_matches_by_id_then_line_number(self):
+        """Test ids win over line numbers and unmatched lines are inserted or deleted"""
+        one, two, three = stored_line(10, 1, '1.00'), stored_line(11, 2, '2.00'), stored_line(12, 3, '3.00')
+        items = [
+            {'line_number': 2, 'quantity': 2.0},           # unchanged, matched by line_number
+            {'id': 10, 'line_number': 5, 'quantity': 1},   # renumbered, matched by id
+            {'line_number': 4, 'product_name': 'New'},      # no stored line 4
+        ]
+        inserts, updates, deletes = diff_line_items([one, two, three], items)
+        assert inserts == [items[2]]
+        assert updates == [(one, {'line_number': 5})]
+        assert deletes == [three]
+
+    def test_zero_amounts_reported_as_null_are_unchanged(self):
+        """Test null discounts (as serialized by to_dict) don't count as edits"""
+        line = stored_line(1, 1, '2.00')
+        assert diff_line_items([line], [{'id': 1, 'discount': None, 'quantity': 2}]) == ([], [], [])
+
+    def test_rejects_unknown_and_duplicate_ids(self):
+        """Test ids must belong to the order and appear once"""
+        line = stored_line(1, 1, '1.00')
+        with pytest.raises(ValueError):
+            diff_line_items([line], [{'id': 2}])
+        with pytest.raises(ValueError):
+            diff_line_items([line], [{'id': 1}, {'id': 1}])
@@ -0,0 +1,56 @@
+import pytest
+from llm_cache import LLMExtractionCache, make_cache_key, normalize_text
+
+
+class TestCacheKey:
+    """Test cache key construction"""
+
+    def test_whitespace_is_normalized(self):
+        """Test that cosmetic whitespace differences share a key"""
+        assert normalize_text("  Invoice\n\n#123   Total ") == "Invoice #123 Total"
+        assert make_cache_key("Invoice  #1\n", "1", "gpt-4o-mini") == \
+            make_cache_key("Invoice #1", "1", "gpt-4o-mini")
+
+    def test_prompt_version_and_model_change_key(self):
+        """Test that prompt version and model are part of the key"""
+        base = make_cache_key("Invoice #1", "1", "gpt-4o-mini")
+        assert make_cache_key("Invoice #1", "2", "gpt-4o-mini") != base
+        assert make_cache_key("Invoice #1", "1", "gpt-4o") != base
+
+
+class TestLLMExtractionCache:
+    """Test the in-process layer of the extraction cache"""
+
+    def test_miss_then_hit(self):
+        """Test hit/miss counters and saved latency"""
+        cache = LLMExtractionCache(redis_getter=None)
+        assert cache.get('k') is None
+        cache.set('k', {'total': 10}, latency=1.5, tokens=300)
+        assert cache.get('k') == {'total': 10}
+
+        stats = cache.stats()
+        assert stats['scope'] == 'process'
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+        assert stats['llm_seconds_saved'] == 1.5
+        assert stats['tokens_saved'] == 300
+
+    def test_returns_independent_copies(self):
+        """Test that callers can't mutate cached results"""
+        cache = LLMExtractionCache(redis_getter=None)
+        cache.set('k', {'line_items': []})
+        cache.get('k')['line_items'].append('x')
+        assert cache.get('k') == {'line_items': []}
+
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first"""
+        cache = LLMExtractionCache(local_size=2, redis_getter=None)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
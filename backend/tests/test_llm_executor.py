@@ -0,0 +1,226 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import openai
+import pytest
+from llm_executor import LLMExecutor
+from rate_limiter import RateLimiter, backoff_from_headers, parse_duration
+
+
+class FakeAsyncClient:
+    """Async client double that records concurrency and can fail with 429s"""
+
+    def __init__(self, delay=0.05, rate_limited=0, headers=None):
+        self.delay = delay
+        self.rate_limited = rate_limited
+        self.headers = headers or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create)
+        ))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.rate_limited:
+            self.rate_limited -= 1
+            response = SimpleNamespace(status_code=429, headers={'retry-after-ms': '20'}, request=None)
+            raise openai.RateLimitError('Rate limit reached', response=response, body=None)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        parsed = SimpleNamespace(usage=SimpleNamespace(total_tokens=10), content=kwargs['messages'][-1]['content'])
+        return SimpleNamespace(headers=self.headers, parse=lambda: parsed)
+
+    async def close(self):
+        pass
+
+
+def make_executor(client, max_in_flight=4, requests_per_minute=6000):
+    limiter = RateLimiter(requests_per_minute, 10 ** 6, redis_getter=None)
+    return LLMExecutor(lambda: client, limiter, max_in_flight=max_in_flight, max_retries=3)
+
+
+def request(text):
+    return {'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': text}], 'max_tokens': 10}
+
+
+class TestLLMExecutor:
+    """Test the asyncio LLM executor"""
+
+    def test_bounded_concurrency(self):
+        """Test up to max_in_flight requests run at once, from any thread"""
+        client = FakeAsyncClient(delay=0.1)
+        executor = make_executor(client, max_in_flight=4)
+        try:
+            started = time.monotonic()
+            futures = [executor.submit(**request(f"doc {n}")) for n in range(8)]
+            results = [future.result(timeout=5).content for future in futures]
+            elapsed = time.monotonic() - started
+        finally:
+            executor.close()
+        assert results == [f"doc {n}" for n in range(8)]
+        assert client.max_in_flight == 4
+        assert elapsed < 0.6  # Two waves of 0.1s, not eight sequential calls
+
+    def test_sync_client_surface(self):
+        """Test the executor can stand in for the blocking client"""
+        executor = make_executor(FakeAsyncClient(delay=0))
+        try:
+            response = executor.chat.completions.create(**request("hello"))
+        finally:
+            executor.close()
+        assert response.content == "hello"
+
+    def test_rate_limit_retry_pauses_limiter(self):
+        """Test 429s are retried after the announced pause, shared via the limiter"""
+        client = FakeAsyncClient(delay=0, rate_limited=2)
+        executor = make_executor(client)
+        try:
+            assert executor.create(**request("retry me")).content == "retry me"
+        finally:
+            executor.close()
+        assert client.calls == 3
+
+    def test_gives_up_after_max_retries(self):
+        """Test persistent 429s surface as RateLimitError"""
+        executor = make_executor(FakeAsyncClient(delay=0, rate_limited=10))
+        try:
+            with pytest.raises(openai.RateLimitError):
+                executor.create(**request("never"))
+        finally:
+            executor.close()
+
+    def test_close_cancels_waiting_callers(self):
+        """Test close() (settings reload) cancels pending requests instead of leaving callers hanging"""
+        import concurrent.futures
+        import threading
+        executor = make_executor(FakeAsyncClient(delay=30))
+        errors = []
+
+        def call():
+            try:
+                executor.create(**request("slow"))
+            except BaseException as e:
+                errors.append(e)
+
+        caller = threading.Thread(target=call)
+        caller.start()
+        time.sleep(0.1)
+        executor.close()
+        caller.join(timeout=5)
+        assert not caller.is_alive()
+        assert [type(e) for e in errors] == [concurrent.futures.CancelledError]
+
+    def test_create_waits_a_bounded_time(self):
+        """Test create() gives up after wait_timeout, which follows the request timeout"""
+        import concurrent.futures
+        executor = make_executor(FakeAsyncClient(delay=30))
+        assert executor.wait_timeout == 4 * (60.0 + 60.0)
+        executor.wait_timeout = 0.1
+        try:
+            with pytest.raises(concurrent.futures.TimeoutError):
+                executor.create(**request("slow"))
+        finally:
+            executor.close()
+
+
+class TestRateLimiter:
+    """Test the token bucket and header parsing"""
+
+    def test_requests_per_minute(self):
+        """Test the bucket refuses requests beyond the per-minute budget"""
+        limiter = RateLimiter(2, 1000, redis_getter=None)
+        assert limiter.try_acquire(10) == 0
+        assert limiter.try_acquire(10) == 0
+        assert limiter.try_acquire(10) == pytest.approx(30, abs=0.5)
+
+    def test_tokens_per_minute_and_refund(self):
+        """Test token budgets, including refunds of over-estimates"""
+        limiter = RateLimiter(100, 1000, redis_getter=None)
+        assert limiter.try_acquire(900) == 0
+        assert limiter.try_acquire(300) > 0
+        limiter.refund(500)
+        assert limiter.try_acquire(300) == 0
+
+    def test_block_for(self):
+        """Test a provider pause blocks every caller"""
+        limiter = RateLimiter(100, 1000, redis_getter=None)
+        limiter.block_for(3)
+        assert limiter.try_acquire(1) == pytest.approx(3, abs=0.1)
+
+    def test_headers(self):
+        """Test OpenAI rate-limit headers are turned into pauses"""
+        assert parse_duration('6m0s') == 360
+        assert parse_duration('20ms') == 0.02
+        assert backoff_from_headers({'retry-after': '2'}) == 2
+        assert backoff_from_headers({'x-ratelimit-remaining-requests': '0',
+                                     'x-ratelimit-reset-requests': '1.5s'}) == 1.5
+        assert backoff_from_headers({'x-ratelimit-remaining-requests': '12'}) is None
+
+
+class SlowRedis:
+    """Wraps a client so every call takes ``delay`` seconds, like a stalled server"""
+
+    def __init__(self, client, delay):
+        self.client = client
+        self.delay = delay
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def slow(*args, **kwargs):
+            time.sleep(self.delay)
+            return method(*args, **kwargs)
+        return slow
+
+
+class TestSharedRateLimiter:
+    """Test the Redis (Lua) buckets shared by worker processes"""
+
+    def test_workers_share_budget(self, fake_redis):
+        """Test limiters on one Redis draw from the same buckets"""
+        client = fake_redis
+        first = RateLimiter(2, 1000, redis_getter=lambda: client)
+        second = RateLimiter(2, 1000, redis_getter=lambda: client)
+        assert first.try_acquire(10) == 0
+        assert second.try_acquire(10) == 0
+        assert first.try_acquire(10) == pytest.approx(30, abs=0.5)
+
+    def test_refund(self, fake_redis):
+        """Test over-estimated tokens go back to the shared bucket"""
+        client = fake_redis
+        limiter = RateLimiter(100, 1000, redis_getter=lambda: client)
+        assert limiter.try_acquire(900) == 0
+        assert limiter.try_acquire(300) > 0
+        limiter.refund(500)
+        assert limiter.try_acquire(300) == 0
+
+    def test_shorter_block_keeps_longer_one(self, fake_redis):
+        """Test a short pause from one worker does not cut another's longer pause"""
+        client = fake_redis
+        first = RateLimiter(100, 1000, redis_getter=lambda: client)
+        second = RateLimiter(100, 1000, redis_getter=lambda: client)
+        first.block_for(10)
+        second.block_for(1)
+        assert RateLimiter(100, 1000, redis_getter=lambda: client).try_acquire(1) == pytest.approx(10, abs=0.2)
+
+    def test_slow_redis_does_not_stall_event_loop(self, fake_redis):
+        """Test Redis round trips run off the event loop"""
+        client = SlowRedis(fake_redis, delay=0.3)
+        limiter = RateLimiter(100, 1000, redis_getter=lambda: client)
+        ticks = []
+
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.02)
+
+        async def main():
+            await asyncio.gather(limiter.acquire(10), limiter.refund_async(5),
+                                 limiter.block_for_async(0.01), ticker())
+
+        asyncio.run(main())
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.2
@@ -0,0 +1,76 @@
+import threading
+from datetime import datetime, timezone
+from order_numbers import MAX_SEQUENCE, OrderNumberGenerator, order_number_parts
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc).timestamp()
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestOrderNumbers:
+    """Test Snowflake-style order number allocation"""
+
+    def test_format_and_parts(self):
+        """Test numbers encode their allocation time, node and sequence"""
+        generator = OrderNumberGenerator(node_id=7, clock=Clock())
+        first, second = generator.allocate(2)
+        assert first.startswith('ORD-') and len(first) == 17
+        assert order_number_parts(first) == (datetime.fromtimestamp(NOW, tz=timezone.utc), 7, 0)
+        assert order_number_parts(second)[2] == 1
+
+    def test_unique_and_sorted_within_a_millisecond(self):
+        """Test a node keeps counting past the sequence limit without repeating"""
+        generator = OrderNumberGenerator(node_id=1, clock=Clock())
+        numbers = generator.allocate(MAX_SEQUENCE + 100)
+        assert len(set(numbers)) == len(numbers)
+        assert numbers == sorted(numbers)
+
+    def test_clock_going_backwards(self):
+        """Test numbers never repeat when the clock steps back"""
+        clock = Clock()
+        generator = OrderNumberGenerator(node_id=1, clock=clock)
+        before = generator.allocate(3)
+        clock.now -= 5
+        after = generator.allocate(3)
+        assert before + after == sorted(before + after)
+        assert len(set(before + after)) == 6
+
+    def test_processes_lease_distinct_nodes(self, fake_redis):
+        """Test generators sharing Redis get different node ids and numbers"""
+        fake = fake_redis
+        clock = Clock()
+        generators = [OrderNumberGenerator(redis_getter=lambda: fake, clock=clock) for _ in range(3)]
+        assert len({generator.node_id for generator in generators}) == 3
+        numbers = [number for generator in generators for number in generator.allocate(10)]
+        assert len(set(numbers)) == 30
+
+    def test_lost_lease_claims_a_new_node(self, fake_redis):
+        """Test a process whose lease was taken over moves to another node"""
+        fake = fake_redis
+        clock = Clock()
+        generator = OrderNumberGenerator(redis_getter=lambda: fake, lease_seconds=60, clock=clock)
+        node_id = generator.node_id
+        fake.set(f'order_numbers:node:{node_id}', 'someone-else')
+        clock.now += 30
+        assert generator.node_id != node_id
+
+    def test_concurrent_threads(self):
+        """Test threads of one process never get the same number"""
+        generator = OrderNumberGenerator(node_id=3)
+        numbers = []
+
+        def allocate():
+            numbers.extend(generator.next() for _ in range(2000))
+
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(numbers)) == 16000
@@ -0,0 +1,49 @@
+import pytest
+from reportlab.pdfgen import canvas
+import pdf_text
+from pdf_text import extract_pdf_text, iter_pdf_pages, shutdown_pool
+
+
+@pytest.fixture
+def multipage_pdf(tmp_path):
+    """A PDF whose page N contains the text 'Page N'"""
+    path = tmp_path / 'statement.pdf'
+    pdf = canvas.Canvas(str(path))
+    for number in range(1, 21):
+        pdf.drawString(100, 750, f"Page {number}")
+        pdf.showPage()
+    pdf.save()
+    return str(path)
+
+
+class TestExtractPdfText:
+    """Test streaming and page-parallel PDF extraction"""
+
+    def test_pages_are_lazy(self, multipage_pdf):
+        """Test pages are yielded one at a time"""
+        pages = iter_pdf_pages(multipage_pdf)
+        assert next(pages).strip() == 'Page 1'
+        assert next(pages).strip() == 'Page 2'
+
+    def test_serial_extraction(self, multipage_pdf):
+        """Test all pages are joined in order"""
+        text = extract_pdf_text(multipage_pdf, workers=1)
+        assert text.split() == [word for n in range(1, 21) for word in ('Page', str(n))]
+
+    def test_stops_at_budget(self, multipage_pdf):
+        """Test extraction stops once enough text is collected"""
+        text = extract_pdf_text(multipage_pdf, max_chars=15, workers=1)
+        assert len(text) == 15
+        assert 'Page 2' in text
+        assert 'Page 3' not in text
+
+    def test_parallel_matches_serial(self, multipage_pdf, monkeypatch):
+        """Test the process pool returns the same text in page order"""
+        monkeypatch.setattr(pdf_text, 'PDF_PARALLEL_MIN_PAGES', 2)
+        try:
+            parallel = extract_pdf_text(multipage_pdf, workers=2, pages_per_task=3)
+            budgeted = extract_pdf_text(multipage_pdf, max_chars=30, workers=2, pages_per_task=3)
+        finally:
+            shutdown_pool()
+        assert parallel == extract_pdf_text(multipage_pdf, workers=1)
+        assert budgeted == extract_pdf_text(multipage_pdf, max_chars=30, workers=1)
@@ -0,0 +1,127 @@
+import json
+from unittest.mock import patch
+import pytest
+from sqlalchemy import event
+from app import db
+from models import SalesOrderHeader
+from response_cache import LISTS, ResponseCache, order_scope
+
+
+@pytest.fixture
+def cache(fake_redis):
+    """The app's response cache backed by an in-memory Redis"""
+    fake = ResponseCache(redis_getter=lambda: fake_redis)
+    with patch('app.order_cache', fake):
+        yield fake
+
+
+def count_queries(fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return result, len(statements)
+
+
+class TestResponseCache:
+    """Test the generation-checked response cache"""
+
+    def test_store_and_lookup(self, fake_redis):
+        """Test a stored response is returned with its ETag"""
+        cache = ResponseCache(redis_getter=lambda: fake_redis)
+        payload, etag, generation = cache.lookup(order_scope(1), '*')
+        assert payload is None
+        assert cache.store(order_scope(1), '*', b'{"id":1}', 'abc', generation)
+        assert cache.lookup(order_scope(1), '*')[:2] == (b'{"id":1}', 'abc')
+
+    def test_stale_build_is_not_stored(self, fake_redis):
+        """Test a response built before an invalidation is discarded"""
+        cache = ResponseCache(redis_getter=lambda: fake_redis)
+        _, _, generation = cache.lookup(order_scope(1), '*')
+        cache.invalidate_order(1)  # A writer commits while the response is being built
+        assert not cache.store(order_scope(1), '*', b'{"old":true}', 'abc', generation)
+        assert cache.lookup(order_scope(1), '*')[0] is None
+
+    def test_invalidate_order_drops_list_pages(self, fake_redis):
+        """Test an order change drops its entry and every list page, not other orders"""
+        cache = ResponseCache(redis_getter=lambda: fake_redis)
+        for scope in (order_scope(1), order_scope(2), LISTS):
+            cache.store(scope, '*', b'{}', 'e', cache.lookup(scope, '*')[2])
+        cache.invalidate_order(1)
+        assert cache.lookup(order_scope(1), '*')[0] is None
+        assert cache.lookup(LISTS, '*')[0] is None
+        assert cache.lookup(order_scope(2), '*')[0] == b'{}'
+
+    def test_without_redis(self):
+        """Test nothing is cached without Redis"""
+        cache = ResponseCache(redis_getter=None)
+        assert cache.lookup(order_scope(1), '*') == (None, None, None)
+        assert not cache.store(order_scope(1), '*', b'{}', 'e', None)
+
+
+class TestCachedEndpoints:
+    """Test cached order reads, ETags and invalidation by writers"""
+
+    def test_order_served_from_cache(self, client, sample_order, cache):
+        """Test a repeated read needs no database query"""
+        first = client.get(f'/api/orders/{sample_order.id}')
+        assert first.headers['X-Cache'] == 'MISS'
+
+        second, queries = count_queries(lambda: client.get(f'/api/orders/{sample_order.id}'))
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.data == first.data
+        assert queries == 0
+
+        not_modified, queries = count_queries(lambda: client.get(
+            f'/api/orders/{sample_order.id}', headers={'If-None-Match': first.headers['ETag']}))
+        assert not_modified.status_code == 304
+        assert queries == 0
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['not_modified'] == 1
+
+    def test_update_and_delete_invalidate(self, client, sample_order, cache):
+        """Test writes drop the cached order and list pages"""
+        order_id = sample_order.id
+        etag = client.get(f'/api/orders/{order_id}').headers['ETag']
+        client.get('/api/orders')
+
+        client.put(f'/api/orders/{order_id}', content_type='application/json',
+                   data=json.dumps({'customer_name': 'Renamed'}))
+        response = client.get(f'/api/orders/{order_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['customer_name'] == 'Renamed'
+        assert json.loads(client.get('/api/orders').data)['orders'][0]['customer_name'] == 'Renamed'
+
+        client.delete(f'/api/orders/{order_id}')
+        assert client.get(f'/api/orders/{order_id}').status_code == 404
+        assert json.loads(client.get('/api/orders').data)['count'] == 0
+
+    def test_persist_invalidates(self, client, cache):
+        """Test the worker's persist step drops the cached order"""
+        import tasks
+        order = SalesOrderHeader(order_number='ORD-CACHE', processing_status='processing')
+        db.session.add(order)
+        db.session.commit()
+        order_id = order.id
+        assert json.loads(client.get(f'/api/orders/{order_id}').data)['processing_status'] == 'processing'
+
+        with patch('tasks.order_cache', cache):
+            tasks._persist_order_impl({'order_id': order_id, 'data': {'customer_name': 'Done Inc'},
+                                       'extraction_method': 'rules', 'extraction_confidence': 1.0})
+        data = json.loads(client.get(f'/api/orders/{order_id}').data)
+        assert data['processing_status'] == 'completed'
+
+    def test_etag_without_redis(self, client, sample_order):
+        """Test unchanged responses get a 304 even when nothing is cached"""
+        first = client.get(f'/api/orders/{sample_order.id}?fields=id,total')
+        assert first.headers['X-Cache'] == 'MISS'
+        second = client.get(f'/api/orders/{sample_order.id}?fields=id,total',
+                            headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+        assert client.get('/api/orders', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
@@ -0,0 +1,169 @@
+import pytest
+from decimal import Decimal
+from app import app
+from models import db, SalesOrderHeader, OrderStats
+from rollups import read_order_stats, reconcile_order_stats
+
+
+def _actual_stats():
+    """Aggregate straight from the orders table"""
+    count = SalesOrderHeader.query.count()
+    value = db.session.query(db.func.coalesce(db.func.sum(SalesOrderHeader.total), 0)).scalar()
+    return count, Decimal(str(value))
+
+
+class TestOrderStatsRollup:
+    """Test the incrementally maintained /api/stats totals"""
+
+    def test_insert_update_delete(self, client):
+        """Test every kind of header change keeps the rollup exact"""
+        with app.app_context():
+            first = SalesOrderHeader(order_number='ORD-R1', total=100.50)
+            second = SalesOrderHeader(order_number='ORD-R2')
+            db.session.add_all([first, second])
+            db.session.commit()
+            assert read_order_stats() == (2, Decimal('100.50'))
+
+            # Worker completes an order (total set on a previously empty order)
+            second.total = 49.50
+            db.session.commit()
+            assert read_order_stats() == (2, Decimal('150.00'))
+
+            # Edit of an existing total, after the instance was expired by commit
+            first.total = 200
+            db.session.commit()
+            assert read_order_stats() == (2, Decimal('249.50'))
+
+            db.session.delete(first)
+            db.session.commit()
+            assert read_order_stats() == _actual_stats() == (1, Decimal('49.50'))
+
+    def test_rollback_discards_delta(self, client):
+        """Test deltas are part of the order's transaction"""
+        with app.app_context():
+            db.session.add(SalesOrderHeader(order_number='ORD-R3', total=10))
+            db.session.flush()
+            db.session.rollback()
+            assert read_order_stats() == (0, Decimal('0'))
+
+    def test_reconcile_repairs_drift(self, client):
+        """Test reconciliation restores the totals after drift"""
+        with app.app_context():
+            db.session.add_all([
+                SalesOrderHeader(order_number='ORD-R4', total=10),
+                SalesOrderHeader(order_number='ORD-R5', total=20),
+            ])
+            db.session.commit()
+
+            # Simulate drift, e.g. from a write that bypassed the ORM
+            OrderStats.query.delete()
+            db.session.add(OrderStats(slot=3, total_orders=7, total_value=1))
+            db.session.commit()
+
+            drift = reconcile_order_stats()
+            assert drift == {'orders': -5, 'value': 29.0}
+            assert read_order_stats() == _actual_stats() == (2, Decimal('30.00'))
+            assert reconcile_order_stats() == {'orders': 0, 'value': 0.0}
+
+    def test_api_update_and_delete(self, client, sample_order):
+        """Test update_order and delete_order keep /api/stats in sync"""
+        import json
+        client.put(f'/api/orders/{sample_order.id}', data=json.dumps({'total': 500.0}),
+                   content_type='application/json')
+        data = json.loads(client.get('/api/stats').data)
+        assert data['total_orders'] == 1
+        assert data['total_value'] == 500.0
+
+        client.delete(f'/api/orders/{sample_order.id}')
+        data = json.loads(client.get('/api/stats').data)
+        assert data['total_orders'] == 0
+        assert data['total_value'] == 0.0
+
+
+class TestDailyRollup:
+    """Test the per day / customer / currency analytics rollup"""
+
+    def _rollup(self):
+        from models import OrderDailyRollup
+        return {
+            (r.day.isoformat(), r.customer, r.currency): (r.order_count, r.total_value)
+            for r in OrderDailyRollup.query.all() if r.order_count
+        }
+
+    def test_only_completed_orders_count(self, client):
+        """Test orders enter the rollup when the worker completes them"""
+        from datetime import date
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-D1', processing_status='pending')
+            db.session.add(order)
+            db.session.commit()
+            assert self._rollup() == {}
+
+            order.processing_status = 'completed'
+            order.customer_name = 'Acme'
+            order.invoice_date = date(2024, 3, 5)
+            order.currency = 'EUR'
+            order.total = 120
+            db.session.commit()
+            assert self._rollup() == {('2024-03-05', 'Acme', 'EUR'): (1, Decimal('120.00'))}
+
+    def test_edit_moves_value_between_buckets(self, client):
+        """Test changing customer or date moves the order to another row"""
+        from datetime import date
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-D2', processing_status='completed',
+                                     customer_name='Acme', invoice_date=date(2024, 3, 5), total=50)
+            db.session.add(order)
+            db.session.commit()
+
+            order.customer_name = 'Globex'
+            order.invoice_date = date(2024, 3, 6)
+            db.session.commit()
+            assert self._rollup() == {('2024-03-06', 'Globex', 'USD'): (1, Decimal('50.00'))}
+
+            db.session.delete(order)
+            db.session.commit()
+            assert self._rollup() == {}
+
+    def test_reconcile_daily_rollup(self, client):
+        """Test reconciliation rebuilds drifted rows"""
+        from datetime import date
+        from models import OrderDailyRollup
+        from rollups import reconcile_daily_rollup
+        with app.app_context():
+            db.session.add(SalesOrderHeader(order_number='ORD-D3', processing_status='completed',
+                                            customer_name='Acme', invoice_date=date(2024, 3, 5), total=10))
+            db.session.commit()
+
+            OrderDailyRollup.query.delete()
+            db.session.add(OrderDailyRollup(day=date(2020, 1, 1), customer='Ghost', currency='USD',
+                                            order_count=2, total_value=5))
+            db.session.commit()
+
+            assert reconcile_daily_rollup() == 2
+            assert self._rollup() == {('2024-03-05', 'Acme', 'USD'): (1, Decimal('10.00'))}
+            assert OrderDailyRollup.query.count() == 1
+
+    def test_currency_codes_stored_upper_case(self, client):
+        """Test lower-case currencies from extraction or older rows share one rollup row"""
+        from datetime import date
+        import analytics
+        import tasks
+        from rollups import reconcile_daily_rollup
+        with app.app_context():
+            extracted_order = SalesOrderHeader(order_number='ORD-D4', processing_status='processing')
+            db.session.add_all([extracted_order, SalesOrderHeader(
+                order_number='ORD-D5', processing_status='completed', customer_name='Acme',
+                invoice_date=date(2024, 3, 5), currency='eur', total=20)])
+            db.session.commit()
+            tasks._persist_order_impl({
+                'order_id': extracted_order.id,
+                'data': {'customer_name': 'Acme', 'invoice_date': '2024-03-05', 'currency': 'eur',
+                         'total': 30, 'line_items': []},
+                'extraction_method': 'rules', 'extraction_confidence': 0.95})
+
+            assert db.session.get(SalesOrderHeader, extracted_order.id).currency == 'EUR'
+            assert self._rollup() == {('2024-03-05', 'Acme', 'EUR'): (2, Decimal('50.00'))}
+            assert reconcile_daily_rollup() == 0
+            rows = analytics.value_by_period(date(2024, 3, 1), date(2024, 3, 31), currency='eur')
+            assert [(row['currency'], row['order_count']) for row in rows] == [('EUR', 2)]
@@ -0,0 +1,69 @@
+import glob
+import os
+import pytest
+from pdf_text import extract_pdf_text
+from rule_extractor import extract_invoice_data_with_rules, parse_amount, parse_date, score_extraction
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'sample-invoices')
+
+ONE_ROW_PER_LINE = """INVOICE
+Invoice #: 77
+Date: 03/05/2024
+Bill To:
+Acme Ltd
+Code Product Qty Price Total
+A-1 Blue widget 2 €5.00 €10.00
+B-2 Gadget 1 €2.50 €2.50
+Subtotal: €12.50
+Tax: €0.00
+Total: €12.50
+"""
+
+
+class TestRuleExtractor:
+    """Test the deterministic invoice extractor"""
+
+    @pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.pdf'))))
+    def test_sample_invoices_fully_confident(self, path):
+        """Test every bundled sample invoice is parsed without the LLM"""
+        data, confidence = extract_invoice_data_with_rules(extract_pdf_text(path))
+        assert confidence == 1.0
+        assert data['invoice_number'].startswith('INV-')
+        assert data['line_items']
+
+    def test_stacked_cells(self):
+        """Test one-cell-per-line tables as produced by PDF text extraction"""
+        path = os.path.join(SAMPLE_DIR, 'invoice_multiple_items.pdf')
+        data, _ = extract_invoice_data_with_rules(extract_pdf_text(path))
+        assert data['invoice_date'] == '2024-01-20'
+        assert data['customer_name'] == 'Tech Solutions Inc.'
+        assert data['customer_email'] == 'accounts@techsolutions.com'
+        assert data['total'] == 9350.0
+        assert [item['product_code'] for item in data['line_items']] == ['HW-001', 'SW-001', 'INST-001']
+        assert data['line_items'][0]['quantity'] == 2.0
+
+    def test_one_row_per_line(self):
+        """Test tables with each row on a single line"""
+        data, confidence = extract_invoice_data_with_rules(ONE_ROW_PER_LINE)
+        assert confidence == 1.0
+        assert data['invoice_date'] == '2024-03-05'
+        assert data['currency'] == 'EUR'
+        assert data['line_items'][0]['product_name'] == 'Blue widget'
+
+    def test_inconsistent_totals_lower_confidence(self):
+        """Test numbers that do not add up are not trusted"""
+        data, confidence = extract_invoice_data_with_rules(ONE_ROW_PER_LINE.replace('Total: €12.50', 'Total: €99.00'))
+        assert confidence < 0.9
+        assert score_extraction({'line_items': []}) == 0.0
+
+    def test_unstructured_text(self):
+        """Test free text scores zero"""
+        assert extract_invoice_data_with_rules("Invoice text content")[1] == 0.0
+        assert extract_invoice_data_with_rules("")[1] == 0.0
+
+    def test_parsers(self):
+        """Test amount and date parsing"""
+        assert str(parse_amount('$1,250.00')) == '1250.00'
+        assert parse_amount('n/a') is None
+        assert parse_date('January 5, 2024') == '2024-01-05'
+        assert parse_date('someday') is None
@@ -109,6 +109,12 @@ class TestOrderUpdate:
         
         with pytest.raises(ValidationError):
             OrderUpdate(**update_data)
+    
+    def test_order_update_currency_upper_case(self):
+        """Test currency codes are normalized to upper case"""
+        assert OrderUpdate(currency='eur').currency == 'EUR'
+        assert OrderUpdate().currency is None
+        assert OrderCreate(order_number='ORD-001', currency='gbp').currency == 'GBP'
 
 
 class TestLineItemCreate:
@@ -0,0 +1,57 @@
+import json
+from datetime import date
+import pytest
+import serializers
+from models import db, SalesOrderHeader
+from serializers import order_select, parse_fields, serialize_orders
+
+
+class TestParseFields:
+    """Test parsing of the fields query parameter"""
+
+    def test_all_fields_by_default(self):
+        """Test a missing or empty parameter selects every field"""
+        assert parse_fields(None) is None
+        assert parse_fields(' ') is None
+
+    def test_sparse_fieldset(self):
+        """Test names are trimmed and de-duplicated in request order"""
+        assert parse_fields('total, id,total,,line_items') == ['total', 'id', 'line_items']
+
+    def test_unknown_field(self):
+        """Test unknown names are rejected"""
+        with pytest.raises(ValueError, match='Unknown field: password'):
+            parse_fields('id,password')
+
+
+class TestSerializeOrders:
+    """Test rows serialized from Core queries"""
+
+    def test_matches_to_dict(self, sample_order_with_items):
+        """Test the Core path returns exactly what to_dict() returns"""
+        sample_order_with_items.invoice_date = date(2024, 1, 15)
+        db.session.commit()
+
+        rows = db.session.execute(order_select()).all()
+        orders = serialize_orders(db.session, rows)
+
+        expected = db.session.get(SalesOrderHeader, sample_order_with_items.id).to_dict()
+        assert orders == [expected]
+        assert list(orders[0]) == list(expected)
+
+    def test_sparse_fields_select_only_those_columns(self, sample_order_with_items):
+        """Test a sparse fieldset narrows the SELECT and skips line items"""
+        statement = order_select(['total', 'status'])
+        assert [column.name for column in statement.selected_columns] == ['total', 'status', 'created_at', 'id']
+
+        rows = db.session.execute(statement).all()
+        assert serialize_orders(db.session, rows, ['total', 'status']) == [{'total': 1100.0, 'status': 'pending'}]
+
+        rows = db.session.execute(order_select(['id', 'line_items'])).all()
+        order = serialize_orders(db.session, rows, ['id', 'line_items'])[0]
+        assert [item['line_number'] for item in order['line_items']] == [1, 2]
+
+    def test_stdlib_fallback(self, monkeypatch):
+        """Test encoding still works without orjson"""
+        monkeypatch.setattr(serializers, 'orjson', None)
+        assert json.loads(serializers.dumps({'id': 1, 'total': None})) == {'id': 1, 'total': None}
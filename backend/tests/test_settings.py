@@ -0,0 +1,75 @@
+import os
+import signal
+from unittest.mock import patch, MagicMock
+import settings
+import tasks
+
+
+class FakeConsumer:
+    """Stand-in for the Celery consumer sent with worker_ready"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+
+class TestSettings:
+    """Test settings are loaded once and reloaded on demand"""
+
+    def test_cached_until_reload(self, monkeypatch):
+        """Test get_settings does not re-read the environment per call"""
+        monkeypatch.setattr(settings, '_settings', None)
+        with patch('settings.load_dotenv') as mock_load_dotenv:
+            monkeypatch.setenv('OPENAI_API_KEY', 'first-key')
+            first = settings.get_settings()
+            monkeypatch.setenv('OPENAI_API_KEY', 'second-key')
+            assert settings.get_settings() is first
+            assert first.openai_api_key == 'first-key'
+            assert mock_load_dotenv.call_count == 1
+
+            assert settings.reload_settings().openai_api_key == 'second-key'
+            assert settings.get_settings().openai_api_key == 'second-key'
+        monkeypatch.setattr(settings, '_settings', None)
+
+    def test_sighup_rebuilds_openai_client(self, monkeypatch):
+        """Test SIGHUP reloads settings and drops the pooled client"""
+        old_client = MagicMock()
+        monkeypatch.setattr(tasks, 'openai_client', old_client)
+        monkeypatch.setattr(settings, '_settings', None)
+        previous = signal.getsignal(signal.SIGHUP)
+        try:
+            settings.install_reload_signal_handler()
+            with patch('settings.load_dotenv'):
+                os.kill(os.getpid(), signal.SIGHUP)
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+            monkeypatch.setattr(settings, '_settings', None)
+        assert tasks.openai_client is None
+        old_client.close.assert_called_once()
+
+    def test_threads_pool_worker_reloads_on_sighup(self, monkeypatch):
+        """Test a --pool threads worker (no forked children) installs the reload handler"""
+        from celery.concurrency import get_implementation
+        from celery.signals import worker_ready
+        monkeypatch.setattr(settings, '_settings', None)
+        previous = signal.getsignal(signal.SIGHUP)
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            worker_ready.send(sender=FakeConsumer(get_implementation('prefork')(limit=1)))
+            assert signal.getsignal(signal.SIGHUP) is signal.SIG_DFL  # Celery's restart handler stays
+
+            worker_ready.send(sender=FakeConsumer(get_implementation('threads')(limit=1)))
+            monkeypatch.setenv('OPENAI_API_KEY', 'reloaded-key')
+            with patch('settings.load_dotenv'):
+                os.kill(os.getpid(), signal.SIGHUP)
+            assert settings.get_settings().openai_api_key == 'reloaded-key'
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+            monkeypatch.setattr(settings, '_settings', None)
+
+    def test_client_reused_across_calls(self, monkeypatch):
+        """Test one LLM client is created per process"""
+        monkeypatch.setattr(tasks, 'openai_client', None)
+        monkeypatch.setattr(tasks, 'get_settings', lambda: settings.Settings(openai_api_key='key'))
+        with patch('tasks.LLMExecutor.from_settings') as mock_from_settings:
+            assert tasks.get_openai_client() is tasks.get_openai_client()
+            assert mock_from_settings.call_count == 1
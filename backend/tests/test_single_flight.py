@@ -0,0 +1,124 @@
+import threading
+import time
+import pytest
+from single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    """Test duplicate work is coalesced"""
+
+    def test_concurrent_calls_share_one_run(self):
+        """Test threads with the same key run the work once"""
+        flight = SingleFlight(redis_getter=None)
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'total': 10}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('doc', work))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert [result for result, _ in results] == [{'total': 10}] * 4
+        assert sorted(shared for _, shared in results) == [False, True, True, True]
+        assert flight.stats()['shared'] == 3
+
+    def test_waiters_retry_after_leader_failure(self):
+        """Test a failed leader does not fail the callers waiting on it"""
+        flight = SingleFlight(redis_getter=None)
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.05)
+            raise RuntimeError("LLM down")
+
+        errors = []
+
+        def leader():
+            try:
+                flight.do('doc', failing)
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(5)
+        assert flight.do('doc', lambda: 'recovered') == ('recovered', False)
+        thread.join(5)
+        assert len(errors) == 1
+
+    def test_processes_share_result_through_redis(self, fake_redis):
+        """Test a second worker waits on the lock and reuses the stored result"""
+        client = fake_redis
+        first = SingleFlight(poll_interval=0.01, redis_getter=lambda: client)
+        second = SingleFlight(poll_interval=0.01, redis_getter=lambda: client)
+        started = threading.Event()
+
+        def work():
+            started.set()
+            time.sleep(0.1)
+            return {'invoice_number': 'INV-1'}
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(first.do('doc', work)))
+        thread.start()
+        started.wait(5)
+        assert second.do('doc', lambda: pytest.fail("duplicate work ran")) == ({'invoice_number': 'INV-1'}, True)
+        thread.join(5)
+
+        assert results == [({'invoice_number': 'INV-1'}, False)]
+        assert not client.exists('single_flight:lock:doc')
+        assert first.stats()['scope'] == 'cluster'
+        assert first.stats()['leaders'] == 1
+
+    def test_waiter_takes_over_from_crashed_leader(self, fake_redis):
+        """Test a waiter stops waiting after wait_seconds and does the work itself"""
+        client = fake_redis
+        client.set('single_flight:lock:doc', 'crashed-leader')
+        flight = SingleFlight(wait_seconds=0.05, poll_interval=0.01, redis_getter=lambda: client)
+        waits = []
+
+        assert flight.do('doc', lambda: 'mine', on_wait=lambda: waits.append(1)) == ('mine', False)
+        assert waits == [1]
+        assert flight.stats()['takeovers'] == 1
+
+    def test_on_wait_only_for_waiters(self):
+        """Test only callers that wait for a duplicate are notified"""
+        flight = SingleFlight(redis_getter=None)
+        started, release = threading.Event(), threading.Event()
+        waits = []
+
+        def work():
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        thread = threading.Thread(target=lambda: flight.do('doc', work, on_wait=lambda: waits.append('leader')))
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.05, release.set).start()
+        assert flight.do('doc', work, on_wait=lambda: waits.append('waiter')) == ('done', True)
+        thread.join(5)
+        assert waits == ['waiter']
+
+    def test_timings_fit_the_task_time_limit(self):
+        """Test a waiter can still take over before the pipeline task's soft time limit"""
+        import single_flight
+        import tasks
+        assert tasks.celery.conf.task_soft_time_limit == single_flight.TASK_SOFT_TIME_LIMIT == 240
+        assert single_flight.pipeline_flight.lock_seconds < single_flight.TASK_SOFT_TIME_LIMIT
+        assert single_flight.pipeline_flight.wait_seconds <= single_flight.TASK_SOFT_TIME_LIMIT // 2
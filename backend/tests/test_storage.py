@@ -0,0 +1,69 @@
+import os
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from storage import _BoundedMember, iter_zip_members, save_stream, sweep_unreferenced
+
+
+def make_zip(members):
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    archive.seek(0)
+    return archive
+
+
+class TestZipMembers:
+    """Test ZIP archive expansion limits"""
+
+    def test_members_streamed(self):
+        """Test files are yielded with their extension; directories and dotfiles skipped"""
+        archive = make_zip({'march/a.pdf': b'%PDF-1.4 a', 'march/.DS_Store': b'x', 'march/': b''})
+        assert [(name, ext, member.read()) for name, ext, member in iter_zip_members(archive)] == [
+            ('a.pdf', 'pdf', b'%PDF-1.4 a')
+        ]
+
+    def test_limits(self):
+        """Test archives over the member count or uncompressed size are rejected up front"""
+        with pytest.raises(ValueError, match='more than 1 files'):
+            list(iter_zip_members(make_zip({'a.pdf': b'a', 'b.pdf': b'b'}), max_members=1))
+        bomb = make_zip({'bomb.pdf': b'\0' * (4 * 1024 * 1024)})
+        assert len(bomb.getvalue()) < 10 * 1024
+        with pytest.raises(ValueError, match='expands to more than'):
+            next(iter_zip_members(bomb, max_total_size=1024 * 1024))
+
+    def test_extracted_bytes_counted(self):
+        """Test the size limit holds while streaming, whatever the headers declared"""
+        budget = {'limit': 10, 'remaining': 10}
+        first, second = _BoundedMember(BytesIO(b'x' * 6), budget), _BoundedMember(BytesIO(b'y' * 6), budget)
+        assert first.read() == b'x' * 6
+        with pytest.raises(ValueError, match='more than 10 bytes'):
+            second.read()
+
+
+class TestSweepUnreferenced:
+    """Test garbage collection of stored documents"""
+
+    def test_removes_old_unreferenced_files(self, tmp_path):
+        """Test only files that are unreferenced and past the grace period go"""
+        referenced, _ = save_stream(BytesIO(b'kept'), str(tmp_path), 'pdf')
+        orphan, _ = save_stream(BytesIO(b'orphan'), str(tmp_path), 'pdf')
+        recent, _ = save_stream(BytesIO(b'recent'), str(tmp_path), 'pdf')
+        leftover = tmp_path / 'upload.part'
+        leftover.write_bytes(b'half')
+        for path in (referenced, orphan, leftover):
+            os.utime(path, (0, 0))
+
+        assert sweep_unreferenced(str(tmp_path), lambda path: path == referenced, grace_seconds=60) == 2
+        assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in (referenced, recent))
+
+    def test_reupload_keeps_file(self, tmp_path):
+        """Test storing the same content again makes an unreferenced file new again"""
+        file_path, _ = save_stream(BytesIO(b'invoice'), str(tmp_path), 'pdf')
+        os.utime(file_path, (0, 0))
+        assert save_stream(BytesIO(b'invoice'), str(tmp_path), 'pdf')[0] == file_path
+        assert sweep_unreferenced(str(tmp_path), lambda path: False, grace_seconds=60) == 0
+        assert os.path.exists(file_path)
@@ -5,6 +5,7 @@ from datetime import datetime
 from app import app
 from models import db, SalesOrderHeader, SalesOrderDetail
 from tasks import extract_text_from_pdf, extract_invoice_data_with_llm, _process_invoice_task_impl
+from settings import Settings
 
 # Set test environment variables
 os.environ['OPENAI_API_KEY'] = 'test-key-for-testing'
@@ -14,7 +15,7 @@ class TestExtractTextFromPDF:
     """Test PDF text extraction"""
     
     @patch('builtins.open', new_callable=mock_open, read_data=b'%PDF-1.4 fake pdf')
-    @patch('tasks.PyPDF2.PdfReader')
+    @patch('pdf_text.PyPDF2.PdfReader')
     def test_extract_text_success(self, mock_pdf_reader, mock_file):
         """Test successful PDF text extraction"""
         mock_page = MagicMock()
@@ -36,8 +37,8 @@ class TestExtractTextFromPDF:
 class TestExtractInvoiceDataWithLLM:
     """Test LLM invoice extraction"""
     
-    @patch('tasks.load_dotenv')
-    @patch('tasks.OpenAI')
+    @patch('settings.load_dotenv')
+    @patch('tasks.LLMExecutor.from_settings')
     @patch('tasks.os.getenv')
     @patch('tasks.os.environ.get')
     def test_extract_data_success(self, mock_environ_get, mock_getenv, mock_openai_class, mock_load_dotenv):
@@ -66,8 +67,8 @@ class TestExtractInvoiceDataWithLLM:
         finally:
             tasks.openai_client = original_client
     
-    @patch('tasks.load_dotenv')
-    @patch('tasks.OpenAI')
+    @patch('settings.load_dotenv')
+    @patch('tasks.LLMExecutor.from_settings')
     @patch('tasks.os.getenv')
     @patch('tasks.os.environ.get')
     def test_extract_data_with_markdown(self, mock_environ_get, mock_getenv, mock_openai_class, mock_load_dotenv):
@@ -95,7 +96,7 @@ class TestExtractInvoiceDataWithLLM:
         finally:
             tasks.openai_client = original_client
     
-    @patch('tasks.load_dotenv')
+    @patch('settings.load_dotenv')
     @patch('tasks.os.getenv')
     @patch('tasks.os.environ.get')
     def test_extract_data_no_api_key(self, mock_environ_get, mock_getenv, mock_load_dotenv):
@@ -110,13 +111,14 @@ class TestExtractInvoiceDataWithLLM:
         tasks.openai_client = None
         
         try:
-            with pytest.raises(ValueError, match="OpenAI API key not configured"):
+            with patch('tasks.get_settings', return_value=Settings(openai_api_key='')), \
+                    pytest.raises(ValueError, match="OpenAI API key not configured"):
                 extract_invoice_data_with_llm("Invoice text")
         finally:
             tasks.openai_client = original_client
     
-    @patch('tasks.load_dotenv')
-    @patch('tasks.OpenAI')
+    @patch('settings.load_dotenv')
+    @patch('tasks.LLMExecutor.from_settings')
     @patch('tasks.os.getenv')
     @patch('tasks.os.environ.get')
     def test_extract_data_invalid_json(self, mock_environ_get, mock_getenv, mock_openai_class, mock_load_dotenv):
@@ -144,6 +146,28 @@ class TestExtractInvoiceDataWithLLM:
         finally:
             tasks.openai_client = original_client
 
+    @patch('settings.load_dotenv')
+    def test_extract_data_served_from_cache(self, mock_load_dotenv):
+        """Test that identical documents only call the LLM once"""
+        import tasks
+
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = '{"invoice_number": "INV-9", "line_items": []}'
+        mock_client.chat.completions.create.return_value = mock_response
+
+        original_client = tasks.openai_client
+        tasks.openai_client = mock_client
+
+        try:
+            first = extract_invoice_data_with_llm("Invoice #INV-9\nTotal: 10.00")
+            second = extract_invoice_data_with_llm("Invoice  #INV-9 Total: 10.00")
+            assert first == second
+            assert mock_client.chat.completions.create.call_count == 1
+            assert tasks.extraction_cache.stats()['hits'] == 1
+        finally:
+            tasks.openai_client = original_client
+
 
 class TestProcessInvoiceTask:
     """Test Celery task for processing invoices"""
@@ -202,7 +226,34 @@ class TestProcessInvoiceTask:
             assert updated_order.processing_status == 'completed'
             assert updated_order.customer_name == 'Test Customer'
             assert len(updated_order.line_items) == 1
+            assert updated_order.extraction_method == 'llm'
     
+    @patch('tasks.extract_text_from_pdf')
+    @patch('tasks.extract_invoice_data_with_llm')
+    def test_process_invoice_rule_fast_path(self, mock_llm, mock_pdf, client):
+        """Test well-formed invoices skip the LLM and record the path taken"""
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-RULES', processing_status='pending')
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.id
+
+            mock_pdf.return_value = (
+                "Invoice Number: INV-42\nDate: 2024-01-15\nBill To:\nAcme\n"
+                "Code Product Qty Price Total\nSRV-1 Consulting 2 $100.00 $200.00\n"
+                "Subtotal: $200.00\nTax: $20.00\nTotal: $220.00\n"
+            )
+            _process_invoice_task_impl(MagicMock(), order_id, '/fake/path.pdf')
+
+            mock_llm.assert_not_called()
+            db.session.expire_all()
+            updated_order = db.session.get(SalesOrderHeader, order_id)
+            assert updated_order.extraction_method == 'rules'
+            assert updated_order.extraction_confidence == 1.0
+            assert updated_order.invoice_number == 'INV-42'
+            assert float(updated_order.total) == 220.0
+            assert len(updated_order.line_items) == 1
+
     @patch('tasks.extract_text_from_pdf')
     @patch('tasks.openai_client')
     def test_process_invoice_extraction_error(self, mock_openai, mock_pdf, client):
@@ -276,3 +327,179 @@ class TestProcessInvoiceTask:
             with pytest.raises(ValueError, match="Order.*not found"):
                 _process_invoice_task_impl(mock_self, 99999, '/fake/path.pdf')
 
+
+
+class TestInvoicePipeline:
+    """Test the parse -> extract -> persist task chain"""
+
+    @patch('tasks.extract_text_from_pdf')
+    @patch('tasks.extract_invoice_data_with_llm')
+    def test_stages_pass_small_payloads(self, mock_llm, mock_pdf, client):
+        """Test each stage hands the next one a JSON payload and the last saves the order"""
+        import json
+        import tasks
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-STAGES', processing_status='pending')
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.id
+
+            mock_pdf.return_value = "Invoice text content"
+            mock_llm.return_value = {'customer_name': 'Staged Customer', 'total': 50.0, 'line_items': []}
+
+            parsed = tasks._parse_document_impl(order_id, '/fake/path.pdf')
+            assert parsed['order_id'] == order_id
+            assert 'text_ref' in parsed
+            assert db.session.get(SalesOrderHeader, order_id).processing_status == 'processing'
+
+            extracted = tasks._extract_fields_impl(json.loads(json.dumps(parsed)))
+            assert extracted['extraction_method'] == 'llm'
+            assert db.session.get(SalesOrderHeader, order_id).processing_status == 'processing'
+
+            result = tasks._persist_order_impl(json.loads(json.dumps(extracted)))
+            assert result['status'] == 'success'
+            db.session.expire_all()
+            updated_order = db.session.get(SalesOrderHeader, order_id)
+            assert updated_order.processing_status == 'completed'
+            assert updated_order.customer_name == 'Staged Customer'
+
+    def test_expired_text_fails_order(self, client):
+        """Test a missing text reference marks the order failed"""
+        import tasks
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-EXPIRED', processing_status='processing')
+            db.session.add(order)
+            db.session.commit()
+
+            with patch('tasks.get_text', return_value=None):
+                with pytest.raises(ValueError, match="expired"):
+                    tasks._extract_fields_impl({'order_id': order.id, 'text_ref': {'key': 'doc_text:gone'}})
+            db.session.expire_all()
+            assert db.session.get(SalesOrderHeader, order.id).processing_status == 'failed'
+
+    @patch('tasks.extract_text_from_pdf')
+    @patch('tasks.extract_invoice_data_with_llm')
+    def test_duplicate_uploads_share_stored_text(self, mock_llm, mock_pdf, client, fake_redis):
+        """Test a second same-hash order extracts after the first without the shared result"""
+        import tasks
+        store = fake_redis
+        mock_pdf.return_value = "Invoice text content"
+        mock_llm.return_value = {'customer_name': 'Twin Customer', 'total': 10.0, 'line_items': []}
+        with app.app_context(), patch('text_refs.get_redis', return_value=store):
+            orders = [SalesOrderHeader(order_number=f'ORD-TWIN-{i}', processing_status='pending',
+                                       content_hash='f' * 64, file_path='/fake/twin.pdf') for i in range(2)]
+            db.session.add_all(orders)
+            db.session.commit()
+
+            parsed = [tasks._parse_document_impl(order.id, '/fake/twin.pdf') for order in orders]
+            assert parsed[0]['text_ref'] == parsed[1]['text_ref'] == {'key': f"doc_text:content:{'f' * 64}"}
+
+            # No shared single-flight result: each extraction runs on its own
+            for stage in parsed:
+                tasks._extract_fields_impl(stage)
+            assert mock_llm.call_count == 2
+            assert mock_pdf.call_count == 2  # Parsed once each, never re-read for extraction
+            assert store.exists(parsed[0]['text_ref']['key'])
+
+            # Once the stored text expires too, the document is read again
+            store.flushall()
+            extracted = tasks._extract_fields_impl(parsed[1])
+            assert extracted['data']['customer_name'] == 'Twin Customer'
+            assert mock_pdf.call_count == 3
+            db.session.expire_all()
+            assert db.session.get(SalesOrderHeader, orders[1].id).processing_status == 'processing'
+
+    def test_waiting_duplicate_reports_extracting(self, client):
+        """Test an order waiting on a duplicate's extraction still reports the stage"""
+        import tasks
+        shared = {'data': {'total': 5.0}, 'extraction_method': 'llm', 'extraction_confidence': 0.9}
+
+        def wait_for_leader(key, fn, on_wait=None):
+            on_wait()
+            return shared, True
+
+        with app.app_context(), patch('tasks.pipeline_flight.do', side_effect=wait_for_leader), \
+                patch('tasks.publish_progress') as mock_publish:
+            result = tasks._extract_fields_impl({'order_id': 7, 'batch_id': 'b-1', 'content_hash': 'a' * 64,
+                                                 'text_ref': {'key': 'doc_text:content:aaa'}})
+        assert result['data'] == shared['data']
+        mock_publish.assert_called_once_with(7, 'extracting', batch_id='b-1')
+
+    def test_stages_routed_to_own_queues(self):
+        """Test each stage is routed to its own queue"""
+        import tasks
+        pipeline = tasks.invoice_pipeline(1, '/fake/path.pdf')
+        assert [task.task for task in pipeline.tasks] == ['parse_document', 'extract_fields', 'persist_order']
+
+        router = tasks.celery.amqp.router
+        assert router.route({}, 'parse_document')['queue'].name == tasks.PARSE_QUEUE
+        assert router.route({}, 'extract_fields')['queue'].name == tasks.EXTRACT_QUEUE
+        assert router.route({}, 'persist_order')['queue'].name == tasks.PERSIST_QUEUE
+
+    def test_progress_recorded_on_tracked_task(self):
+        """Test stage progress is stored as PROGRESS on the chain's last task"""
+        import tasks
+        task = MagicMock()
+        task.request.called_directly = False
+        task.request.id = 'parse-id'
+        task.request.chain = [{'task': 'persist_order', 'options': {'task_id': 'persist-id'}},
+                              {'task': 'extract_fields', 'options': {'task_id': 'extract-id'}}]
+        with patch('tasks.current_task', task):
+            tasks._report_progress(7, None, 'parsing', pages=3)
+            tasks._report_progress(7, None, 'completed')
+
+        task.update_state.assert_called_once()
+        kwargs = task.update_state.call_args.kwargs
+        assert kwargs['task_id'] == 'persist-id'
+        assert kwargs['state'] == 'PROGRESS'
+        assert kwargs['meta']['stage'] == 'parsing'
+        assert kwargs['meta']['pages'] == 3
+
+    @patch('tasks.extract_text_from_pdf')
+    @patch('tasks.extract_invoice_data_with_llm')
+    def test_persist_replaces_many_line_items(self, mock_llm, mock_pdf, client):
+        """Test large invoices are written in one bulk insert, replacing earlier lines"""
+        import tasks
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-BULK', processing_status='processing')
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(SalesOrderDetail(order_id=order.id, line_number=1, product_name='Stale'))
+            db.session.commit()
+            order_id = order.id
+
+            items = [{'line_number': n, 'product_name': f'Item {n}', 'quantity': 1, 'unit_price': n,
+                      'line_total': n} for n in range(1, 301)]
+            extracted = {'order_id': order_id, 'data': {'total': 45150, 'line_items': items},
+                         'extraction_method': 'llm', 'extraction_confidence': None}
+            with patch('tasks.insert_line_items', wraps=tasks.insert_line_items) as mock_insert:
+                tasks._persist_order_impl(extracted)
+            assert mock_insert.call_count == 1
+
+            db.session.expire_all()
+            updated_order = db.session.get(SalesOrderHeader, order_id)
+            assert updated_order.processing_status == 'completed'
+            lines = sorted(updated_order.line_items, key=lambda line: line.line_number)
+            assert len(lines) == 300
+            assert lines[0].product_name == 'Item 1'
+            assert float(lines[-1].line_total) == 300.0
+            assert all(float(line.discount) == 0 for line in lines)
+
+    def test_persist_indexes_order_for_search(self, client):
+        """Test the persist stage refreshes the order's search document"""
+        import tasks
+        from search import search_order_ids
+        with app.app_context():
+            order = SalesOrderHeader(order_number='ORD-SEARCH', processing_status='processing')
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.id
+
+            extracted = {'order_id': order_id,
+                         'data': {'customer_name': 'Vandelay Industries',
+                                  'line_items': [{'line_number': 1, 'product_name': 'Latex gloves'}]},
+                         'extraction_method': 'rules', 'extraction_confidence': 0.95}
+            tasks._persist_order_impl(extracted)
+
+            assert search_order_ids(db.session, 'vandelay')[0][0][0] == order_id
+            assert search_order_ids(db.session, 'latex')[0][0][0] == order_id
@@ -0,0 +1,127 @@
+import json
+import pytest
+from unittest.mock import patch
+from app import app
+from models import db, SalesOrderHeader, VendorTemplate
+from vendor_templates import apply_template, build_template, layout_fingerprint, template_store
+
+
+def make_invoice(ref, day, customer, items, vat):
+    """A layout the rule-based extractor can't read: 4 stacked columns, custom labels"""
+    rows = "".join(f"{name}\n{qty}\n{price:.2f} EUR\n{qty * price:.2f} EUR\n" for name, qty, price in items)
+    net = sum(qty * price for _, qty, price in items)
+    return (
+        f"ACME SUPPLIES GMBH\nInv Ref: {ref}\nIssued: {day}\nCustomer:\n{customer}\n"
+        f"Description\nQty\nUnit\nAmount\nPositions:\n{rows}"
+        f"Net: {net:.2f} EUR\nVAT: {vat:.2f} EUR\nAmount Payable: {net + vat:.2f} EUR\n"
+    )
+
+
+FIRST = make_invoice('A-1', '05.03.2024', 'Globex', [('Bolts', 10, 1.5), ('Nuts', 4, 0.25)], 3.04)
+SECOND = make_invoice('A-2', '06.03.2024', 'Initech', [('Screws', 3, 2.0), ('Washers', 2, 1.0), ('Glue', 1, 4.5)], 2.38)
+FIRST_EXTRACTION = {
+    'invoice_number': 'A-1', 'invoice_date': '2024-03-05', 'customer_name': 'Globex',
+    'subtotal': 16.0, 'tax': 3.04, 'total': 19.04, 'currency': 'EUR',
+    'line_items': [
+        {'line_number': 1, 'product_name': 'Bolts', 'quantity': 10, 'unit_price': 1.5, 'line_total': 15.0},
+        {'line_number': 2, 'product_name': 'Nuts', 'quantity': 4, 'unit_price': 0.25, 'line_total': 1.0},
+    ],
+}
+
+
+class TestTemplateLearning:
+    """Test learning and applying layout templates"""
+
+    def test_fingerprint_ignores_values(self):
+        """Test invoices from the same layout share a fingerprint"""
+        assert layout_fingerprint(FIRST) == layout_fingerprint(SECOND)
+        assert layout_fingerprint(FIRST.replace('Issued:', 'Date:')) != layout_fingerprint(FIRST)
+        assert layout_fingerprint("Total: 5") is None
+
+    def test_learned_template_reads_next_invoice(self):
+        """Test positions learned from one invoice extract another"""
+        template = build_template(FIRST, FIRST_EXTRACTION)
+        assert template['line_items']['mode'] == 'stacked'
+
+        data = apply_template(template, SECOND)
+        assert data['invoice_number'] == 'A-2'
+        assert data['invoice_date'] == '2024-03-06'
+        assert data['customer_name'] == 'Initech'
+        assert data['currency'] == 'EUR'
+        assert data['total'] == 14.88
+        assert [item['product_name'] for item in data['line_items']] == ['Screws', 'Washers', 'Glue']
+
+    def test_unreproducible_extraction_not_learned(self):
+        """Test no template is learned when the values can't be located"""
+        assert build_template(FIRST, dict(FIRST_EXTRACTION, total=123.45)) is None
+
+
+class TestTemplateStore:
+    """Test the template table, hit-rate counters and invalidation"""
+
+    def test_learn_hit_and_invalidate(self, client):
+        """Test a failing template is deactivated and counted"""
+        fingerprint = layout_fingerprint(FIRST)
+        with app.app_context():
+            assert template_store.extract(fingerprint, FIRST) is None
+            assert template_store.learn(fingerprint, FIRST, FIRST_EXTRACTION)
+            db.session.commit()
+
+            assert template_store.extract(fingerprint, SECOND)['invoice_number'] == 'A-2'
+            broken = SECOND.replace('Amount Payable: 14.88', 'Amount Payable: 99.00')
+            assert template_store.extract(fingerprint, broken) is None
+            db.session.commit()
+
+            row = db.session.get(VendorTemplate, fingerprint)
+            assert (row.is_active, row.hit_count, row.failure_count) == (False, 1, 1)
+
+            # Relearned from the next LLM extraction
+            assert template_store.learn(fingerprint, FIRST, FIRST_EXTRACTION)
+            db.session.commit()
+            assert db.session.get(VendorTemplate, fingerprint).is_active
+
+        stats = json.loads(client.get('/api/metrics/templates').data)
+        assert (stats['hits'], stats['misses'], stats['failures'], stats['learned']) == (1, 1, 1, 2)
+        assert stats['hit_rate'] == pytest.approx(1 / 3, abs=1e-4)
+        assert stats['active_templates'] == 1
+
+    def test_template_endpoints(self, client):
+        """Test listing and manually invalidating templates"""
+        fingerprint = layout_fingerprint(FIRST)
+        with app.app_context():
+            template_store.learn(fingerprint, FIRST, FIRST_EXTRACTION)
+            db.session.commit()
+
+        data = json.loads(client.get('/api/templates').data)
+        assert data['templates'][0]['fingerprint'] == fingerprint
+        assert data['templates'][0]['line_items'] == 'stacked'
+
+        assert client.delete(f'/api/templates/{fingerprint}').status_code == 200
+        assert client.delete('/api/templates/unknown').status_code == 404
+        with app.app_context():
+            assert not db.session.get(VendorTemplate, fingerprint).is_active
+
+    @patch('tasks.extract_text_from_pdf')
+    @patch('tasks.extract_invoice_data_with_llm')
+    def test_repeat_vendor_skips_llm(self, mock_llm, mock_pdf, client):
+        """Test the second invoice of a layout is extracted from its template"""
+        from unittest.mock import MagicMock
+        from tasks import _process_invoice_task_impl
+        mock_llm.return_value = FIRST_EXTRACTION
+        with app.app_context():
+            orders = [SalesOrderHeader(order_number=f'ORD-TPL-{n}') for n in (1, 2)]
+            db.session.add_all(orders)
+            db.session.commit()
+            order_ids = [order.id for order in orders]
+
+            for order_id, text in zip(order_ids, (FIRST, SECOND)):
+                mock_pdf.return_value = text
+                _process_invoice_task_impl(MagicMock(), order_id, '/fake/path.pdf')
+
+            assert mock_llm.call_count == 1
+            db.session.expire_all()
+            first, second = (db.session.get(SalesOrderHeader, order_id) for order_id in order_ids)
+            assert first.extraction_method == 'llm'
+            assert second.extraction_method == 'template'
+            assert second.invoice_number == 'A-2'
+            assert len(second.line_items) == 3
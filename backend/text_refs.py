@@ -0,0 +1,55 @@
+"""
+Document text handed between pipeline stages.
+
+The parse stage can produce hundreds of kilobytes of text, which should not
+travel through the broker as a task argument. With Redis the text is stored
+compressed under a per-document key with a TTL and only the key is passed
+on; without Redis (e.g. the in-memory broker used by the test suite)
+the reference carries the text inline.
+"""
+import os
+import zlib
+
+import redis
+
+from redis_client import get_redis
+
+TEXT_REF_TTL_SECONDS = int(os.getenv('TEXT_REF_TTL_SECONDS', str(24 * 3600)))
+KEY_PREFIX = 'doc_text:'
+
+
+def put_text(name, text, ttl=None):
+    """Store ``text`` under ``name`` for a later stage; returns a small JSON-serializable reference"""
+    client = get_redis()
+    if client is not None:
+        key = KEY_PREFIX + name
+        try:
+            client.set(key, zlib.compress(text.encode('utf-8'), 1), ex=ttl or TEXT_REF_TTL_SECONDS)
+            return {'key': key}
+        except redis.RedisError as e:
+            print(f"Warning: could not store document text in Redis, passing it inline: {e}")
+    return {'text': text}
+
+
+def get_text(ref):
+    """Resolve a reference from put_text; None if the stored text expired"""
+    if 'text' in ref:
+        return ref['text']
+    client = get_redis()
+    if client is None:
+        return None
+    payload = client.get(ref['key'])
+    return zlib.decompress(payload).decode('utf-8') if payload is not None else None
+
+
+def delete_text(ref):
+    """Drop stored text once no stage needs it any more"""
+    if 'key' not in ref:
+        return
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(ref['key'])
+    except redis.RedisError as e:
+        print(f"Warning: could not delete document text {ref['key']}: {e}")
@@ -0,0 +1,404 @@
+"""
+Vendor layout templates learned from LLM extractions.
+
+Repeat suppliers send invoices whose layout never changes, so the sequence of
+labels in the extracted text ("Invoice Number:", "Bill To:", "Total:", ...)
+identifies the layout. After a successful LLM extraction the positions of the
+extracted values (label, occurrence, line offset) and of the line item table
+are recorded as a template keyed by that fingerprint. The next document with
+the same fingerprint is read straight from those positions.
+
+Applied templates are validated: every learned field must be found, and the
+arithmetic checks that held when the template was learned must still hold.
+A template that fails validation is deactivated (and relearned from the next
+LLM extraction). Hit/miss counters are kept per process and, when Redis is
+available, across all workers; per-template counts live in the table.
+"""
+import hashlib
+import re
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import redis
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, VendorTemplate
+from redis_client import get_redis
+from rule_extractor import (
+    TOLERANCE, consistency_checks, parse_amount, parse_date, parse_line_items, split_lines
+)
+
+TEMPLATE_VERSION = 1
+MIN_LABELS = 3  # Fewer labels are too generic to identify a layout
+MAX_VALUE_OFFSET = 4  # Lines searched below a label for its value
+MAX_ROW_WIDTH = 8  # Lines per line item in one-cell-per-line tables
+
+HEADER_FIELDS = (
+    'order_number', 'invoice_number', 'invoice_date', 'due_date', 'customer_name',
+    'customer_address', 'customer_email', 'customer_phone', 'subtotal', 'tax', 'total'
+)
+AMOUNT_FIELDS = {'subtotal', 'tax', 'total', 'quantity', 'unit_price', 'discount', 'line_total'}
+DATE_FIELDS = {'invoice_date', 'due_date'}
+ITEM_FIELDS = ('product_code', 'product_name', 'description', 'quantity', 'unit_price', 'discount', 'line_total')
+
+_LABEL_RE = re.compile(r"^([A-Za-z][A-Za-z .#/&()'-]{0,40}?)\s*:\s*(.*)$")
+_WHITESPACE_RE = re.compile(r'\s+')
+_STOP = object()
+
+
+def _normalize(value):
+    return _WHITESPACE_RE.sub(' ', str(value)).strip().lower()
+
+
+class _Layout:
+    """Lines of a document and the labelled lines among them"""
+
+    def __init__(self, text):
+        self.lines = split_lines(text or '')
+        self.labels = []  # (line index, label, inline value)
+        for index, line in enumerate(self.lines):
+            match = _LABEL_RE.match(line)
+            if match:
+                self.labels.append((index, _normalize(match.group(1)), match.group(2).strip()))
+        self.label_lines = {index for index, _, _ in self.labels}
+
+        # (label, occurrence) -> (line index, inline value)
+        self.anchors = {}
+        seen = {}
+        for index, label, inline in self.labels:
+            occurrence = seen.get(label, 0)
+            seen[label] = occurrence + 1
+            self.anchors[(label, occurrence)] = (index, inline)
+
+    def fingerprint(self):
+        if len(self.labels) < MIN_LABELS:
+            return None
+        return hashlib.sha256("\n".join(label for _, label, _ in self.labels).encode('utf-8')).hexdigest()
+
+    def value_at(self, label, occurrence, offset):
+        """Inline value (offset 0) or the line ``offset`` lines below a label"""
+        anchor = self.anchors.get((label, occurrence))
+        if anchor is None:
+            return _STOP
+        index, inline = anchor
+        if offset == 0:
+            return inline
+        line_index = index + offset
+        if line_index >= len(self.lines) or line_index in self.label_lines:
+            return _STOP
+        return self.lines[line_index]
+
+    def preceding_anchor(self, line_index):
+        """(label, occurrence, offset) of the closest label above a line"""
+        best = None
+        for (label, occurrence), (index, _) in self.anchors.items():
+            if index < line_index and (best is None or index > best[2]):
+                best = (label, occurrence, index)
+        if best is None:
+            return None
+        return [best[0], best[1], line_index - best[2]]
+
+
+def layout_fingerprint(text):
+    """SHA-256 of the document's label sequence, or None if it has too few labels"""
+    return _Layout(text).fingerprint()
+
+
+def _convert(field, raw):
+    if raw is _STOP or raw in (None, ''):
+        return None
+    if field in AMOUNT_FIELDS:
+        amount = parse_amount(raw)
+        return float(amount) if amount is not None else None
+    if field in DATE_FIELDS:
+        return parse_date(raw)
+    return raw
+
+
+def _matches(field, raw, value):
+    if raw is _STOP or raw in (None, '') or value in (None, ''):
+        return False
+    if field in AMOUNT_FIELDS:
+        amount = parse_amount(raw)
+        return amount is not None and abs(amount - Decimal(str(value))) <= TOLERANCE
+    if field in DATE_FIELDS:
+        return parse_date(raw) == value
+    return _normalize(raw) == _normalize(value)
+
+
+def _learn_fields(layout, data):
+    positions = {}
+    for field in HEADER_FIELDS:
+        value = data.get(field)
+        if value in (None, ''):
+            continue
+        for label, occurrence in layout.anchors:
+            for offset in range(MAX_VALUE_OFFSET + 1):
+                raw = layout.value_at(label, occurrence, offset)
+                if raw is _STOP:
+                    break
+                if _matches(field, raw, value):
+                    positions[field] = [label, occurrence, offset]
+                    break
+            if field in positions:
+                break
+    return positions
+
+
+def _match_row(layout, start, item, columns=None):
+    """Map item fields to line offsets within a row starting at ``start``"""
+    if columns is not None:
+        return all(
+            start + offset < len(layout.lines) and start + offset not in layout.label_lines
+            and _matches(field, layout.lines[start + offset], item.get(field))
+            for field, offset in columns.items()
+        )
+    mapped = {}
+    for field in ITEM_FIELDS:
+        for offset in range(MAX_ROW_WIDTH):
+            index = start + offset
+            if index >= len(layout.lines) or index in layout.label_lines:
+                break
+            if offset not in mapped.values() and _matches(field, layout.lines[index], item.get(field)):
+                mapped[field] = offset
+                break
+    return mapped
+
+
+def _learn_stacked_items(layout, items):
+    """Learn a one-cell-per-line table: row anchor, width and column offsets"""
+    first = items[0]
+    for start in range(len(layout.lines)):
+        if start in layout.label_lines:
+            continue
+        columns = _match_row(layout, start, first)
+        if 0 not in columns.values() or 'line_total' not in columns \
+                or not {'product_code', 'product_name', 'description'} & set(columns):
+            continue
+        width = max(columns.values()) + 1
+        if len(items) > 1:
+            width = next((w for w in range(width, MAX_ROW_WIDTH + 1)
+                          if _match_row(layout, start + w, items[1], columns)), None)
+            if width is None:
+                continue
+        anchor = layout.preceding_anchor(start)
+        if anchor is None:
+            continue
+        return {'mode': 'stacked', 'anchor': anchor, 'width': width, 'columns': columns}
+    return None
+
+
+def _apply_items(layout, spec):
+    if not spec:
+        return []
+    if spec['mode'] == 'table':
+        return parse_line_items(layout.lines)
+
+    label, occurrence, offset = spec['anchor']
+    anchor = layout.anchors.get((label, occurrence))
+    if anchor is None:
+        return []
+    items = []
+    start = anchor[0] + offset
+    while start + spec['width'] <= len(layout.lines):
+        row = range(start, start + spec['width'])
+        if any(index in layout.label_lines for index in row):
+            break
+        item = {field: _convert(field, layout.lines[start + column]) for field, column in spec['columns'].items()}
+        if item.get('line_total') is None:
+            break
+        item['line_number'] = len(items) + 1
+        item.setdefault('discount', 0)
+        items.append(item)
+        start += spec['width']
+    return items
+
+
+def apply_template(template, text):
+    """Read invoice data from ``text`` at the positions recorded in ``template``"""
+    layout = _Layout(text)
+    data = {field: None for field in HEADER_FIELDS}
+    for field, (label, occurrence, offset) in template['fields'].items():
+        data[field] = _convert(field, layout.value_at(label, occurrence, offset))
+    data['currency'] = template.get('currency') or 'USD'
+    data['line_items'] = _apply_items(layout, template.get('line_items'))
+    return data
+
+
+def validate_result(template, data):
+    """True when every learned field was found and the learned checks hold"""
+    if any(data.get(field) in (None, '') for field in template['fields']):
+        return False
+    if template.get('line_items') and not data['line_items']:
+        return False
+    checks = consistency_checks(data)
+    return all(checks.get(name) for name in template.get('checks', []))
+
+
+def _same_items(expected, actual):
+    return len(expected) == len(actual) and all(
+        _matches('line_total', str(a.get('line_total')), e.get('line_total'))
+        for e, a in zip(expected, actual)
+    )
+
+
+def build_template(text, data):
+    """Learn a template from an extraction, or None if it can't reproduce it"""
+    layout = _Layout(text)
+    if layout.fingerprint() is None:
+        return None
+    fields = _learn_fields(layout, data)
+    if 'total' not in fields:
+        return None
+
+    items = data.get('line_items') or []
+    items_spec = None
+    if items:
+        items_spec = _learn_stacked_items(layout, items)
+        if items_spec is None or not _same_items(items, _apply_items(layout, items_spec)):
+            items_spec = {'mode': 'table'}
+            if not _same_items(items, _apply_items(layout, items_spec)):
+                return None
+
+    template = {
+        'version': TEMPLATE_VERSION,
+        'labels': [label for _, label, _ in layout.labels],
+        'fields': fields,
+        'line_items': items_spec,
+        'currency': data.get('currency') or 'USD',
+        'checks': [name for name, passed in consistency_checks(data).items() if passed],
+    }
+    # The template must reproduce the extraction it was learned from
+    if not validate_result(template, apply_template(template, text)):
+        return None
+    return template
+
+
+class TemplateStore:
+    """Vendor templates in the database, with hit-rate counters"""
+
+    def __init__(self, namespace='vendor_templates', redis_getter=get_redis):
+        self.namespace = namespace
+        self._redis_getter = redis_getter
+        self._lock = threading.Lock()
+        self._counters = self._empty_counters()
+
+    @staticmethod
+    def _empty_counters():
+        return {'hits': 0, 'misses': 0, 'failures': 0, 'learned': 0}
+
+    @property
+    def _stats_key(self):
+        return f"{self.namespace}:stats"
+
+    def _redis(self):
+        return self._redis_getter() if self._redis_getter else None
+
+    def _record(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            client.hincrby(self._stats_key, counter, 1)
+        except redis.RedisError as e:
+            print(f"Warning: could not update template stats in Redis: {e}")
+
+    def extract(self, fingerprint, text):
+        """Apply the active template for ``fingerprint``; None on miss or failed validation"""
+        row = db.session.get(VendorTemplate, fingerprint)
+        if row is None or not row.is_active or row.template.get('version') != TEMPLATE_VERSION:
+            self._record('misses')
+            return None
+
+        data = apply_template(row.template, text)
+        now = datetime.utcnow()
+        if not validate_result(row.template, data):
+            print(f"Vendor template {fingerprint[:12]} failed validation, deactivating it")
+            db.session.execute(
+                update(VendorTemplate).where(VendorTemplate.fingerprint == fingerprint)
+                .values(is_active=False, failure_count=VendorTemplate.failure_count + 1, updated_at=now)
+            )
+            self._record('failures')
+            return None
+
+        db.session.execute(
+            update(VendorTemplate).where(VendorTemplate.fingerprint == fingerprint)
+            .values(hit_count=VendorTemplate.hit_count + 1, last_used_at=now)
+        )
+        self._record('hits')
+        return data
+
+    def learn(self, fingerprint, text, data):
+        """Learn (or relearn) the template for a layout from an LLM extraction"""
+        template = build_template(text, data)
+        if template is None:
+            return False
+
+        row = db.session.get(VendorTemplate, fingerprint)
+        if row is not None:
+            if row.is_active:
+                return False
+            row.template = template
+            row.is_active = True
+            row.updated_at = datetime.utcnow()
+        else:
+            try:
+                # Savepoint: another worker may learn the same layout concurrently
+                with db.session.begin_nested():
+                    db.session.add(VendorTemplate(fingerprint=fingerprint, template=template))
+            except IntegrityError:
+                return False
+        self._record('learned')
+        return True
+
+    def invalidate(self, fingerprint):
+        """Deactivate a template so the next document goes to the LLM"""
+        result = db.session.execute(
+            update(VendorTemplate).where(VendorTemplate.fingerprint == fingerprint)
+            .values(is_active=False, updated_at=datetime.utcnow())
+        )
+        return result.rowcount > 0
+
+    def stats(self):
+        """Lookup counters (cluster-wide when Redis is available) and table totals"""
+        with self._lock:
+            counters = dict(self._counters)
+        scope = 'process'
+
+        client = self._redis()
+        if client is not None:
+            try:
+                shared = client.hgetall(self._stats_key)
+                counters = self._empty_counters()
+                for name, value in shared.items():
+                    name = name.decode('utf-8') if isinstance(name, bytes) else name
+                    if name in counters:
+                        counters[name] = int(value)
+                scope = 'cluster'
+            except redis.RedisError as e:
+                print(f"Warning: could not read template stats from Redis: {e}")
+
+        lookups = counters['hits'] + counters['misses'] + counters['failures']
+        total, active = db.session.execute(
+            db.select(func.count(), func.coalesce(func.sum(db.case((VendorTemplate.is_active, 1), else_=0)), 0))
+            .select_from(VendorTemplate)
+        ).one()
+        return dict(
+            counters,
+            scope=scope,
+            hit_rate=round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            templates=total,
+            active_templates=int(active),
+        )
+
+    def clear_stats(self):
+        """Reset the in-process counters"""
+        with self._lock:
+            self._counters = self._empty_counters()
+
+
+template_store = TemplateStore()
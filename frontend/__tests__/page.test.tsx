@@ -1,4 +1,4 @@
-import { render, screen, waitFor } from "@testing-library/react";
+import { render, screen, waitFor, fireEvent } from "@testing-library/react";
 import { jest } from "@jest/globals";
 import axios from "axios";
 import Home from "../app/page";
@@ -92,6 +92,34 @@ describe("Home Page", () => {
     });
   });
 
+  it("loads the next page of orders from next_cursor", async () => {
+    mockedAxios.get
+      .mockResolvedValueOnce({
+        data: { status: "healthy", service: "invoice-extractor-api" },
+      })
+      .mockResolvedValueOnce({
+        data: { orders: [], count: 0, next_cursor: "abc", has_more: true },
+      })
+      .mockResolvedValueOnce({
+        data: { total_orders: 0, total_value: 0, average_order_value: 0 },
+      })
+      .mockResolvedValueOnce({
+        data: { orders: [], count: 0, next_cursor: null, has_more: false },
+      });
+
+    render(<Home />);
+
+    const loadMore = await screen.findByText("Load more orders");
+    fireEvent.click(loadMore);
+
+    await waitFor(() => {
+      expect(mockedAxios.get).toHaveBeenCalledWith(
+        expect.stringContaining("/api/orders?cursor=abc")
+      );
+      expect(screen.queryByText("Load more orders")).not.toBeInTheDocument();
+    });
+  });
+
   it("displays upload area", async () => {
     mockedAxios.get
       .mockResolvedValueOnce({
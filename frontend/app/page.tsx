@@ -26,6 +26,7 @@ interface Order {
   status: string;
   processing_status: string | null;
   error_message: string | null;
+  version: number;
   created_at: string;
   updated_at: string;
   line_items: LineItem[];
@@ -52,6 +53,10 @@ export default function Home() {
   const [error, setError] = useState<string | null>(null);
   const [success, setSuccess] = useState<string | null>(null);
   const [stats, setStats] = useState<any>(null);
+  const [progress, setProgress] = useState<string | null>(null);
+  // The API returns orders a page at a time; next_cursor fetches the next one
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchOrders = useCallback(async () => {
     try {
@@ -59,6 +64,7 @@ export default function Home() {
       setError(null);
       const response = await axios.get(`${API_URL}/api/orders`);
       setOrders(response.data.orders);
+      setNextCursor(response.data.has_more ? response.data.next_cursor : null);
     } catch (err: any) {
       const errorMsg =
         err.response?.data?.error || err.message || "Failed to fetch orders";
@@ -71,6 +77,22 @@ export default function Home() {
     }
   }, []);
 
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const response = await axios.get(
+        `${API_URL}/api/orders?cursor=${encodeURIComponent(nextCursor)}`
+      );
+      setOrders((current) => [...current, ...response.data.orders]);
+      setNextCursor(response.data.has_more ? response.data.next_cursor : null);
+    } catch (err: any) {
+      setError(err.response?.data?.error || "Failed to fetch more orders");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchStats = useCallback(async () => {
     try {
       const response = await axios.get(`${API_URL}/api/stats`);
@@ -126,9 +148,9 @@ export default function Home() {
         await fetchStats();
         setSelectedOrder(response.data.order);
 
-        // Poll for task status if task_id is provided
+        // Follow processing progress if a task was queued
         if (response.data.task_id) {
-          pollTaskStatus(response.data.task_id, response.data.order_id);
+          watchOrderProgress(response.data.task_id, response.data.order_id);
         }
 
         // Clear success message after 5 seconds
@@ -154,17 +176,87 @@ export default function Home() {
 
   const handleOrderUpdate = async (updatedOrder: Order) => {
     try {
-      await axios.put(`${API_URL}/api/orders/${updatedOrder.id}`, updatedOrder);
+      // `version` makes the server reject the save if someone else changed the order
+      const response = await axios.put(
+        `${API_URL}/api/orders/${updatedOrder.id}`,
+        updatedOrder
+      );
       setSuccess("Order updated successfully!");
       await fetchOrders();
       await fetchStats();
-      setSelectedOrder(updatedOrder);
+      setSelectedOrder(response.data.order);
       setTimeout(() => setSuccess(null), 5000);
     } catch (err: any) {
       setError(err.response?.data?.error || "Failed to update order");
+      if (err.response?.status === 409) {
+        // Show the current version so the edit can be redone on top of it
+        const current = await axios.get(`${API_URL}/api/orders/${updatedOrder.id}`);
+        setSelectedOrder(current.data);
+        await fetchOrders();
+      }
     }
   };
 
+  const handleProcessingDone = async (
+    orderId: number,
+    failed: boolean,
+    fallbackError?: string
+  ) => {
+    await fetchOrders();
+    await fetchStats();
+    if (!failed) {
+      setSuccess("Invoice processed successfully!");
+      // Update selected order if it's the one being processed
+      if (selectedOrder?.id === orderId) {
+        // The order may not be on the first page of the list
+        const updatedOrder = await axios.get(`${API_URL}/api/orders/${orderId}`);
+        setSelectedOrder(updatedOrder.data);
+      }
+      setTimeout(() => setSuccess(null), 5000);
+      return;
+    }
+    // Get the order to show error message
+    const orderResponse = await axios.get(`${API_URL}/api/orders/${orderId}`);
+    const failedOrder = orderResponse.data;
+    if (failedOrder.error_message) {
+      setError(`Processing failed: ${failedOrder.error_message}`);
+    } else {
+      setError(`Processing failed: ${fallbackError || "Unknown error"}`);
+    }
+    if (selectedOrder?.id === orderId) {
+      setSelectedOrder(failedOrder);
+    }
+  };
+
+  // Progress is pushed by the server (Server-Sent Events); polling is only
+  // used by browsers without EventSource
+  const watchOrderProgress = (taskId: string, orderId: number) => {
+    if (typeof window === "undefined" || !("EventSource" in window)) {
+      pollTaskStatus(taskId, orderId);
+      return;
+    }
+    const source = new EventSource(`${API_URL}/api/orders/${orderId}/events`);
+    source.addEventListener("progress", (message) => {
+      const event = JSON.parse((message as MessageEvent).data);
+      if (event.stage === "completed" || event.stage === "failed") {
+        source.close();
+        setProgress(null);
+        handleProcessingDone(orderId, event.stage === "failed", event.error);
+      } else {
+        setProgress(
+          event.pages ? `${event.status} (${event.pages} pages)...` : `${event.status}...`
+        );
+      }
+    });
+    // The server ends streams after a while and the browser reconnects on its
+    // own; if it gives up (e.g. the endpoint errored), fall back to polling
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        pollTaskStatus(taskId, orderId);
+      }
+    };
+  };
+
   const pollTaskStatus = async (
     taskId: string,
     orderId: number,
@@ -177,39 +269,16 @@ export default function Home() {
         const response = await axios.get(`${API_URL}/api/tasks/${taskId}`);
         const taskState = response.data.state;
 
-        if (taskState === "SUCCESS") {
-          clearInterval(pollInterval);
-          setSuccess("Invoice processed successfully!");
-          await fetchOrders();
-          await fetchStats();
-          // Update selected order if it's the one being processed
-          if (selectedOrder?.id === orderId) {
-            const updatedOrders = await axios.get(`${API_URL}/api/orders`);
-            const updatedOrder = updatedOrders.data.orders.find(
-              (o: Order) => o.id === orderId
-            );
-            if (updatedOrder) setSelectedOrder(updatedOrder);
-          }
-          setTimeout(() => setSuccess(null), 5000);
-        } else if (taskState === "FAILURE") {
+        if (taskState === "SUCCESS" || taskState === "FAILURE") {
           clearInterval(pollInterval);
-          await fetchOrders();
-          await fetchStats();
-          // Get the order to show error message
-          const orderResponse = await axios.get(
-            `${API_URL}/api/orders/${orderId}`
+          setProgress(null);
+          await handleProcessingDone(
+            orderId,
+            taskState === "FAILURE",
+            response.data.error
           );
-          const failedOrder = orderResponse.data;
-          if (failedOrder.error_message) {
-            setError(`Processing failed: ${failedOrder.error_message}`);
-          } else {
-            setError(
-              `Processing failed: ${response.data.error || "Unknown error"}`
-            );
-          }
-          if (selectedOrder?.id === orderId) {
-            setSelectedOrder(failedOrder);
-          }
+        } else if (taskState === "PROGRESS") {
+          setProgress(`${response.data.status}...`);
         } else if (attempts >= maxAttempts) {
           clearInterval(pollInterval);
           setError(
@@ -292,6 +361,9 @@ export default function Home() {
               </>
             )}
           </div>
+          {progress && (
+            <p style={{ marginTop: "1rem", color: "#666" }}>{progress}</p>
+          )}
         </div>
 
         {loading ? (
@@ -307,6 +379,18 @@ export default function Home() {
               onDeleteOrder={handleOrderDelete}
             />
 
+            {nextCursor && (
+              <div style={{ textAlign: "center", marginBottom: "1rem" }}>
+                <button
+                  className="btn btn-primary"
+                  onClick={loadMoreOrders}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? "Loading..." : "Load more orders"}
+                </button>
+              </div>
+            )}
+
             {selectedOrder && (
               <OrderDetail
                 order={selectedOrder}